@@ -0,0 +1,393 @@
+"""
+This script runs the batch experiments: every dataset of the filename lists (data/SRS/*.csv)
+with every strategy parameter and parameter set, as python main.py <dataset> <strategy> -k
+<parameter set> would. The jobs run in warm worker processes that import everything once.
+Each worker loads a dataset once and compiles it once for all its configurations, and keeps
+its connection to the database for all datasets that are not in the local store. The parent
+process is the only one writing results: one CSV row per job and, for parameter sets with
+--log-db, the row of log_execution_data.
+
+A job that runs longer than the timeout is stopped by killing its worker, which is then
+replaced; the other jobs and workers are not affected. This takes the place of the
+process-wide signal.alarm of main.py.
+
+    python batch_run.py data/SRS/sig3_5_15.csv --strategies 3 --jobs 4 --timeout 1800
+"""
+
+import argparse
+import csv
+import logging
+import os
+import resource
+import shlex
+import sys
+import time
+from collections import deque
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait
+import main
+from src.kernels.kernelstrategy import is_contradiction
+from src.structs.dataset import DataSet
+from src.structs.datasetstore import DatasetStore
+from src.database.database import create_ssh_tunnel_and_connect, log_execution_data
+
+# The filename lists, strategy parameters and parameter sets run by default
+FILENAME_LISTS = [
+    "data/SRS/sig3_5_15.csv",
+    #"data/SRS/sig5_15_25.csv",
+    #"data/SRS/sig10_15_25.csv",
+    #"data/SRS/sig15_25_50.csv",
+    #"data/SRS/sig20_25_50.csv",
+]
+STRATEGY_PARAMS = [3]
+PARAMETER_SETS = [
+    "--alpha A0&&!A0 --log-db",
+    "--alpha A0&&!A0 --log-db -dc",
+    "--alpha A0&&!A0 --log-db -dc --sw-size 5",
+    "--alpha A0&&!A0 --log-db -dc --sw-size 10",
+]
+# Seconds a single job may run before its worker is killed (the time limit of main.py)
+TIMEOUT = 1800
+# The columns of the result file
+RESULT_FIELDS = ["dataset", "strategy_param", "parameters", "status", "load_time", "execution_time", "memory",
+                 "num_kernels", "num_branches", "tree_depth", "pruned_branches_count", "boundary", "optimal_hitting_set", "error"]
+
+
+def read_filename_list(path):
+    """
+    Return the dataset filenames of a filename list, skipping the header line if present.
+    """
+    with open(path, newline='') as file:
+        return [row[0].strip() for row in csv.reader(file) if row and row[0].strip() and row[0].strip() != "filename"]
+
+
+def build_tasks(filename_lists, strategy_params, parameter_sets):
+    """
+    Build one task per dataset, holding all its jobs in the order of batch_run.sh.
+
+    Args:
+        filename_lists (list of str): The filename lists, e.g. data/SRS/sig3_5_15.csv.
+        strategy_params (list of int): The strategy parameters, see main.py.
+        parameter_sets (list of str): The further arguments of main.py per job, e.g. "--alpha A0&&!A0 -dc".
+
+    Returns:
+        tuple: (tasks, jobs), tasks a list of (filename, job ids) and jobs a dict mapping each job
+        id to (filename, strategy parameter, parameter set, argv of main.py).
+    """
+    tasks, jobs = [], {}
+    for filename_list in filename_lists:
+        if not os.path.isfile(filename_list):
+            print(f"File not found: {filename_list}")
+            continue
+        for filename in read_filename_list(filename_list):
+            job_ids = []
+            for strategy_param in strategy_params:
+                for parameter_set in parameter_sets:
+                    argv = [filename, str(strategy_param), "-k"] + shlex.split(parameter_set)
+                    jobs[len(jobs)] = (filename, strategy_param, parameter_set, argv)
+                    job_ids.append(len(jobs) - 1)
+            tasks.append((filename, job_ids))
+    return tasks, jobs
+
+
+def load_dataset(args, store, connect):
+    """
+    Load the dataset of the arguments like main.py: from a compiled or gcnf file, the local store or the database.
+
+    Args:
+        args (argparse.Namespace): The arguments of the job, see main.parser.
+        store (DatasetStore): The local dataset store, or None.
+        connect (callable): Returns the open connection to the database, opening it on first use.
+
+    Returns:
+        DataSet: The loaded dataset with the values of args.strategy_param.
+    """
+    compiled_input = args.format == 'gcnf' or args.dataset_name.endswith(".kbc")
+    if compiled_input:
+        return DataSet(input_file_path=args.dataset_name, strategy_param=args.strategy_param, file_format=args.format, value_jobs=args.value_jobs)
+    if store is not None and args.dataset_name in store:
+        return DataSet(input_file_path=args.dataset_name, strategy_param=args.strategy_param, store=store, value_jobs=args.value_jobs)
+    return DataSet(connect(), input_file_path=args.dataset_name, strategy_param=args.strategy_param, value_jobs=args.value_jobs)
+
+
+def run_job(args, dataset, compiled):
+    """
+    Run one job on a copy of its loaded dataset and return its result row.
+    """
+    if not 1 <= args.sw_size <= dataset.size():
+        raise ValueError(f"--sw-size/--sliding-window must be between 1 and the length of the dataset ({dataset.size()}).")
+    start_time = time.time()
+    job_dataset = dataset.restrict(dataset.get_elements())
+    if args.relevance_order:
+        job_dataset.order_by_relevance(args.alpha)
+    hitting_set_tree = main.run_search(args, job_dataset, compiled)
+    result = main.tree_statistics(hitting_set_tree)
+    result["execution_time"] = time.time() - start_time
+    # The peak of the worker so far, as every job of a worker shares its process
+    result["memory"] = f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss} KB"
+    return result
+
+
+def worker_loop(pipe, store_path):
+    """
+    Worker process: run the jobs of the tasks received on the pipe until None is received.
+
+    For every job the worker sends ("start", job id), then ("elements", job id, elements) for
+    jobs that log to the database, and finally ("done", job id, result) or ("error", job id,
+    message). ("idle",) is sent when all jobs of a task are done.
+
+    Args:
+        pipe (multiprocessing.connection.Connection): The worker end of the pipe to the parent.
+        store_path (str): The local dataset store, used if the file exists.
+    """
+    # The trees are printed by the searches; the parent reports the results
+    sys.stdout = open(os.devnull, 'w')
+    store = DatasetStore(store_path) if store_path and os.path.exists(store_path) else None
+    conn = None
+
+    def connect():
+        nonlocal conn
+        if conn is None:
+            conn = create_ssh_tunnel_and_connect()
+        return conn
+
+    while True:
+        task = pipe.recv()
+        if task is None:
+            break
+        filename, jobs = task
+        # The datasets of this file by strategy parameter, and its compiled knowledge bases
+        datasets, compiled = {}, {}
+        for job_id, argv in jobs:
+            pipe.send(("start", job_id))
+            load_time = 0.0
+            try:
+                args = main.parser.parse_args(argv)
+                dataset = datasets.get((args.strategy_param, args.format))
+                if dataset is None:
+                    load_start = time.time()
+                    dataset = datasets[(args.strategy_param, args.format)] = load_dataset(args, store, connect)
+                    load_time = time.time() - load_start
+                if args.log_db:
+                    pipe.send(("elements", job_id, dataset.get_elements()))
+                model_rotation = args.model_rotation and args.method != 'remainder'
+                key = (args.encoding, is_contradiction(args.alpha) or model_rotation)
+                if key not in compiled:
+                    load_start = time.time()
+                    compiled[key] = main.compile_dataset(dataset, args.alpha, args.encoding, model_rotation)
+                    load_time += time.time() - load_start
+                result = run_job(args, dataset, compiled[key])
+                result["load_time"] = load_time
+                pipe.send(("done", job_id, result))
+            except (Exception, SystemExit) as e:
+                logging.error(f"An error occurred in {filename} {argv}: {e}")
+                pipe.send(("error", job_id, str(e)))
+        pipe.send(("idle",))
+
+    if store is not None:
+        store.close()
+    if conn is not None:
+        conn.close()
+
+
+class ResultSink:
+    """
+    Writes the result of every job as one row of a CSV file and, for jobs with --log-db, to the database.
+
+    Attributes:
+        path (str): The CSV file; rows are appended, the header is written if the file is new.
+        conn: The connection to the database, opened for the first job that logs to it.
+    """
+
+    def __init__(self, path):
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.path = path
+        self.file = open(path, 'a', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=RESULT_FIELDS, extrasaction='ignore')
+        if new_file:
+            self.writer.writeheader()
+        self.conn = None
+
+    def write(self, job, status, result=None, elements=None, error=None, execution_time=None):
+        """
+        Record the result of a job.
+
+        Args:
+            job (tuple): (filename, strategy parameter, parameter set, argv), see build_tasks.
+            status (str): "done", "timeout" or "error".
+            result (dict, optional): The result of run_job, None if the job did not finish.
+            elements (list, optional): The elements of the dataset, for the database log.
+            error (str, optional): The error message.
+            execution_time (float, optional): The time the job ran if it did not finish.
+        """
+        filename, strategy_param, parameter_set, argv = job
+        row = dict(result or main.tree_statistics(None), dataset=filename, strategy_param=strategy_param, parameters=parameter_set, status=status, error=error)
+        if result is None:
+            row["execution_time"] = execution_time
+        self.writer.writerow(row)
+        self.file.flush()
+        print(f"{status.capitalize()}: {filename} with strategy {strategy_param} and params {parameter_set}"
+              + (f", Execution time: {row['execution_time']}s, Kernels: {row['num_kernels']}, Boundary: {row['boundary']}" if result else "")
+              + (f", {error}" if error else ""), flush=True)
+
+        args = main.parser.parse_args(argv)
+        if args.log_db and status != "error":
+            if self.conn is None:
+                self.conn = create_ssh_tunnel_and_connect()
+            if self.conn is None:
+                print("Connection to MySQL database failed")
+                return
+            if result is None:
+                # Like main.py on a timeout
+                log_execution_data(self.conn, execution_time, None, elements, args.strategy_param, None, None, None, None, None,
+                                   args.dataset_name, None, args.divide_conquer, args.sw_size, args.method, args.alpha)
+            else:
+                log_execution_data(self.conn, row["execution_time"], row["memory"], elements, args.strategy_param, row["num_kernels"],
+                                   row["num_branches"], row["tree_depth"], row["pruned_branches_count"], row["boundary"],
+                                   args.dataset_name, row["optimal_hitting_set"], args.divide_conquer, args.sw_size, args.method, args.alpha)
+
+    def close(self):
+        self.file.close()
+        if self.conn is not None:
+            self.conn.close()
+
+
+class Worker:
+    """
+    A worker process of the batch and the state the parent keeps of it.
+
+    Attributes:
+        process (multiprocessing.Process): The process running worker_loop.
+        pipe (multiprocessing.connection.Connection): The parent end of its pipe.
+        jobs (collections.deque): The job ids of its task that have not started yet.
+        job (int): The id of the running job, or None.
+        started (float): The time the running job started.
+    """
+
+    def __init__(self, store_path):
+        self.pipe, worker_pipe = Pipe()
+        # Not a daemon, so that jobs with --decompose can start their own pool
+        self.process = Process(target=worker_loop, args=(worker_pipe, store_path))
+        self.process.start()
+        worker_pipe.close()
+        self.filename = None
+        self.jobs = deque()
+        self.job = None
+        self.started = None
+        self.elements = None
+
+    def busy(self):
+        return self.filename is not None
+
+    def assign(self, task, jobs):
+        self.filename, job_ids = task
+        self.jobs = deque(job_ids)
+        self.pipe.send((self.filename, [(job_id, jobs[job_id][3]) for job_id in job_ids]))
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.pipe.close()
+
+    def stop(self):
+        self.pipe.send(None)
+        self.process.join()
+        self.pipe.close()
+
+
+def run_batch(tasks, jobs, sink, workers=None, timeout=TIMEOUT, store_path=None):
+    """
+    Run the tasks on a pool of warm worker processes and write every result to the sink.
+
+    A task (all jobs of one dataset) goes to one worker, so the dataset is loaded and compiled
+    once. If a job exceeds the timeout, its worker is killed and replaced, and the jobs of the
+    task that did not start yet are queued again.
+
+    Args:
+        tasks (list): The tasks, see build_tasks.
+        jobs (dict): The jobs by id, see build_tasks.
+        sink (ResultSink): The sink of the results.
+        workers (int, optional): The number of worker processes, None = number of CPUs.
+        timeout (float, optional): Seconds a job may run.
+        store_path (str, optional): The local dataset store of the workers.
+    """
+    pending = deque(tasks)
+    pool = [Worker(store_path) for _ in range(min(workers or os.cpu_count(), len(pending)))]
+    try:
+        while pending or any(worker.busy() for worker in pool):
+            for worker in pool:
+                if not worker.busy() and pending:
+                    worker.assign(pending.popleft(), jobs)
+
+            running = [worker for worker in pool if worker.job is not None]
+            deadline = min((worker.started + timeout for worker in running), default=None)
+            ready = wait([worker.pipe for worker in pool if worker.busy()], None if deadline is None else max(deadline - time.time(), 0))
+
+            for index, worker in enumerate(pool):
+                if worker.pipe in ready:
+                    try:
+                        message = worker.pipe.recv()
+                    except EOFError:
+                        # The worker died, e.g. killed by the out-of-memory killer
+                        pool[index] = replace_worker(worker, "error", pending, jobs, sink, store_path)
+                        continue
+                    if message[0] == "start":
+                        worker.jobs.remove(message[1])
+                        worker.job, worker.started, worker.elements = message[1], time.time(), None
+                    elif message[0] == "elements":
+                        worker.elements = message[2]
+                    elif message[0] == "done":
+                        sink.write(jobs[message[1]], "done", result=message[2], elements=worker.elements)
+                        worker.job = None
+                    elif message[0] == "error":
+                        sink.write(jobs[message[1]], "error", error=message[2])
+                        worker.job = None
+                    elif message[0] == "idle":
+                        worker.filename = None
+                elif worker.job is not None and time.time() - worker.started >= timeout:
+                    pool[index] = replace_worker(worker, "timeout", pending, jobs, sink, store_path)
+    finally:
+        for worker in pool:
+            if worker.busy():
+                worker.kill()
+            else:
+                worker.stop()
+
+
+def replace_worker(worker, status, pending, jobs, sink, store_path):
+    """
+    Kill a worker whose job timed out or that died, record the job and queue the rest of its task again.
+
+    Returns:
+        Worker: The new worker taking its place.
+    """
+    worker.kill()
+    if worker.job is not None:
+        execution_time = time.time() - worker.started
+        error = f"Job exceeded the time limit of {execution_time:.0f}s" if status == "timeout" else "Worker process died"
+        logging.error(f"{error}: {jobs[worker.job][3]}")
+        sink.write(jobs[worker.job], status, elements=worker.elements, error=error, execution_time=execution_time)
+    if worker.jobs:
+        pending.appendleft((worker.filename, list(worker.jobs)))
+    return Worker(store_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run main.py for every dataset of the filename lists, strategy parameter and parameter set in warm worker processes.')
+    parser.add_argument('filename_lists', nargs='*', default=FILENAME_LISTS, help='CSV files with one dataset filename per line (default: FILENAME_LISTS)')
+    parser.add_argument('--strategies', type=int, nargs='+', default=STRATEGY_PARAMS, help='Strategy parameters, see main.py (default: STRATEGY_PARAMS)')
+    parser.add_argument('--params', action='append', help='A parameter set of main.py, repeated for several sets, e.g. --params="--alpha A0&&!A0 -dc" (default: PARAMETER_SETS)')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of worker processes (default: number of CPUs)')
+    parser.add_argument('--timeout', type=float, default=TIMEOUT, help=f'Seconds a single job may run (default: {TIMEOUT})')
+    parser.add_argument('--output', type=str, default='Results/batch_results.csv', help='CSV file the results are appended to (default: Results/batch_results.csv)')
+    parser.add_argument('--store', type=str, default='db/datasets.sqlite', help='Local dataset store, see main.py (default: db/datasets.sqlite)')
+    batch_args = parser.parse_args()
+
+    tasks, jobs = build_tasks(batch_args.filename_lists, batch_args.strategies, batch_args.params or PARAMETER_SETS)
+    sink = ResultSink(batch_args.output)
+    start_time = time.time()
+    try:
+        run_batch(tasks, jobs, sink, batch_args.jobs, batch_args.timeout, batch_args.store)
+    finally:
+        sink.close()
+    print(f"Ran {len(jobs)} jobs on {len(tasks)} datasets in {time.time() - start_time}s, results in {batch_args.output}")
@@ -1,43 +1,136 @@
+import argparse
 import os
 import sys
 import random
-from src.database.database import create_connection, log_execution_data
+import hashlib
+import json
+import queue
+import sqlite3
+from contextlib import contextmanager
+from multiprocessing import Pool
+from src.database.database import create_connection
+from src.structs.datasetstore import SCHEMA
 
 import subprocess
 import tempfile
-import math
 
+# Content-addressed cache of the leave-one-out inconsistency measures, one file per dataset content
+CACHE_DIR = '.cache/inconsistency'
+# Number of DATA_ENTRY rows per executemany call
+BATCH_SIZE = 1000
+
+
+def create_sqlite_connection(path):
+    """Open a local SQLite database with the tables of db/init.sql, a stand-in for the MySQL database and a dataset store for main.py."""
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
 
-def log_execution_data(sql):
-    conn = create_connection()
-    if conn is not None:
-        cursor = conn.cursor()
-        try:
-            cursor.execute(sql)
-            conn.commit()
-        finally:
-            cursor.close()
-            conn.close()
-    else:
-        print("Connection to MySQL database failed")
 
+class ConnectionPool:
+    """
+    A fixed-size pool of open database connections, reused instead of connecting for every statement.
 
-def check_filename_exists(filename):
-    """Check if the filename already exists in the DATA_SETS table."""
-    conn = create_connection()
-    if conn is not None:
-        cursor = conn.cursor()
+    Attributes:
+        connect (callable): Opens a new connection, e.g. create_connection.
+        size (int): The maximum number of open connections.
+    """
+
+    def __init__(self, connect, size=1):
+        self.connect = connect
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection from the pool, opening one if the pool is not full yet."""
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            if self.opened < self.size:
+                conn = self.connect()
+                if conn is None:
+                    raise ConnectionError("Connection to the database failed")
+                self.opened += 1
+            else:
+                conn = self.idle.get()
+        if hasattr(conn, "ping"):
+            # MySQL drops idle connections, e.g. while a long file is being measured
+            conn.ping(reconnect=True)
         try:
-            query = "SELECT COUNT(*) FROM DATA_SETS WHERE filename = %s"
-            cursor.execute(query, (filename,))
-            result = cursor.fetchone()
-            return result[0] > 0
+            yield conn
         finally:
-            cursor.close()
-            conn.close()
-    else:
-        print("Connection to MySQL database failed")
-        return False
+            self.idle.put(conn)
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get_nowait().close()
+            self.opened -= 1
+
+
+class DataIngestor:
+    """
+    Writes datasets and the values of their lines into DATA_SETS and DATA_ENTRY.
+
+    Every dataset is written in one transaction with parameterized executemany batches, on a
+    connection borrowed from the pool.
+
+    Attributes:
+        pool (ConnectionPool): The connections to the MySQL database or its SQLite stand-in.
+        batch_size (int): The number of rows per executemany call.
+    """
+
+    def __init__(self, pool, batch_size=BATCH_SIZE):
+        self.pool = pool
+        self.batch_size = batch_size
+
+    @staticmethod
+    def placeholder(conn):
+        return "?" if isinstance(conn, sqlite3.Connection) else "%s"
+
+    def existing_filenames(self):
+        """Return the filenames already in the DATA_SETS table, with a single query."""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT filename FROM DATA_SETS")
+                return {row[0] for row in cursor.fetchall()}
+            finally:
+                cursor.close()
+
+    def insert_dataset(self, filepath, rows):
+        """
+        Insert a dataset and its entries in one transaction.
+
+        Args:
+            filepath (str): The filename of the dataset.
+            rows (iterable of tuple): (random value, inconsistency value, line) per entry, consumed lazily.
+        """
+        with self.pool.connection() as conn:
+            p = self.placeholder(conn)
+            entry_sql = f"INSERT INTO DATA_ENTRY (randomValue, inconsistencyValue, filename, line) VALUES ({p}, {p}, {p}, {p})"
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f"INSERT INTO DATA_SETS (filename) VALUES ({p})", (filepath,))
+                batch = []
+                count = 0
+                for random_value, inconsistency_value, line in rows:
+                    batch.append((random_value, inconsistency_value, filepath, line))
+                    if len(batch) == self.batch_size:
+                        cursor.executemany(entry_sql, batch)
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    cursor.executemany(entry_sql, batch)
+                    count += len(batch)
+                conn.commit()
+                print(f"Inserted {filepath} with {count} entries")
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
 
 
 def call_sat_solver(script_path, temp_filepath, option='c'):
@@ -65,38 +158,124 @@ def call_sat_solver(script_path, temp_filepath, option='c'):
     raise ValueError("Failed to obtain inconsistency measure from SAT solver.")
 
 
-def calculate_values(filepath, filename, script_path='sat4im/src/sat4im.py'):
-    initial_inconsistency_measure = call_sat_solver(script_path, filepath)
+def file_digest(filepath):
+    """Return the SHA-256 of the file content, the key of its cached inconsistency values."""
+    with open(filepath, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
 
+def load_cached_values(digest, option='c', cache_dir=CACHE_DIR):
+    """Return the cached inconsistency measures of a file content: {"full": m, "without": {line: m}}."""
+    try:
+        with open(os.path.join(cache_dir, f"{digest}_{option}.json"), 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {"full": None, "without": {}}
+
+
+def store_cached_values(digest, values, option='c', cache_dir=CACHE_DIR):
+    """Write the cached inconsistency measures of a file content, replacing the cache file atomically."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{digest}_{option}.json")
+    with open(path + ".tmp", 'w') as file:
+        json.dump(values, file)
+    os.replace(path + ".tmp", path)
+
+
+def measure_job(job):
+    """
+    Pool worker: compute the inconsistency measure of a file, or of the file without one line.
+
+    Args:
+        job (tuple): (script_path, filepath, index, option), index None for the whole file.
+
+    Returns:
+        tuple: (filepath, index, measure).
+    """
+    script_path, filepath, index, option = job
+    if index is None:
+        return filepath, index, call_sat_solver(script_path, filepath, option)
     with open(filepath, 'r') as file:
         lines = file.readlines()
-    
-    print(f"Initial inconsistency measure: {initial_inconsistency_measure}")
+    with tempfile.NamedTemporaryFile(mode='w+', delete=False) as temp_file:
+        temp_file.writelines(lines[:index] + lines[index+1:])
+        temp_filepath = temp_file.name
+    try:
+        return filepath, index, call_sat_solver(script_path, temp_filepath, option)
+    finally:
+        os.remove(temp_filepath)
 
+
+def value_rows(lines, cached):
+    """Yield (random value, inconsistency value, line) for every non-empty line of a file."""
+    print(f"Initial inconsistency measure: {cached['full']}")
     range_of_values = list(range(1, len(lines) + 1))
     random.shuffle(range_of_values)
-
-    inconsistency_differences = []
     for i in range(len(lines)):
         if lines[i].strip() == "":
             continue
-        with tempfile.NamedTemporaryFile(mode='w+', delete=False) as temp_file:
-            temp_file.writelines(lines[:i] + lines[i+1:])
-            temp_filepath = temp_file.name
+        inconsistency_difference = cached['full'] - cached['without'][lines[i]]
+        yield range_of_values[i], inconsistency_difference, lines[i].strip()
 
-        try:
-            inconsistency_measure = call_sat_solver(script_path, temp_filepath)
-            inconsistency_difference = initial_inconsistency_measure - inconsistency_measure
-            inconsistency_differences.append(inconsistency_difference)
-            random_value = range_of_values[i]
-            sql = f"INSERT INTO DATA_ENTRY (randomValue, inconsistencyValue, filename, line) VALUES ({random_value}, {inconsistency_difference}, '{filepath}', '{lines[i].strip()}')"
-            print(sql)
-            log_execution_data(sql)
-        finally:
-            os.remove(temp_filepath)
 
+def calculate_values(filepaths, ingestor, script_path='sat4im/src/sat4im.py', processes=None, option='c'):
+    """
+    Compute the leave-one-out inconsistency values of several files and insert them into the database.
+
+    The measure of every file and of every file without one of its lines is cached under the hash
+    of the file content and the removed line, so unchanged files, and lines occurring more than
+    once, are never measured twice. The remaining measures of all files are computed by one
+    process pool, and every file is inserted as soon as all of its measures are known.
+
+    Args:
+        filepaths (list of str): The dataset files.
+        ingestor (DataIngestor): Writes the values of every finished file into the database.
+        script_path (str, optional): The sat4im script computing the inconsistency measure.
+        processes (int, optional): Number of worker processes (default: number of CPUs).
+        option (str, optional): The inconsistency measure passed to sat4im.
+    """
+    files = {}
+    jobs = []
+    for filepath in filepaths:
+        with open(filepath, 'r') as file:
+            lines = file.readlines()
+        digest = file_digest(filepath)
+        cached = load_cached_values(digest, option)
+        pending = set()
+        if cached['full'] is None:
+            jobs.append((script_path, filepath, None, option))
+            pending.add(None)
+        # Removing any copy of a line gives the same content, so each distinct line is measured once
+        first_index = {}
+        for i, line in enumerate(lines):
+            if line.strip() != "" and line not in cached['without']:
+                first_index.setdefault(line, i)
+        for line, i in first_index.items():
+            jobs.append((script_path, filepath, i, option))
+            pending.add(i)
+        files[filepath] = (lines, digest, cached, pending)
+        if not pending:
+            print(f"{filepath}: all inconsistency values cached")
+            ingestor.insert_dataset(filepath, value_rows(lines, cached))
+
+    if not jobs:
+        return
+    with Pool(processes) as pool:
+        for filepath, index, measure in pool.imap_unordered(measure_job, jobs, chunksize=1):
+            lines, digest, cached, pending = files[filepath]
+            if index is None:
+                cached['full'] = measure
+            else:
+                cached['without'][lines[index]] = measure
+            pending.discard(index)
+            if not pending:
+                store_cached_values(digest, cached, option)
+                ingestor.insert_dataset(filepath, value_rows(lines, cached))
 
-def list_files_excluding_db(root_folder):
+
+def list_files_excluding_db(root_folder, ingestor, processes=None):
+    existing = ingestor.existing_filenames()
+    new_files = []
     for dirpath, dirnames, filenames in os.walk(root_folder):
         if dirpath == "data/SRS" or dirpath == "data/Test_Datasets":
             continue
@@ -105,14 +284,25 @@ def list_files_excluding_db(root_folder):
             if filename == '.DS_Store':
                 continue
             full_path = os.path.join(dirpath, filename)
-            if check_filename_exists(full_path):
+            if full_path in existing:
                 print(f"Skipping {full_path} as it already exists in the database.")
                 continue
-            sql = f"INSERT INTO DATA_SETS (filename) VALUES ('{full_path}');"
             print(full_path)
-            log_execution_data(sql)
-            calculate_values(full_path, filename)
+            new_files.append(full_path)
+    calculate_values(new_files, ingestor, processes=processes)
 
 if __name__ == "__main__":
-    root_folder = 'data'
-    list_files_excluding_db(root_folder)
+    parser = argparse.ArgumentParser(description='Precompute the random and inconsistency values of all datasets and store them in the database.')
+    parser.add_argument('root_folder', nargs='?', default='data', help='Folder with the dataset files (default: data)')
+    parser.add_argument('--sqlite', type=str, help='Store into this local SQLite database instead of MySQL')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of worker processes (default: number of CPUs)')
+    args = parser.parse_args()
+
+    if args.sqlite:
+        pool = ConnectionPool(lambda: create_sqlite_connection(args.sqlite))
+    else:
+        pool = ConnectionPool(create_connection)
+    try:
+        list_files_excluding_db(args.root_folder, DataIngestor(pool), args.jobs)
+    finally:
+        pool.close()
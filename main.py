@@ -17,10 +17,15 @@ import signal
 import logging
 from src.search.hybrid import HybridSearch
 from src.search.bfs import BFS
+from src.search.decomposed import DecomposedSearch
+from src.search.marco import Marco
 from src.solver.kernelsolver import KernelSolver
 from src.kernels.expandshrink import ExpandShrink
 from src.kernels.shrinkexpand import ShrinkExpand
 from src.structs.dataset import DataSet
+from src.structs.compiledkb import CompiledKnowledgeBase
+from src.structs.datasetstore import DatasetStore
+from src.kernels.kernelstrategy import is_contradiction
 from src.database.database import create_ssh_tunnel_and_connect, log_execution_data
 
 # Configure logging
@@ -28,61 +33,146 @@ logging.basicConfig(filename='log/main.log', level=logging.CRITICAL, format='%(a
 
 # Set up argument parser
 parser = argparse.ArgumentParser(description='Run the kernelization process with optional database logging.')
-parser.add_argument('dataset_name', type=str, help='Name of the dataset stored in the database')
+parser.add_argument('dataset_name', type=str, help='Name of the dataset stored in the database, or a compiled .kbc file (see src/structs/compiledkb.py)')
 parser.add_argument('strategy_param', type=int, help='Strategy parameter value')
 parser.add_argument('--sw-size', '--sliding-window', type=int, default=1, help='Define the window size for the sliding-window technique (default: 1)')
 parser.add_argument('-dc', '--divide-conquer', action='store_true', help='Activate the divide and conquer technique')
+parser.add_argument('-bs', '--binary-search', action='store_true', help='Use galloping/binary search to find the entailing prefix (kernels) or the shrink cut (remainders)')
+parser.add_argument('--model-rotation', action='store_true', help='Mark elements necessary in the shrink phase of expand-shrink by rotating the counter models instead of checking every element')
+parser.add_argument('--relevance-order', action='store_true', help='Traverse the elements by relevance distance from alpha instead of the database order')
+parser.add_argument('--relevance-filter', action='store_true', help='Drop the elements that cannot be part of any kernel for alpha before the search (always done by --decompose)')
+parser.add_argument('--decompose', action='store_true', help='Search the atom-disjoint components of the dataset separately and combine their hitting sets')
+parser.add_argument('--jobs', type=int, default=None, help='Number of worker processes for --decompose (default: number of CPUs)')
+parser.add_argument('--value-jobs', type=int, default=1, help='Number of worker processes for the Shapley values of strategy 4 (default: 1, in process)')
+parser.add_argument('--format', choices=['pl', 'gcnf'], default='pl', help='pl: dataset of formulas from the database or a compiled .kbc file, gcnf: group CNF file whose clause groups are the elements (default: pl)')
+parser.add_argument('--encoding', choices=['tseitin', 'pg'], default='pg', help='CNF encoding of the entailment checks: full Tseitin or polarity-aware Plaisted-Greenbaum (default: pg)')
+parser.add_argument('--harvest', type=int, default=0, help='Harvest up to this many disjoint kernels up front; the search reuses them instead of calling the kernel strategy and prunes with their lower bound (default: 0 = off)')
+parser.add_argument('--enumerate', action='store_true', help='Enumerate all kernels and remainders for alpha with MARCO instead of searching a hitting set tree')
+parser.add_argument('--store', type=str, default='db/datasets.sqlite', help='Local dataset store to load the dataset from without the database, if it contains it (see src/structs/datasetstore.py, default: db/datasets.sqlite)')
 parser.add_argument('--log-db', action='store_true', help='Enable logging to database')
 parser.add_argument('--alpha', type=str, help='A string value to be used as alpha')
 group = parser.add_mutually_exclusive_group()
 group.add_argument('-k', '--kernel', action='store_const', const='kernel', dest='method', help='Use the kernel method')
 group.add_argument('-r', '--remainder', action='store_const', const='remainder', dest='method', help='Use the remainder method')
-args = parser.parse_args()
 
 # Function to handle timeout
 def timeout_handler(signum, frame):
     raise TimeoutError("Program exceeded the specified time limit.")
 
+def compile_dataset(dataset, alpha, encoding, model_rotation=False):
+    """
+    Return the compiled knowledge base shared by the entailment checks of a run.
+
+    That is the one the dataset was loaded from, if any. In inconsistency mode all checks are
+    consistency checks that share one encoding of the dataset, and model rotation reads its
+    models with the atom variables of one, so the whole dataset is compiled here once.
+
+    Args:
+        dataset (DataSet): The loaded dataset.
+        alpha (str): The formula the kernels or remainders are computed for.
+        encoding (str): The CNF encoding, "tseitin" or "pg".
+        model_rotation (bool, optional): Whether expand-shrink rotates the counter models.
+
+    Returns:
+        CompiledKnowledgeBase: The compiled knowledge base, or None if the checks convert every formula.
+    """
+    compiled = dataset.compiled
+    if compiled is None and (is_contradiction(alpha) or model_rotation):
+        compiled = CompiledKnowledgeBase.from_elements(dataset.get_elements(), encoding)
+    return compiled
+
+def run_search(args, dataset, compiled):
+    """
+    Run the kernel or remainder search selected by the arguments on the dataset.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments, see parser.
+        dataset (DataSet): The dataset, with the values of args.strategy_param.
+        compiled (CompiledKnowledgeBase): The compiled knowledge base, see compile_dataset.
+
+    Returns:
+        HittingSetTree: The searched tree, or None if neither -k nor -r is given.
+    """
+    if args.method == 'kernel':
+        kernel_strategy = ExpandShrink(args.sw_size, args.divide_conquer, args.binary_search, args.encoding, compiled, args.model_rotation)
+    elif args.method == 'remainder':
+        kernel_strategy = ShrinkExpand(args.sw_size, args.divide_conquer, args.binary_search, args.encoding, compiled)
+    else:
+        return None
+    if args.decompose and 0 <= args.strategy_param < 6:
+        # DecomposedSearch always applies the relevance filter itself
+        return KernelSolver(DecomposedSearch(kernel_strategy, dataset, args.alpha, args.strategy_param, args.jobs, args.harvest)).solve()
+    search_dataset = kernel_strategy.filter_relevant(dataset, args.alpha) if args.relevance_filter else dataset
+    if args.strategy_param == 0:
+        return KernelSolver(BFS(kernel_strategy, search_dataset, args.alpha)).solve()
+    elif 0 < args.strategy_param < 6:
+        return KernelSolver(HybridSearch(kernel_strategy, search_dataset, args.alpha, args.strategy_param, args.harvest)).solve()
+    logging.error("WRONG STRATEGY PARAM! MUST BE 0 = no B&B, 1 = Cardinality, 2 = Random, 3 = Inconsistency, 4 = Shapley inconsistency, 5 = Shapley MI")
+    raise ValueError(f"Wrong strategy param: {args.strategy_param}")
+
+def tree_statistics(hitting_set_tree):
+    """
+    Return the statistics of a searched tree that are printed and logged to the database.
+
+    Returns:
+        dict: num_kernels, num_branches, pruned_branches_count, tree_depth, boundary and
+        optimal_hitting_set, with zeros and None if there is no tree.
+    """
+    if not hitting_set_tree:
+        return {"num_kernels": 0, "num_branches": 0, "pruned_branches_count": 0, "tree_depth": None, "boundary": None, "optimal_hitting_set": None}
+    num_kernels, num_branches = hitting_set_tree.count_kernels_and_branches()
+    return {"num_kernels": num_kernels, "num_branches": num_branches, "pruned_branches_count": hitting_set_tree.count_pruned_nodes(),
+            "tree_depth": hitting_set_tree.tree_depth(), "boundary": hitting_set_tree.boundary,
+            "optimal_hitting_set": hitting_set_tree.get_hitting_set_for_optimal_solution()}
+
 if __name__ == "__main__":
+    args = parser.parse_args()
+
     # Prepare for timeout
     signal.signal(signal.SIGALRM, timeout_handler)
     timeout_duration = 1800  # 1800 seconds or 30 minutes
     signal.alarm(timeout_duration)  # Start the timer
 
-    conn = create_ssh_tunnel_and_connect()
+    # Compiled knowledge bases and group CNF files carry their elements, the database is only needed for logging
+    compiled_input = args.format == 'gcnf' or args.dataset_name.endswith(".kbc")
+    # So do datasets synced into the local store
+    store = DatasetStore(args.store) if not compiled_input and os.path.exists(args.store) else None
+    if store is not None and args.dataset_name not in store:
+        store.close()
+        store = None
+    conn = create_ssh_tunnel_and_connect() if not (compiled_input or store) or args.log_db else None
 
     start_time = time.time()
 
-    dataset = DataSet(conn, input_file_path=args.dataset_name, strategy_param=args.strategy_param)
+    dataset = DataSet(conn, input_file_path=args.dataset_name, strategy_param=args.strategy_param, file_format=args.format, store=store, value_jobs=args.value_jobs)
+    if store is not None:
+        store.close()
+    dataset_name = dataset.compiled.source if compiled_input else args.dataset_name
     if not 1 <= args.sw_size <= dataset.size():
         sys.exit(f"--sw-size/--sliding-window must be between 1 and the length of the dataset ({dataset.size()}).")
     if args.alpha:
         logging.info(f"Alpha: {args.alpha}")
+    if args.relevance_order:
+        dataset.order_by_relevance(args.alpha)
+
+    compiled = compile_dataset(dataset, args.alpha, args.encoding, args.model_rotation and args.method != 'remainder')
 
     hitting_set_tree = None
     try:
-        if args.method == 'kernel':
-            if args.strategy_param == 0:
-                hitting_set_tree = KernelSolver(BFS(ExpandShrink(args.sw_size, args.divide_conquer), dataset, args.alpha)).solve()
-            elif 0 < args.strategy_param < 4:
-                hitting_set_tree = KernelSolver(HybridSearch(ExpandShrink(args.sw_size, args.divide_conquer), dataset, args.alpha, args.strategy_param)).solve()
-            else:
-                logging.error("WRONG STRATEGY PARAM! MUST BE 0 = no B&B, 1 = Cardinality, 2 = Random, 3 = Inconsistency")
-                sys.exit(1)
-        elif args.method == 'remainder':
-            if args.strategy_param == 0:
-                hitting_set_tree = KernelSolver(BFS(ShrinkExpand(args.sw_size, args.divide_conquer), dataset, args.alpha)).solve()
-            elif 0 < args.strategy_param < 4:
-                hitting_set_tree = KernelSolver(HybridSearch(ShrinkExpand(args.sw_size, args.divide_conquer), dataset, args.alpha, args.strategy_param)).solve()
-            else:
-                logging.error("WRONG STRATEGY PARAM! MUST BE 0 = no B&B, 1 = Cardinality, 2 = Random, 3 = Inconsistency")
-                sys.exit(1)
+        if args.enumerate:
+            marco = Marco(ExpandShrink(args.sw_size, args.divide_conquer, args.binary_search, args.encoding, compiled, args.model_rotation), dataset, args.alpha)
+            for kind, elements in marco.enumerate():
+                print(f"{kind.capitalize()}: {elements}", flush=True)
+            print(f"Execution time: {time.time() - start_time}s, Kernels: {len(marco.kernels)}, Remainders: {len(marco.remainders)}, Alpha: {args.alpha}")
+            sys.exit(0)
+        else:
+            hitting_set_tree = run_search(args, dataset, compiled)
     except TimeoutError as e:
         logging.error(f"Timeout occurred: {e}")
         execution_time = time.time() - start_time
         resources_used = f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss} KB"
         if args.log_db and conn is not None:
-            log_execution_data(conn, execution_time, resources_used, dataset.get_elements(), args.strategy_param, None, None, None, None, None, args.dataset_name, None, args.divide_conquer, args.sw_size, args.method, args.alpha)
+            log_execution_data(conn, execution_time, resources_used, dataset.get_elements(), args.strategy_param, None, None, None, None, None, dataset_name, None, args.divide_conquer, args.sw_size, args.method, args.alpha)
             conn.close()
         sys.exit(1)
     except Exception as e:
@@ -92,16 +182,10 @@ if __name__ == "__main__":
         signal.alarm(0)  # Cancel the timeout
 
     execution_time = time.time() - start_time
-    if hitting_set_tree:
-        num_kernels, num_branches = hitting_set_tree.count_kernels_and_branches()
-        pruned_branches_count = hitting_set_tree.count_pruned_nodes()
-        tree_depth = hitting_set_tree.tree_depth()
-        boundary = hitting_set_tree.boundary
-        optimal_hitting_set = hitting_set_tree.get_hitting_set_for_optimal_solution()
-    else:
-        num_kernels = num_branches = pruned_branches_count = 0
-        tree_depth = boundary = None
-        optimal_hitting_set = None
+    statistics = tree_statistics(hitting_set_tree)
+    num_kernels, num_branches = statistics["num_kernels"], statistics["num_branches"]
+    pruned_branches_count, tree_depth = statistics["pruned_branches_count"], statistics["tree_depth"]
+    boundary, optimal_hitting_set = statistics["boundary"], statistics["optimal_hitting_set"]
 
     resources_used = f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss} KB"
 
@@ -110,7 +194,7 @@ if __name__ == "__main__":
 
     if args.log_db:
         if conn is not None:
-            log_execution_data(conn, execution_time, resources_used, dataset.get_elements(), args.strategy_param, num_kernels, num_branches, tree_depth, pruned_branches_count, boundary, args.dataset_name, optimal_hitting_set, args.divide_conquer, args.sw_size, args.method, args.alpha)
+            log_execution_data(conn, execution_time, resources_used, dataset.get_elements(), args.strategy_param, num_kernels, num_branches, tree_depth, pruned_branches_count, boundary, dataset_name, optimal_hitting_set, args.divide_conquer, args.sw_size, args.method, args.alpha)
             conn.close()
         else:
             print("Connection to MySQL database failed")
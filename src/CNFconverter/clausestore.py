@@ -0,0 +1,164 @@
+"""
+This module defines the ClauseStore class, a compact clause container for CNF generation.
+All literals are kept in one flat int32 array and the clause boundaries in an offsets array,
+instead of a Python list per clause. The Tseitin encoding appends into the store and the
+DIMACS text of all clauses is produced in a single vectorized pass.
+"""
+
+from array import array
+import numpy as np
+
+
+def format_dimacs(tokens, separators):
+    """
+    Format integers as ASCII text, each followed by its separator, without a Python loop per token.
+
+    The decimal digits of all tokens are computed column by column into a byte matrix with one
+    row per token, and the leading zeros and unused sign columns are masked out.
+
+    Args:
+        tokens (numpy.ndarray): The integers to format.
+        separators (numpy.ndarray): One separator byte (e.g. ord(" ") or ord("\\n")) per token.
+
+    Returns:
+        bytes: The formatted text.
+    """
+    if len(tokens) == 0:
+        return b""
+    values = np.abs(tokens.astype(np.int64))
+    width = len(str(int(values.max())))
+    text = np.empty((len(tokens), width + 2), dtype=np.uint8)
+    text[:, 0] = ord("-")
+    remaining = values.copy()
+    for column in range(width, 0, -1):
+        text[:, column] = ord("0") + remaining % 10
+        remaining //= 10
+    text[:, width + 1] = separators
+
+    digits = np.ones(len(tokens), dtype=np.int64)
+    for power in range(1, width):
+        digits += values >= 10 ** power
+    mask = np.empty(text.shape, dtype=bool)
+    mask[:, 0] = tokens < 0
+    mask[:, 1:width + 1] = np.arange(1, width + 1)[None, :] > (width - digits)[:, None]
+    mask[:, width + 1] = True
+    return text[mask].tobytes()
+
+
+def dimacs_lines(literals, ends, units=()):
+    """
+    Return the DIMACS lines of clauses given as one flat literal array, optionally followed by unit clauses.
+
+    Args:
+        literals (numpy.ndarray): The literals of all clauses, concatenated.
+        ends (numpy.ndarray): The end offset of every clause in literals.
+        units (iterable of int, optional): Literals to append as unit clauses.
+
+    Returns:
+        bytes: One "l1 l2 ... 0" line per clause, without the "p cnf" header.
+    """
+    units = np.asarray(list(units), dtype=np.int32)
+    tokens = np.concatenate([np.insert(literals, ends, 0), np.stack([units, np.zeros_like(units)], axis=1).ravel()])
+    separators = np.full(len(tokens), ord(" "), dtype=np.uint8)
+    separators[ends + np.arange(len(ends))] = ord("\n")
+    separators[len(tokens) - 2 * len(units) + 1::2] = ord("\n")
+    return format_dimacs(tokens, separators)
+
+
+class ClauseStore:
+    """
+    A growable store of clauses backed by flat C arrays.
+
+    Behaves like a list of clauses for appending, len() and iteration (which yields lists),
+    so it can be used wherever the encoders used a list of lists. literal_array() and
+    offset_array() expose zero-copy NumPy views; clause i consists of the literals between
+    offsets[i] and offsets[i + 1]. No clauses can be added while such a view is alive.
+
+    Attributes:
+        literal_buffer (array): All literals of all clauses, as int32.
+        offset_buffer (array): The start offset of every clause plus the total length, as int64.
+    """
+
+    def __init__(self, clauses=None):
+        """
+        Initialize the store, optionally with a list of clauses.
+
+        Args:
+            clauses (iterable of list of int, optional): Clauses to add to the store.
+        """
+        self.literal_buffer = array("i")
+        self.offset_buffer = array("q", [0])
+        if clauses is not None:
+            self.extend(clauses)
+
+    def append(self, clause):
+        """
+        Add a clause to the store.
+
+        Args:
+            clause (list of int): The literals of the clause.
+        """
+        self.literal_buffer.extend(clause)
+        self.offset_buffer.append(len(self.literal_buffer))
+
+    def extend(self, clauses):
+        """
+        Add several clauses to the store.
+
+        Args:
+            clauses (iterable of list of int or ClauseStore): The clauses to add.
+        """
+        if isinstance(clauses, ClauseStore):
+            shift = len(self.literal_buffer)
+            self.literal_buffer.extend(clauses.literal_buffer)
+            self.offset_buffer.extend(offset + shift for offset in clauses.offset_buffer[1:])
+            return
+        for clause in clauses:
+            self.append(clause)
+
+    def __len__(self):
+        return len(self.offset_buffer) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        return self.literal_buffer[self.offset_buffer[index]:self.offset_buffer[index + 1]].tolist()
+
+    def __iter__(self):
+        literals = self.literal_buffer.tolist()
+        offsets = self.offset_buffer
+        for i in range(len(offsets) - 1):
+            yield literals[offsets[i]:offsets[i + 1]]
+
+    def num_literals(self):
+        """
+        Returns:
+            int: The total number of literals of all clauses.
+        """
+        return len(self.literal_buffer)
+
+    def literal_array(self):
+        """
+        Returns:
+            numpy.ndarray: A zero-copy int32 view of all literals.
+        """
+        return np.frombuffer(self.literal_buffer, dtype=np.int32)
+
+    def offset_array(self):
+        """
+        Returns:
+            numpy.ndarray: A zero-copy int64 view of the clause offsets (one more than the number of clauses).
+        """
+        return np.frombuffer(self.offset_buffer, dtype=np.int64)
+
+    def to_dimacs(self, units=()):
+        """
+        Return the DIMACS clause lines of the store, optionally followed by unit clauses.
+
+        Args:
+            units (iterable of int, optional): Literals to append as unit clauses, e.g. the soft literals.
+
+        Returns:
+            bytes: One "l1 l2 ... 0" line per clause, without the "p cnf" header.
+        """
+        return dimacs_lines(self.literal_array(), self.offset_array()[1:], units)
@@ -26,9 +26,11 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
-import itertools, sys
-import lark
+import collections, itertools, re, sys
+from src.CNFconverter.clausestore import ClauseStore
 
+# The grammar accepted by parse_formula, from lowest to highest precedence. Repeated
+# negations such as !!A are accepted as well.
 grammar = """
 	?start: formula
 	?formula: equiv_formula
@@ -62,85 +64,92 @@ top = "+"
 bot = "-"
 all_connectives = ["&&", "||", "=>", "^^", "<=>"]
 
+# Binding strength of the binary connectives; && and || are n-ary, the others non-associative
+precedence = { "<=>" : 1, "^^" : 2, "=>" : 3, "||" : 4, "&&" : 5 }
+nary_connectives = ["&&", "||"]
+# Any other non-blank character becomes a token of its own and is rejected by the parser
+token_regex = re.compile(r"<=>|=>|\^\^|&&|\|\||[!()+-]|[A-Za-z_][A-Za-z0-9_]*|\S")
+name_start = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_")
+
 class Formula:
 
-	def __init__(self, input_formula=None, depth=0):
-		self.depth = depth
-		self.label = None
-		self.negation = False
-		self.children = []
-		self.is_atom = False
-		self.atoms = set()
-		if input_formula is not None:
-			item = input_formula
-			while item.data == "subformula" or item.data == "not_formula":
-				if item.data == "not_formula":
-					assert(len(item.children) == 2)
-					self.negation = not self.negation
-					item = item.children[1]
-				if item.data == "subformula":
-					assert(len(item.children) == 3)
-					item = item.children[1]
-			if item.data in ["and_formula", "or_formula", "impl_formula", "xor_formula", "equiv_formula"]:
-				connectives = [elem for elem in item.children if elem in all_connectives]
-				assert(all(elem == connectives[0] for elem in connectives))
-				self.label = connectives[0]
-				self.children = [Formula(elem, self.depth+1) for elem in item.children if elem != self.label]
-				for formula in self.children:
-					self.atoms.update(formula.atoms)
+	__slots__ = ("label", "negation", "children", "is_atom", "_atoms", "tseitin_var", "tseitin_lit", "atom_vars")
+
+	def __init__(self, label=None, children=(), negation=False):
+		self.label = label
+		self.negation = negation
+		self.children = children
+		self.is_atom = len(children) == 0
+		self._atoms = None
+
+	# The set of atoms is only computed when asked for, and then cached on every node below.
+	@property
+	def atoms(self):
+		stack = [self]
+		while stack:
+			node = stack[-1]
+			if node._atoms is not None:
+				stack.pop()
+			elif node.is_atom:
+				node._atoms = {node.label} if node.label is not None else set()
+				stack.pop()
 			else:
-				assert(item.data == "atom" or item.data == "true" or item.data == "false")
-				assert(len(item.children) == 1)
-				self.label = item.children[0].value
-				self.is_atom = True
-				self.atoms.add(self.label)
+				pending = [child for child in node.children if child._atoms is None]
+				if pending:
+					stack.extend(pending)
+				else:
+					node._atoms = set().union(*(child._atoms for child in node.children))
+					stack.pop()
+		return self._atoms
 
 	def __repr__(self):
-		string = (self.depth * " ") + ("-" if self.negation else "+") + " " + self.label + "\n"
-		for formula in self.children:
-			string += str(formula)
+		string = ""
+		stack = [(self, 0)]
+		while stack:
+			formula, depth = stack.pop()
+			string += (depth * " ") + ("-" if formula.negation else "+") + " " + formula.label + "\n"
+			stack.extend((child, depth+1) for child in reversed(formula.children))
 		return string
 
 	def to_nnf(self):
-		if self.is_atom:
-			return
-		if not self.negation:
-			return
-		self.negation = False
-		if self.label == "&&":
-			self.label = "||"
-			for formula in self.children:
-				formula.negation = not formula.negation
-				formula.to_nnf()
-		elif self.label == "||":
-			self.label = "&&"
-			for formula in self.children:
-				formula.negation = not formula.negation
-				formula.to_nnf()
-		elif self.label == "=>":
-			self.label = "&&"
-			assert(len(self.children) == 2)
-			l = self.children[0]
-			r = self.children[1]
-			r.negation = not r.negation
-			l.to_nnf()
-			r.to_nnf()
-		elif self.label == "<=>":
-			self.label = "^^"
-			for formula in self.children:
-				formula.negation = not formula.negation
-				formula.to_nnf()
-		elif self.label == "^^":
-			self.label = "<=>"
-			for formula in self.children:
-				formula.negation = not formula.negation
-				formula.to_nnf()
+		stack = [self]
+		while stack:
+			formula = stack.pop()
+			if formula.is_atom or not formula.negation:
+				continue
+			formula.negation = False
+			if formula.label == "&&":
+				formula.label = "||"
+			elif formula.label == "||":
+				formula.label = "&&"
+			elif formula.label == "=>":
+				formula.label = "&&"
+				assert(len(formula.children) == 2)
+				formula.children[1].negation = not formula.children[1].negation
+				stack.extend(reversed(formula.children))
+				continue
+			elif formula.label == "<=>":
+				formula.label = "^^"
+			elif formula.label == "^^":
+				formula.label = "<=>"
+			for child in formula.children:
+				child.negation = not child.negation
+			stack.extend(reversed(formula.children))
 
 	# Returns a CNF which is equisatisfiable with the formula via the Tseitin encoding.
 	def to_cnf(self, atom_vars, var_counter, unique=False, occs={}):
 		clauses = []
-		if self.is_atom:
-			return clauses
+		stack = [self]
+		while stack:
+			node = stack.pop()
+			if node.is_atom:
+				continue
+			node.tseitin_clauses(clauses, atom_vars, var_counter, unique, occs)
+			stack.extend(reversed(node.children))
+		return clauses
+
+	# Assigns the Tseitin variables of the children and appends the clauses defining this node.
+	def tseitin_clauses(self, clauses, atom_vars, var_counter, unique=False, occs={}):
 		for formula in self.children:
 			if not formula.is_atom:
 				formula.tseitin_var = next(var_counter)
@@ -151,41 +160,282 @@ class Formula:
 				else:
 					formula.tseitin_var = atom_vars[formula.label]
 			formula.tseitin_lit = (-1 if formula.negation else 1) * formula.tseitin_var
-		clauses = []
-		if self.label == "&&":
-			clauses.append([self.tseitin_var] + [-formula.tseitin_lit for formula in self.children])
-			for formula in self.children:
-				clauses.append([-self.tseitin_var, formula.tseitin_lit])
-		elif self.label == "||":
-			clauses.append([-self.tseitin_var] + [formula.tseitin_lit for formula in self.children])
-			for formula in self.children:
-				clauses.append([self.tseitin_var, -formula.tseitin_lit])
-		elif self.label == "=>":
-			assert(len(self.children) == 2)
-			l = self.children[0]
-			r = self.children[1]
-			clauses.append([-self.tseitin_var, -l.tseitin_lit, r.tseitin_lit])
-			clauses.append([self.tseitin_var, l.tseitin_lit])
-			clauses.append([self.tseitin_var, -r.tseitin_lit])
-		elif self.label == "<=>":
-			assert(len(self.children) == 2)
-			l = self.children[0]
-			r = self.children[1]
-			clauses.append([self.tseitin_var, l.tseitin_lit, r.tseitin_lit])
-			clauses.append([self.tseitin_var, -l.tseitin_lit, -r.tseitin_lit])
-			clauses.append([-self.tseitin_var, l.tseitin_lit, -r.tseitin_lit])
-			clauses.append([-self.tseitin_var, -l.tseitin_lit, r.tseitin_lit])
-		elif self.label == "^^":
-			assert(len(self.children) == 2)
-			l = self.children[0]
-			r = self.children[1]
-			clauses.append([-self.tseitin_var, l.tseitin_lit, r.tseitin_lit])
-			clauses.append([-self.tseitin_var, -l.tseitin_lit, -r.tseitin_lit])
-			clauses.append([self.tseitin_var, l.tseitin_lit, -r.tseitin_lit])
-			clauses.append([self.tseitin_var, -l.tseitin_lit, r.tseitin_lit])
-		for formula in self.children:
-			clauses.extend(formula.to_cnf(atom_vars, var_counter, unique, occs))
-		return clauses
+		gate_clauses(self.label, self.tseitin_var, [formula.tseitin_lit for formula in self.children], clauses)
+
+# Directions of a gate definition: POSITIVE is var => label(lits), NEGATIVE is !var => !label(lits).
+POSITIVE, NEGATIVE, BOTH = 1, 2, 3
+
+def flip(directions):
+	return ((directions & POSITIVE) << 1) | ((directions & NEGATIVE) >> 1)
+
+# Directions needed of the i-th child of a gate whose clauses are encoded in the given directions.
+def child_directions(label, i, directions):
+	if label == "<=>" or label == "^^":
+		return BOTH
+	if label == "=>" and i == 0:
+		return flip(directions)
+	return directions
+
+# Appends the Tseitin clauses defining var <=> label(lits) for a connective label, or only
+# the clauses of the given directions (Plaisted-Greenbaum).
+def gate_clauses(label, var, lits, clauses, directions=BOTH):
+	pos = directions & POSITIVE
+	neg = directions & NEGATIVE
+	if label == "&&":
+		if neg:
+			clauses.append([var] + [-lit for lit in lits])
+		if pos:
+			for lit in lits:
+				clauses.append([-var, lit])
+	elif label == "||":
+		if pos:
+			clauses.append([-var] + lits)
+		if neg:
+			for lit in lits:
+				clauses.append([var, -lit])
+	elif label == "=>":
+		assert(len(lits) == 2)
+		l, r = lits
+		if pos:
+			clauses.append([-var, -l, r])
+		if neg:
+			clauses.append([var, l])
+			clauses.append([var, -r])
+	elif label == "<=>":
+		assert(len(lits) == 2)
+		l, r = lits
+		if neg:
+			clauses.append([var, l, r])
+			clauses.append([var, -l, -r])
+		if pos:
+			clauses.append([-var, l, -r])
+			clauses.append([-var, -l, r])
+	elif label == "^^":
+		assert(len(lits) == 2)
+		l, r = lits
+		if pos:
+			clauses.append([-var, l, r])
+			clauses.append([-var, -l, -r])
+		if neg:
+			clauses.append([var, l, -r])
+			clauses.append([var, -l, r])
+
+# Returns the literal of a formula in a hash-consed DAG, giving each distinct subformula a
+# single Tseitin variable. `gate_vars` maps (label, children) of every gate encoded so far to
+# its variable and `gate_directions` to the directions whose clauses were already appended;
+# both are shared by all formulas of a knowledge base. A formula and its negation share the
+# variable and differ in the sign of the literal.
+#
+# With `polarity`, only the directions needed for the returned literal to imply the formula
+# are encoded (Plaisted-Greenbaum): the root literal is only ever asserted true, && and ||
+# pass the direction on to their children, the left side of => flips it, and <=> and ^^
+# need both directions of their children. A gate reached with a new direction later on gets
+# the missing clauses then. This is sound for satisfiability checks that assert literals
+# true, but the literal is no longer equivalent to the formula when it is false.
+#
+# If `gate_clause_ranges` is given, the (directions, first, end) clause ids appended for each
+# gate are recorded in it, so the clauses a formula depends on can be collected later.
+def shared_tseitin_lit(formula, atom_vars, var_counter, gate_vars, gate_directions, clauses, polarity=False, gate_clause_ranges=None):
+	def lit(node):
+		if node.is_atom:
+			var = atom_vars[node.label]
+		else:
+			var = gate_vars.get((node.label, node.children))
+			if var is None:
+				var = gate_vars[(node.label, node.children)] = next(var_counter)
+		return -var if node.negation else var
+	root_lit = lit(formula)
+	if not polarity:
+		needed = BOTH
+	else:
+		needed = NEGATIVE if formula.negation else POSITIVE
+	stack = [(formula, needed)]
+	while stack:
+		node, needed = stack.pop()
+		if node.is_atom:
+			continue
+		key = (node.label, node.children)
+		done = gate_directions.get(key, 0)
+		new = needed & ~done
+		if not new:
+			continue
+		gate_directions[key] = done | new
+		first = len(clauses)
+		gate_clauses(node.label, gate_vars[key], [lit(child) for child in node.children], clauses, new)
+		if gate_clause_ranges is not None:
+			gate_clause_ranges.setdefault(key, []).append((new, first, len(clauses)))
+		for i, child in enumerate(node.children):
+			if child.is_atom:
+				continue
+			child_needed = child_directions(node.label, i, new)
+			stack.append((child, flip(child_needed) if child.negation else child_needed))
+	return root_lit
+
+# Returns the ids of the clauses recorded in `gate_clause_ranges` by shared_tseitin_lit that
+# the literal of the formula depends on: the clauses of every gate below it, in the directions
+# it needs them.
+def dependent_clauses(formula, gate_clause_ranges, polarity=False):
+	if not polarity:
+		needed = BOTH
+	else:
+		needed = NEGATIVE if formula.negation else POSITIVE
+	collected = {}
+	ids = []
+	stack = [(formula, needed)]
+	while stack:
+		node, needed = stack.pop()
+		if node.is_atom:
+			continue
+		key = (node.label, node.children)
+		done = collected.get(key, 0)
+		new = needed & ~done
+		if not new:
+			continue
+		collected[key] = done | new
+		for directions, first, end in gate_clause_ranges[key]:
+			if directions & new:
+				ids.extend(range(first, end))
+		for i, child in enumerate(node.children):
+			if child.is_atom:
+				continue
+			child_needed = child_directions(node.label, i, new)
+			stack.append((child, flip(child_needed) if child.negation else child_needed))
+	return ids
+
+# Encodes a single formula string with shared_tseitin_lit, e.g. a query against an already
+# encoded knowledge base. Atoms missing from atom_vars (including the constants) get fresh
+# variables from var_counter and are added to atom_vars, so formulas of one query encoded
+# with the same mapping share them. Returns the literal of the formula.
+def encode_formula(text, atom_vars, var_counter, clauses, polarity=False):
+	formula = parse_formula(text, FormulaTable())
+	for atom in formula.atoms:
+		if atom not in atom_vars:
+			atom_vars[atom] = next(var_counter)
+			if atom == top:
+				clauses.append([atom_vars[atom]])
+			elif atom == bot:
+				clauses.append([-atom_vars[atom]])
+	return shared_tseitin_lit(formula, atom_vars, var_counter, {}, {}, clauses, polarity)
+
+# Hash-consing table: structurally identical subformulas are built once and shared, so a
+# subformula such as !arg_b247 is a single node however often it occurs. Nodes of a table
+# must not be modified (in particular not by to_nnf).
+class FormulaTable:
+
+	def __init__(self):
+		self.nodes = {}
+
+	def make(self, label, children=(), negation=False):
+		key = (label, negation, children)
+		node = self.nodes.get(key)
+		if node is None:
+			node = self.nodes[key] = Formula(label, children, negation)
+		return node
+
+def tokenize(text):
+	return token_regex.findall(text)
+
+# Parses a formula string into a Formula without recursion (shunting-yard). Parentheses only
+# group: "(A)" is the node of A and "!" toggles the negation of its operand, so "!(!(A))" is
+# the atom A. Chains of the same n-ary connective are flattened into one node unless a part is
+# grouped by parentheses, as in the grammar above. If a FormulaTable is given, the nodes are
+# taken from it, so identical subformulas are shared.
+def parse_formula(text, table=None):
+	make = table.make if table is not None else Formula
+	operands = []  # formulas, or lists [connective, children...] for chains that may still be extended
+	operators = []  # "(", "!" or a binary connective
+	expect_operand = True
+
+	def close(operand):
+		if isinstance(operand, list):
+			return make(operand[0], tuple(operand[1:]))
+		return operand
+
+	def reduce():
+		op = operators.pop()
+		if op == "!":
+			formula = close(operands.pop())
+			operands.append(make(formula.label, formula.children, not formula.negation))
+			return
+		r = close(operands.pop())
+		l = operands.pop()
+		if isinstance(l, list) and l[0] == op:
+			l.append(r)
+			operands.append(l)
+		elif op in nary_connectives:
+			operands.append([op, close(l), r])
+		else:
+			operands.append(make(op, (close(l), r)))
+
+	for token in tokenize(text):
+		if expect_operand:
+			if token == "!" or token == "(":
+				operators.append(token)
+			elif token != top and token != bot and token[0] not in name_start:
+				raise ValueError("Unexpected " + repr(token) + " in formula: " + text)
+			else:
+				operands.append(make(token))
+				expect_operand = False
+				while operators and operators[-1] == "!":
+					reduce()
+		elif token == ")":
+			while operators and operators[-1] != "(":
+				reduce()
+			if not operators:
+				raise ValueError("Unbalanced ')' in formula: " + text)
+			operators.pop()
+			operands[-1] = close(operands[-1])
+			while operators and operators[-1] == "!":
+				reduce()
+		elif token in all_connectives:
+			while operators and operators[-1] in all_connectives and precedence[operators[-1]] >= precedence[token]:
+				if operators[-1] == token and token not in nary_connectives:
+					raise ValueError("Connective " + repr(token) + " is not associative, add parentheses in formula: " + text)
+				reduce()
+			operators.append(token)
+			expect_operand = True
+		else:
+			raise ValueError("Unexpected " + repr(token) + " in formula: " + text)
+	if expect_operand:
+		raise ValueError("Unexpected end of formula: " + text)
+	while operators:
+		if operators[-1] == "(":
+			raise ValueError("Unbalanced '(' in formula: " + text)
+		reduce()
+	return close(operands[0])
+
+# Evaluates a parsed formula under an assignment of its atoms (a dict from atom to bool, atoms
+# missing from it are false), without recursion. Shared nodes of a FormulaTable are evaluated
+# once per call.
+def evaluate(formula, assignment):
+	values = {}
+	stack = [formula]
+	while stack:
+		node = stack[-1]
+		if id(node) in values:
+			stack.pop()
+			continue
+		if node.is_atom:
+			value = node.label == top if node.label == top or node.label == bot else assignment.get(node.label, False)
+		else:
+			pending = [child for child in node.children if id(child) not in values]
+			if pending:
+				stack.extend(pending)
+				continue
+			children = [values[id(child)] for child in node.children]
+			if node.label == "&&":
+				value = all(children)
+			elif node.label == "||":
+				value = any(children)
+			elif node.label == "=>":
+				value = not children[0] or children[1]
+			elif node.label == "<=>":
+				value = children[0] == children[1]
+			else:
+				value = children[0] != children[1]
+		values[id(node)] = value != node.negation
+		stack.pop()
+	return values[id(formula)]
 
 class CNFFormula:
 
@@ -229,33 +479,83 @@ class CNFFormula:
 			new_clauses.append(new_clause)
 		return new_clauses
 
+# The stable semantics encodings of argumentation frameworks (data/ARG) consist of atoms and
+# formulas (x<=>!y&&!z...) stating that an argument is accepted iff none of its attackers is.
+# stable_regex recognizes the general shape (x<=>l1&&...&&ln) with literals li = a or !a.
+stable_regex = re.compile(r"\(([A-Za-z_][A-Za-z0-9_]*)<=>(!?[A-Za-z_][A-Za-z0-9_]*(?:&&!?[A-Za-z_][A-Za-z0-9_]*)*)\)")
+
+class StableFormula:
+
+	__slots__ = ("text", "head", "body", "atoms", "tseitin_var", "tseitin_lit")
+	is_atom = False
+	negation = False
+
+	def __init__(self, text, head, body):
+		self.text = text
+		self.head = head
+		self.body = body
+		self.atoms = {head}.union(atom for atom, _ in body)
+
+	def body_lits(self, atom_vars):
+		return [atom_vars[atom] if positive else -atom_vars[atom] for atom, positive in self.body]
+
+	def __repr__(self):
+		return self.text
+
+	# Appends the clauses of var => (head <=> l1 && ... && ln): var => (!head || li) for each
+	# literal and var => (head || !l1 || ... || !ln). Only the positive direction is encoded, as
+	# in the Plaisted-Greenbaum encoding, so no gate variables are needed. If the body is
+	# shared with other formulas and already defined by `body_var`, var => (head <=> body_var).
+	def stable_clauses(self, var, atom_vars, clauses, body_var=None):
+		head = atom_vars[self.head]
+		lits = [body_var] if body_var is not None else self.body_lits(atom_vars)
+		for lit in lits:
+			clauses.append([-var, -head, lit])
+		clauses.append([-var, head] + [-lit for lit in lits])
+
+# Returns a StableFormula for a formula string of the shape (x<=>l1&&...&&ln), or None.
+def parse_stable_formula(text):
+	match = stable_regex.fullmatch(text)
+	if match is None:
+		return None
+	body = tuple((lit.lstrip("!"), not lit.startswith("!")) for lit in match.group(2).split("&&"))
+	return StableFormula(text, match.group(1), body)
+
 class KnowledgeBase:
 
-	def __init__(self, input_file=None, file_format="pl", nnf=False):
+	# With `share`, formulas are parsed into a hash-consed DAG (see FormulaTable) and the
+	# global encoding gives every distinct subformula one Tseitin variable. The NNF
+	# transformation modifies nodes in place and therefore always uses unshared trees.
+	# With `stable`, formulas of the stable semantics shape (see StableFormula) are not parsed
+	# and the global pg encoding emits their clauses directly; other encodings parse them on demand.
+	def __init__(self, input_file=None, file_format="pl", nnf=False, share=True, stable=True):
 		self.format = file_format
 		self.formulas = []
 		self.atoms = set()
 		self.var_counter = itertools.count(1)
+		self.table = FormulaTable() if share and not nnf and self.format == "pl" else None
 		if self.format == "pl":
-			parser = lark.Lark(grammar, parser="lalr")
 			for i, line in enumerate(input_file):
 				if len(line) == 0:
 					continue
-				res = parser.parse(line)
-				self.formulas.append(Formula(res))
+				formula = parse_stable_formula(line) if stable and not nnf else None
+				self.formulas.append(formula if formula is not None else parse_formula(line, self.table))
 			if nnf:
 				for formula in self.formulas:
 					formula.to_nnf()
 		elif self.format == "cnf":
 			for line in input_file:
-				if line.startswith("p") or line.startswith("c"):
+				if not line.strip() or line.startswith("p") or line.startswith("c"):
 					continue
 				clause = list(map(int, line.split()))[:-1]
 				self.formulas.append(CNFFormula([clause]))
 		elif self.format == "gcnf":
 			clause_groups = {}
+			# Group {0} holds the hard clauses and may be missing
+			self.hard = CNFFormula([])
+			self.hard.is_hard = True
 			for i, line in enumerate(input_file):
-				if line.startswith("p") or line.startswith("c"):
+				if not line.strip() or line.startswith("p") or line.startswith("c"):
 					continue
 				head, *tail = line.split()
 				index = int(head[1:-1])
@@ -264,6 +564,7 @@ class KnowledgeBase:
 					clause_groups[index].append(clause)
 				else:
 					clause_groups[index] = [clause]
+			self.group_indices = []
 			for index in sorted(clause_groups.keys()):
 				if index == 0:
 					self.hard = CNFFormula(clause_groups[index])
@@ -271,6 +572,7 @@ class KnowledgeBase:
 					self.atoms.update(self.hard.atoms)
 				else:
 					self.formulas.append(CNFFormula(clause_groups[index]))
+					self.group_indices.append(index)
 			# for now, add atoms from hard constraints to formula atoms
 			if self.hard is not None:
 				for formula in self.formulas:
@@ -279,29 +581,78 @@ class KnowledgeBase:
 			self.atoms.update(formula.atoms)
 		self.atoms = sorted(list(self.atoms))
 
-	# Returns a group CNF encoding of a given knowledge base. If `atom_names` is
+	# Returns a group CNF encoding of a given knowledge base as a ClauseStore of hard clauses
+	# and a list of soft literals, one per formula. If `atom_names` is
 	# - "global": considers each formula in the knowledge base as is;
 	# - "local":  considers a copy F' of each formula F in the knowledge base, replacing atom x is by variable x_F;
 	# - "unique": considers a copy Fo of each formula F in the knowledge base, replacing ith occurrence of atom x by variable x_i.
-	def to_group_cnf(self, atom_names="global"):
-		hard_clauses = []
+	# The `encoding` of the global formulas is either "tseitin" (each soft literal is equivalent
+	# to its formula) or "pg" (Plaisted-Greenbaum, each soft literal only implies its formula,
+	# see shared_tseitin_lit), which is enough when soft literals are only asserted true.
+	def to_group_cnf(self, atom_names="global", encoding="tseitin"):
+		hard_clauses = ClauseStore()
 		soft_lits = []
+		self.formula_clause_ranges = None
 		self.atom_vars = { atom : next(self.var_counter) for atom in self.atoms }
 		if self.format == "pl":
 			if top in self.atoms:
 				hard_clauses.append([self.atom_vars[top]])
 			if bot in self.atoms:
 				hard_clauses.append([-self.atom_vars[bot]])
+		if encoding not in ["tseitin", "pg"]:
+			raise ValueError("Unknown encoding " + encoding + ", expected tseitin or pg")
+		if atom_names != "global" and (self.table is not None or encoding != "tseitin"):
+			raise ValueError("The " + atom_names + " encoding needs a separate node per occurrence and the tseitin encoding, create the KnowledgeBase with share=False")
+		if atom_names != "global" or encoding != "pg":
+			self.formulas = [parse_formula(formula.text, self.table) if isinstance(formula, StableFormula) else formula for formula in self.formulas]
 		if atom_names == "global":
 			if self.format == "gcnf":
 				hard_clauses.extend(self.hard.to_cnf(self.atom_vars, self.var_counter))
+			self.gate_vars = {}
+			self.gate_directions = {}
+			shared = self.format == "pl" and (self.table is not None or encoding == "pg")
+			self.gate_clause_ranges = {} if shared else None
+			self.stable_clause_ranges = {}
+			# The (first, end) clause ranges of every formula, None where they follow from gate_clause_ranges
+			self.formula_clause_ranges = []
+			self.num_base_clauses = len(hard_clauses)
+			# A body shared by several stable formulas gets one && gate, as in the shared DAG
+			stable_formulas = { formula.text : formula for formula in self.formulas if isinstance(formula, StableFormula) }
+			body_counts = collections.Counter(formula.body for formula in stable_formulas.values())
+			body_ranges = {}
 			for formula in self.formulas:
-				if not formula.is_atom:
-					formula.tseitin_var = next(self.var_counter)
+				if isinstance(formula, StableFormula):
+					if formula.text not in self.stable_clause_ranges:
+						ranges = []
+						body_var = None
+						if len(formula.body) > 1 and body_counts[formula.body] > 1:
+							if formula.body not in body_ranges:
+								body_var = next(self.var_counter)
+								first = len(hard_clauses)
+								gate_clauses("&&", body_var, formula.body_lits(self.atom_vars), hard_clauses)
+								body_ranges[formula.body] = (body_var, first, len(hard_clauses))
+							body_var, first, end = body_ranges[formula.body]
+							ranges.append((first, end))
+						var = next(self.var_counter)
+						first = len(hard_clauses)
+						formula.stable_clauses(var, self.atom_vars, hard_clauses, body_var)
+						ranges.append((first, len(hard_clauses)))
+						self.stable_clause_ranges[formula.text] = (var, ranges)
+					formula.tseitin_var = formula.tseitin_lit = self.stable_clause_ranges[formula.text][0]
+					self.formula_clause_ranges.append(self.stable_clause_ranges[formula.text][1])
+				elif shared:
+					formula.tseitin_lit = shared_tseitin_lit(formula, self.atom_vars, self.var_counter, self.gate_vars, self.gate_directions, hard_clauses, encoding == "pg", self.gate_clause_ranges)
+					formula.tseitin_var = abs(formula.tseitin_lit)
+					self.formula_clause_ranges.append(None)
 				else:
-					formula.tseitin_var = self.atom_vars[formula.label]
-				formula.tseitin_lit = (-1 if formula.negation else 1) * formula.tseitin_var
-				hard_clauses.extend(formula.to_cnf(self.atom_vars, self.var_counter))
+					if not formula.is_atom:
+						formula.tseitin_var = next(self.var_counter)
+					else:
+						formula.tseitin_var = self.atom_vars[formula.label]
+					formula.tseitin_lit = (-1 if formula.negation else 1) * formula.tseitin_var
+					first = len(hard_clauses)
+					hard_clauses.extend(formula.to_cnf(self.atom_vars, self.var_counter))
+					self.formula_clause_ranges.append([(first, len(hard_clauses))])
 				soft_lits.append(formula.tseitin_lit)
 		elif atom_names == "local":
 			for formula in self.formulas:
@@ -338,8 +689,23 @@ class KnowledgeBase:
 				hard_clauses.extend(formula.to_cnf(self.atom_vars, self.var_counter, True, occs))
 				soft_lits.append(formula.tseitin_lit)
 			self.occurrences = occs
+		self.encoding = encoding
 		return hard_clauses, soft_lits
 
+	# Returns for every formula the ids of the hard clauses its soft literal depends on, after
+	# a global to_group_cnf. The first num_base_clauses clauses (the constants, or the hard
+	# group of a gcnf knowledge base) are needed by every subset and not included.
+	def clause_fragments(self):
+		if getattr(self, "formula_clause_ranges", None) is None:
+			raise ValueError("Clause fragments need a global to_group_cnf")
+		fragments = []
+		for formula, ranges in zip(self.formulas, self.formula_clause_ranges):
+			if ranges is None:
+				fragments.append(dependent_clauses(formula, self.gate_clause_ranges, self.encoding == "pg"))
+			else:
+				fragments.append([i for first, end in ranges for i in range(first, end)])
+		return fragments
+
 def print_gcnf(kb):
 	hard, soft = kb.to_group_cnf()
 	n_vars = next(kb.var_counter)-1
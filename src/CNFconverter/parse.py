@@ -8,14 +8,18 @@ import sys
 from src.CNFconverter.core import KnowledgeBase
 
 class CNFConverter:
-    def __init__(self, verbose=False):
+    def __init__(self, verbose=False, encoding="tseitin"):
         """
         Initialize the CNFConverter with an option to enable or disable verbose output.
 
         Args:
             verbose (bool): If True, enables printing of CNF to the console. Default is False.
+            encoding (str): "tseitin" for the full Tseitin encoding or "pg" for the polarity-aware
+                            Plaisted-Greenbaum encoding, which only keeps the implications needed
+                            to check satisfiability. Default is "tseitin".
         """
         self.verbose = verbose
+        self.encoding = encoding
 
     def generate_output_filename(self, input_filename):
         """
@@ -43,24 +47,20 @@ class CNFConverter:
             output_filename = self.generate_output_filename(input_filename)
 
         kb = KnowledgeBase(open(input_filename).read().split("\n"))
-        clauses, lits = kb.to_group_cnf()
+        clauses, lits = kb.to_group_cnf(encoding=self.encoding)
 
         n_vars = next(kb.var_counter)-1
         n_clauses = len(clauses) + len(lits)
 
+        header = f"p cnf {n_vars} {n_clauses}\n".encode()
+        body = clauses.to_dimacs(units=lits)
+
         if self.verbose:
-            print("p cnf", n_vars, n_clauses)
-            for clause in clauses:
-                print(" ".join(map(str, clause)) + " 0")
-            for lit in lits:
-                print(str(lit) + " 0")
-
-        with open(output_filename, 'w') as file:
-            file.write(f"p cnf {n_vars} {n_clauses}\n")
-            for clause in clauses:
-                file.write(" ".join(map(str, clause)) + " 0\n")
-            for lit in lits:
-                file.write(str(lit) + " 0\n")
+            print((header + body).decode(), end="")
+
+        with open(output_filename, 'wb') as file:
+            file.write(header)
+            file.write(body)
 
         if self.verbose:
             print(f"CNF format saved to {output_filename}")
@@ -69,12 +69,13 @@ class CNFConverter:
 # Check for proper command line arguments and initialize CNFConverter
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python script.py <input_filename> [<output_filename>] [--verbose]")
+        print("Usage: python script.py <input_filename> [<output_filename>] [--verbose] [--pg]")
         sys.exit(1)
 
     input_filename = sys.argv[1]
     output_filename = sys.argv[2] if len(sys.argv) > 2 and not sys.argv[2].startswith('--') else None
     verbose = '--verbose' in sys.argv
+    encoding = 'pg' if '--pg' in sys.argv else 'tseitin'
 
-    converter = CNFConverter(verbose=verbose)
+    converter = CNFConverter(verbose=verbose, encoding=encoding)
     converter.convert_to_cnf(input_filename, output_filename)
@@ -1,8 +1,12 @@
 import logging
+import os
 import subprocess
-from .kernelstrategy import KernelStrategy
+from collections import Counter
+from .kernelstrategy import KernelStrategy, is_contradiction
+from src.CNFconverter.core import FormulaTable, evaluate, parse_formula, top, bot
 from src.CNFconverter.parse import CNFConverter
 from src.structs.dataset import DataSet
+from src.structs.fingerprint import SubsetCache
 
 # Configure logging to file
 logging.basicConfig(filename='log/kernel_operations.log', # Log file name
@@ -11,29 +15,52 @@ logging.basicConfig(filename='log/kernel_operations.log', # Log file name
                     level=logging.CRITICAL)
 
 class ExpandShrink(KernelStrategy):
-    def __init__(self, window_size=1, divide_and_conquer=False):  
+    def __init__(self, window_size=1, divide_and_conquer=False, binary_search=False, encoding="tseitin", compiled=None, model_rotation=False):  
         # Default to the basic expand-shrink method with window_size = 1 and without Divide_and_conquer
         self.window_size = window_size
         self.div_conq = divide_and_conquer  # Set to FALSE PER DEFAULT UNTIL STRATEGY IMPLEMENTED
+        self.binary_search = binary_search  # Galloping + binary search expand instead of the sliding window
+        self.encoding = encoding  # CNF encoding used by cn, "tseitin" or "pg" (Plaisted-Greenbaum)
+        self.compiled = compiled  # CompiledKnowledgeBase of the dataset; cn then copies its clause fragments
+        self.model_rotation = model_rotation  # Mark elements necessary by rotating the counter models of shrink (opt-in)
+        self.consistent_subsets = []  # Subset caches of inconsistent(), used when alpha is a contradiction
+        self.inconsistent_subsets = []
+        self.entailment_cache = SubsetCache()  # Results of cn by dataset fingerprint and alpha
     
     def find_kernel(self, dataset, alpha):
         if self.cn(dataset, alpha):
-            # Starts the kernel finding process
-            logging.debug(f"Finding kernel for {len(dataset.get_elements())} elements of dataset = {dataset.get_elements()}")
-            return self.expand(dataset, alpha)
+            return self.extract_kernel(dataset, alpha)
         else:
             logging.debug(f"Dataset does not entail {alpha}, kernel = empty")
             return None
+
+    def extract_kernel(self, dataset, alpha):
+        """
+        Find a kernel within a dataset that is already known to entail alpha, without checking it again.
+
+        Args:
+            dataset (DataSet): The dataset, which entails alpha.
+            alpha (str): The formula the kernel is computed for.
+
+        Returns:
+            DataSet: The kernel.
+        """
+        # Starts the kernel finding process
+        logging.debug(f"Finding kernel for {len(dataset.get_elements())} elements of dataset = {dataset.get_elements()}")
+        if self.binary_search:
+            return self.galloping_expand(dataset, alpha)
+        return self.expand(dataset, alpha)
     
-    def expand(self, B_dataset, alpha):
-        # This function attempts to expand and then shrink the dataset around the concept 'alpha'
+    def expand(self, B_dataset, alpha, low=0):
+        # This function attempts to expand and then shrink the dataset around the concept 'alpha'.
+        # elements[:low] is known not to entail alpha, so the windows start behind it
         elements = B_dataset.get_elements()
         logging.info(f"{len(elements)} ELEMENTS: {elements}")  # Shows the elements being processed
-        B_prime = DataSet()
+        B_prime = DataSet(elements=elements[:low])
 
         counter = 0
 
-        for start in range(0, len(elements), self.window_size):
+        for start in range(low, len(elements), self.window_size):
             counter += 1
             if counter > len(elements) + 5:
                 logging.warning("BREAK, MAX ITERATION, RETURNING NONE.")  # Logs a break in iteration
@@ -55,18 +82,122 @@ class ExpandShrink(KernelStrategy):
                     return self.divide_and_conquer(B_prime, alpha)  # Divide and conquer strategy
                 else:
                     return self.shrink(B_prime, alpha)  # Regular kernel black box strategy
+
+    def galloping_expand(self, B_dataset, alpha, low=0, checked=True):
+        """
+        Find the shortest prefix of the dataset that entails alpha with O(log n) calls to cn.
+
+        The prefix length is doubled (1, 2, 4, ...) until the prefix entails alpha, then the
+        exact length is located by binary search between the last failing and the first
+        entailing length. find_kernel has already checked that the whole dataset entails alpha,
+        so the full length is used as the upper bound without another call. Prefixes are built
+        by slicing, which avoids the membership scans of B_prime.add_element.
+
+        Args:
+            B_dataset (DataSet): The dataset to expand over, in traversal order.
+            alpha (str): The formula that should be entailed.
+            low (int, optional): A prefix length known not to entail alpha; the gallop starts behind it.
+            checked (bool, optional): False if it is not known yet whether the whole dataset entails alpha.
+
+        Returns:
+            DataSet: The kernel found by shrinking the shortest entailing prefix, None if the
+            dataset does not entail alpha (only with checked=False).
+        """
+        elements = B_dataset.get_elements()
+        n = len(elements)
+        logging.info(f"{n} ELEMENTS: {elements}")
+
+        # Galloping phase: invariant elements[:low] does not entail alpha
+        start = low
+        high = low + 1
+        while high < n:
+            logging.debug(f"GALLOP: checking prefix of length {high}")
+            if self.cn(DataSet(elements=elements[:high]), alpha):
+                break
+            low, high = high, 2 * high - start
+        else:
+            if not checked and not self.cn(B_dataset, alpha):
+                return None
+        high = min(high, n)
+
+        # Binary search phase: elements[:high] entails alpha, elements[:low] does not
+        while high - low > 1:
+            mid = (low + high) // 2
+            logging.debug(f"BINARY SEARCH: checking prefix of length {mid}, low = {low}, high = {high}")
+            if self.cn(DataSet(elements=elements[:mid]), alpha):
+                high = mid
+            else:
+                low = mid
+
+        B_prime = DataSet(elements=elements[:high])
+        logging.debug(f"B_PRIME with {len(B_prime.get_elements())} elements: {B_prime.get_elements()}")
+        if self.div_conq:
+            return self.divide_and_conquer(B_prime, alpha)
+        return self.shrink(B_prime, alpha)
             
+    def harvest_kernels(self, dataset, alpha, limit=None):
+        """
+        Collect pairwise disjoint kernels in one pass over the dataset.
+
+        After each kernel its elements are blocked and the expand phase continues on the
+        remaining elements behind the prefix that was known not to entail alpha, instead of
+        starting over: a prefix that does not entail alpha still does not once elements are
+        removed from it. Every kernel extends the prefix by at least its last element, so the
+        whole batch costs about as many expand checks as a single kernel plus the shrinks.
+
+        Args:
+            dataset (DataSet): The dataset to harvest from, in traversal order.
+            alpha (str): The formula the kernels are computed for.
+            limit (int, optional): The maximal number of kernels to collect.
+
+        Returns:
+            list of DataSet: The kernels in the order they were found; empty if the dataset does not entail alpha.
+        """
+        remaining = dataset.get_elements()
+        kernels = []
+        low = 0
+        while limit is None or len(kernels) < limit:
+            candidate = DataSet(elements=remaining, atom_index=dataset.atom_index)
+            if self.binary_search:
+                kernel = self.galloping_expand(candidate, alpha, low, checked=False)
+            else:
+                kernel = self.expand(candidate, alpha, low)
+            if kernel is None:
+                break
+            kernels.append(kernel)
+            blocked = set(kernel.get_elements())
+            if not blocked:
+                break
+            logging.info(f"HARVEST: kernel {len(kernels)} with {len(blocked)} elements: {kernel.get_elements()}")
+            # The last kernel element lies in the last window of the expand phase, which started behind a failing prefix
+            last = max(i for i, element in enumerate(remaining) if element in blocked)
+            failing = max(0, last + 1 - (1 if self.binary_search else self.window_size))
+            low = sum(1 for element in remaining[:failing] if element not in blocked)
+            remaining = [element for element in remaining if element not in blocked]
+        return kernels
+
     def shrink(self, B_dataset, alpha):
         # This is the core function for finding the kernel using either a normal approach or divide and conquer
         i = 0
         max_iterations = len(B_dataset.get_elements()) + 5  # Temporary limit for debugging
         current_iteration = 0
+        # Group CNF elements are clause groups, not formulas, so their models cannot be rotated
+        rotate = self.model_rotation and (self.compiled is None or self.compiled.file_format == "pl")
+        necessary = set()  # Elements proven necessary by model rotation, they are never checked
+        if rotate:
+            # The formulas are parsed once; remaining counts the copies of each line still in B
+            formulas, negated_alpha, occurrences = self.parse_for_rotation(B_dataset.get_elements(), alpha)
+            remaining = Counter(B_dataset.get_elements())
         while i < len(B_dataset.get_elements()):
             if current_iteration > max_iterations:
                 logging.error("Forced break for debugging.")  # Error logged if max iterations reached
                 break
             current_iteration += 1
             element = B_dataset.get_elements()[i]
+            if element in necessary:
+                logging.debug(f"SHRINK: {element} is necessary by model rotation, keeping it")
+                i += 1
+                continue
             logging.info(f"Checking line: {element} with index: {i}")  # Info about current element and index
             cloned_B_dataset = B_dataset.clone()
             logging.debug(f"Removing element: {element}")  # Debug log for element removal
@@ -74,9 +205,17 @@ class ExpandShrink(KernelStrategy):
             logging.debug(f"B with {len(cloned_B_dataset.get_elements())} elements = {cloned_B_dataset.get_elements()}")  # Debug log for current dataset state
 
             # Check if alpha in Cn(B - {beta}, alpha)
-            if self.cn(cloned_B_dataset, alpha):
+            if rotate:
+                entailed, model = self.counter_model(cloned_B_dataset, alpha)
+                if model is not None:
+                    necessary |= self.rotate_model(model, formulas, negated_alpha, occurrences, remaining, element)
+            else:
+                entailed = self.cn(cloned_B_dataset, alpha)
+            if entailed:
                 logging.info(f"SHRINK: CN = TRUE, removing: {element}")  # Info log for dataset shrink action
                 B_dataset.remove_element(element)
+                if rotate:
+                    remaining[element] -= 1
                 logging.debug(f"CONTINUE SHRINKING WITH {len(B_dataset.get_elements())} elements : {B_dataset.get_elements()}")  # Debug log for continued shrinking
                 # Do not increment i, since we want to check the new element at the same index after removal
             else:
@@ -86,6 +225,62 @@ class ExpandShrink(KernelStrategy):
         logging.info(f"Kernel output with {len(B_dataset.get_elements())} elements: {B_dataset.get_elements()}")  # Logs the final kernel output
         logging.info("KERNEL BLACKBOX FINISHED")  # Indicates the end of the kernel black box process
         return B_dataset
+
+    def parse_for_rotation(self, elements, alpha):
+        """
+        Parse the elements of a shrink and the negation of alpha once for all rotations of the shrink.
+
+        Returns:
+            tuple: (formulas, negated_alpha, occurrences), formulas mapping each element to its
+            parsed formula and occurrences each atom to the elements it occurs in.
+        """
+        table = FormulaTable()
+        formulas = {e: parse_formula(e, table) for e in elements}
+        negated_alpha = parse_formula("!(" + alpha + ")", table)
+        occurrences = {}
+        for e, formula in formulas.items():
+            for atom in formula.atoms:
+                occurrences.setdefault(atom, []).append(e)
+        return formulas, negated_alpha, occurrences
+
+    def rotate_model(self, model, formulas, negated_alpha, occurrences, remaining, element):
+        """
+        Find elements that every kernel within elements needs, by recursive model rotation.
+
+        The model satisfies all elements except element and the negation of alpha, which proves
+        that element is necessary. Flipping one atom of the falsified element so that it becomes
+        true and exactly one other element becomes false, while the negation of alpha stays
+        true, gives a model that proves the other element necessary as well, and the rotation
+        continues from there. A necessary element stays necessary in every subset of elements
+        that contains it, so shrink does not need to check it again. A line that is in the
+        current elements more than once is never the only falsified element.
+
+        Args:
+            model (dict): Maps each atom to its value in a model of the current elements without element and !alpha.
+            formulas, negated_alpha, occurrences: The parsed elements of the shrink, see parse_for_rotation.
+            remaining (Counter): The number of copies of each element among the current elements, which entail alpha.
+            element (str): The element falsified by the model.
+
+        Returns:
+            set: The elements proven necessary, including element.
+        """
+        necessary = {element}
+        stack = [(model, element)]
+        while stack:
+            model, falsified = stack.pop()
+            for atom in formulas[falsified].atoms:
+                if atom == top or atom == bot:
+                    continue
+                value = model.get(atom, False)
+                model[atom] = not value  # Flipped in place and restored, copied only when the rotation continues
+                if evaluate(formulas[falsified], model) and evaluate(negated_alpha, model):
+                    broken = [e for e in occurrences[atom] if e != falsified and remaining[e] and not evaluate(formulas[e], model)]
+                    if sum(remaining[e] for e in broken) == 1 and broken[0] not in necessary:
+                        logging.debug(f"ROTATION: flipping {atom} proves {broken[0]} necessary")
+                        necessary.add(broken[0])
+                        stack.append((dict(model), broken[0]))
+                model[atom] = value
+        return necessary
         
     def divide_and_conquer(self, B_dataset, alpha):
         #print(f"Checking B_dataset: {B_dataset.get_elements()}, cn: {self.cn(B_dataset, alpha)}")
@@ -126,7 +321,9 @@ class ExpandShrink(KernelStrategy):
         
         Clones the given dataset, adds the negation of alpha, and transforms it into CNF.
         Then calls MiniSat to solve the CNF. Interprets the output to determine if alpha
-        is a consequence of the dataset.
+        is a consequence of the dataset. With a compiled knowledge base, the precompiled
+        clauses of the elements are copied instead of converting the formulas again. For a
+        contradiction alpha this is the consistency check of inconsistent().
 
         Args:
             B_dataset (DataSet): The dataset containing elements to check against.
@@ -135,16 +332,28 @@ class ExpandShrink(KernelStrategy):
         Returns:
             bool: True if alpha is a consequence of the dataset, False otherwise.
         """
-        temp_file="tmp/temp_dimacs.cnf"
+        if is_contradiction(alpha):
+            return self.inconsistent(B_dataset)
 
-        # Clone B and add !alpha to check for entailment
-        B_copy = B_dataset.clone()
-        B_copy.add_element("!"+alpha)
+        found, entailed = self.entailment_cache.lookup(B_dataset, alpha)
+        if found:
+            logging.debug(f"Cached result: {alpha} is{'' if entailed else ' not'} in Cn({B_dataset.get_elements()})")
+            return entailed
+
+        temp_file=f"tmp/temp_dimacs_{os.getpid()}.cnf"  # One file per process, searches may run in parallel
+
+        if self.compiled is not None:
+            # Copy the precompiled clause fragments of B and encode only !alpha
+            self.compiled.write_dimacs(B_dataset.get_elements(), alpha, temp_file)
+        else:
+            # Clone B and add !alpha to check for entailment
+            B_copy = B_dataset.clone()
+            B_copy.add_element("!"+alpha)
 
-        # Call parse.py to transform B_copy into CNF
-        B_copy.to_file(temp_file)
-        converter = CNFConverter(verbose=False)
-        converter.convert_to_cnf(temp_file, temp_file)
+            # Call parse.py to transform B_copy into CNF
+            B_copy.to_file(temp_file)
+            converter = CNFConverter(verbose=False, encoding=self.encoding)
+            converter.convert_to_cnf(temp_file, temp_file)
 
         # Call miniSat and interpret the output
         result = subprocess.run(['minisat', temp_file], capture_output=True, text=True)
@@ -156,9 +365,11 @@ class ExpandShrink(KernelStrategy):
         # Process the output
         if "UNSAT" in last_line:
             logging.debug(f"MiniSat result: UNSAT. Therefore, {alpha} is in Cn({B_dataset.get_elements()})")
+            self.entailment_cache.store(B_dataset, True, alpha)
             return True
         elif "SAT" in last_line:
             logging.debug(f"MiniSat result: SAT. Therefore, {alpha} is not in Cn({B_dataset.get_elements()})")
+            self.entailment_cache.store(B_dataset, False, alpha)
             return False
         else:
             logging.debug("MiniSat output was unexpected.")
@@ -1,4 +1,40 @@
+import logging
+import os
+import re
+import subprocess
+from collections import deque
 from abc import ABC, abstractmethod
+from src.structs.atomindex import extract_atoms
+from src.structs.compiledkb import CompiledKnowledgeBase
+
+# The constant false of the formula grammar, alpha = CONTRADICTION asks whether B is inconsistent
+CONTRADICTION = "-"
+# The contradiction X&&!X (or !X&&X) used as alpha by the batch runs, e.g. A0&&!A0
+CONTRADICTION_PATTERN = re.compile(r"(!?)([A-Za-z_][A-Za-z0-9_]*)&&(!?)\2")
+# Number of maximal consistent and minimal inconsistent subsets remembered by inconsistent()
+SUBSET_CACHE_SIZE = 256
+
+
+def is_contradiction(alpha):
+    """
+    Check if alpha is syntactically a contradiction, so that its kernels are the minimal inconsistent subsets.
+
+    Args:
+        alpha (str): The formula, e.g. "-" or "A0&&!A0".
+
+    Returns:
+        bool: True for the constant false and for X&&!X, optionally in parentheses.
+    """
+    if not alpha:
+        return False
+    alpha = alpha.replace(" ", "")
+    if alpha.startswith("(") and alpha.endswith(")"):
+        alpha = alpha[1:-1]
+    if alpha == CONTRADICTION:
+        return True
+    match = CONTRADICTION_PATTERN.fullmatch(alpha)
+    return match is not None and match.group(1) != match.group(3)
+
 
 ## Strategy interface 
 class KernelStrategy(ABC):
@@ -6,5 +42,215 @@ class KernelStrategy(ABC):
     def find_kernel(self, dataset, alpha):
         pass
 
+    @abstractmethod
+    def cn(self, B_dataset, alpha):
+        pass
+
+    def inconsistent(self, B_dataset):
+        """
+        Check if the dataset is inconsistent, which is cn(B_dataset, alpha) for every contradiction alpha.
+
+        Kernels are then minimal inconsistent subsets and remainders maximal consistent subsets,
+        and no formula for alpha has to be encoded: the elements are checked for plain
+        satisfiability with one encoding shared by all checks of the run, the compiled knowledge
+        base of the whole dataset passed to the strategy (see main.compile_dataset); without one,
+        the dataset is compiled for this check only. Consistency is inherited by
+        subsets and inconsistency by supersets, so the maximal consistent and minimal
+        inconsistent subsets found so far answer many checks without calling MiniSat.
+
+        Args:
+            B_dataset (DataSet): The dataset to check.
+
+        Returns:
+            bool: True if the dataset is inconsistent, False otherwise.
+        """
+        elements = frozenset(B_dataset.get_elements())
+        if any(elements <= subset for subset in self.consistent_subsets):
+            logging.debug(f"Consistent by cache: {B_dataset.get_elements()}")
+            return False
+        if any(subset <= elements for subset in self.inconsistent_subsets):
+            logging.debug(f"Inconsistent by cache: {B_dataset.get_elements()}")
+            return True
+
+        compiled = self.compiled or CompiledKnowledgeBase.from_elements(B_dataset.get_elements(), self.encoding)
+        temp_file = f"tmp/temp_dimacs_{os.getpid()}.cnf"
+        compiled.write_dimacs(B_dataset.get_elements(), None, temp_file)
+        result = subprocess.run(['minisat', temp_file], capture_output=True, text=True)
+        last_line = result.stdout.splitlines()[-1]
+        if "UNSAT" in last_line:
+            logging.debug(f"MiniSat result: UNSAT. Therefore, {B_dataset.get_elements()} is inconsistent")
+            self.inconsistent_subsets = [subset for subset in self.inconsistent_subsets if not elements <= subset][-(SUBSET_CACHE_SIZE - 1):] + [elements]
+            return True
+        elif "SAT" in last_line:
+            logging.debug(f"MiniSat result: SAT. Therefore, {B_dataset.get_elements()} is consistent")
+            self.consistent_subsets = [subset for subset in self.consistent_subsets if not subset <= elements][-(SUBSET_CACHE_SIZE - 1):] + [elements]
+            return False
+        else:
+            logging.debug("MiniSat output was unexpected.")
+            return None
+
+    def counter_model(self, B_dataset, alpha):
+        """
+        Check if alpha is a consequence of the dataset and return a counter model if it is not.
+
+        Like cn, but MiniSat also writes its model to a result file, and the values of the atoms
+        are read from it with the atom variables of the compiled knowledge base passed to the
+        strategy (without one, the dataset is compiled for this check only). For a contradiction
+        alpha the subset caches of inconsistent() are used and updated, otherwise the entailment
+        cache of cn; a cache hit answers without a model.
+
+        Args:
+            B_dataset (DataSet): The dataset containing elements to check against.
+            alpha (str): The formula to check.
+
+        Returns:
+            tuple: (entailed, model) where model maps each atom to its value in a model of the
+            dataset and the negation of alpha, or is None if alpha is entailed or it is unknown.
+        """
+        contradiction = is_contradiction(alpha)
+        elements = frozenset(B_dataset.get_elements())
+        if contradiction:
+            if any(elements <= subset for subset in self.consistent_subsets):
+                return False, None
+            if any(subset <= elements for subset in self.inconsistent_subsets):
+                return True, None
+        else:
+            found, entailed = self.entailment_cache.lookup(B_dataset, alpha)
+            if found:
+                return entailed, None
+
+        compiled = self.compiled or CompiledKnowledgeBase.from_elements(B_dataset.get_elements(), self.encoding)
+        temp_file = f"tmp/temp_dimacs_{os.getpid()}.cnf"
+        result_file = f"tmp/temp_model_{os.getpid()}.txt"
+        atom_vars = compiled.write_dimacs(B_dataset.get_elements(), None if contradiction else alpha, temp_file)
+        subprocess.run(['minisat', temp_file, result_file], capture_output=True, text=True)
+        with open(result_file) as file:
+            lines = file.read().split("\n", 1)
+
+        if lines[0] == "UNSAT":
+            logging.debug(f"MiniSat result: UNSAT. Therefore, {alpha} is in Cn({B_dataset.get_elements()})")
+            if contradiction:
+                self.inconsistent_subsets = [subset for subset in self.inconsistent_subsets if not elements <= subset][-(SUBSET_CACHE_SIZE - 1):] + [elements]
+            else:
+                self.entailment_cache.store(B_dataset, True, alpha)
+            return True, None
+        elif lines[0] == "SAT":
+            logging.debug(f"MiniSat result: SAT. Therefore, {alpha} is not in Cn({B_dataset.get_elements()})")
+            if contradiction:
+                self.consistent_subsets = [subset for subset in self.consistent_subsets if not subset <= elements][-(SUBSET_CACHE_SIZE - 1):] + [elements]
+            else:
+                self.entailment_cache.store(B_dataset, False, alpha)
+            true_vars = {int(literal) for literal in lines[1].split() if int(literal) > 0}
+            return False, {atom: var in true_vars for atom, var in atom_vars.items()}
+        else:
+            logging.debug("MiniSat output was unexpected.")
+            return None, None
+
+    def filter_relevant(self, dataset, alpha):
+        """
+        Remove the elements that cannot be part of any kernel for alpha.
+
+        A kernel that is consistent only contains elements connected to the atoms of alpha through
+        shared atoms, and an inconsistent kernel lies within one atom-connected component. So every
+        component that shares no atom with alpha and is consistent can be dropped. The components
+        not touching alpha are first checked together, which settles the common case with a single
+        call to cn; only if they are inconsistent together each of them is checked on its own.
+
+        Args:
+            dataset (DataSet): The dataset to filter.
+            alpha (str): The formula the kernels are computed for.
+
+        Returns:
+            DataSet: The dataset restricted to the relevant elements, in the original order.
+        """
+        index = dataset.get_atom_index()
+        alpha_atoms = set(extract_atoms(alpha)) if alpha and not is_contradiction(alpha) else set()
+        relevant, unrelated = [], []
+        for component in index.components(dataset.get_elements()):
+            if any(alpha_atoms.intersection(index.atoms_of(element)) for element in component):
+                relevant.append(component)
+            else:
+                unrelated.append(component)
+
+        if unrelated and self.cn(dataset.restrict([e for component in unrelated for e in component]), CONTRADICTION):
+            relevant.extend(component for component in unrelated if self.cn(dataset.restrict(component), CONTRADICTION))
+
+        relevant_elements = set(element for component in relevant for element in component)
+        filtered = dataset.restrict([element for element in dataset.get_elements() if element in relevant_elements])
+        logging.info(f"Relevance filter kept {filtered.size()} of {dataset.size()} elements in {len(relevant)} of {len(relevant) + len(unrelated)} components")
+        return filtered
+
+    def harvest_kernels(self, dataset, alpha, limit=None):
+        """
+        Collect pairwise disjoint kernels by blocking the elements of each kernel found.
+
+        Strategies that can continue from the state of the previous kernel override this.
+
+        Args:
+            dataset (DataSet): The dataset to harvest from.
+            alpha (str): The formula the kernels are computed for.
+            limit (int, optional): The maximal number of kernels to collect.
+
+        Returns:
+            list of DataSet: The kernels in the order they were found; empty if the dataset does not entail alpha.
+        """
+        kernels = []
+        remaining = dataset
+        while limit is None or len(kernels) < limit:
+            kernel = self.find_kernel(remaining, alpha)
+            if kernel is None:
+                break
+            kernels.append(kernel)
+            blocked = set(kernel.get_elements())
+            if not blocked:
+                break
+            remaining = remaining.restrict([element for element in remaining.get_elements() if element not in blocked])
+        return kernels
+
+    def minimal_inconsistent_subsets(self, dataset):
+        """
+        Enumerate all minimal inconsistent subsets (MUSes) of the dataset, i.e. its kernels for a contradiction.
+
+        Every MUS lies within one atom-connected component, so each inconsistent component is
+        searched on its own, breadth-first with a hitting set tree: a node removes the elements
+        on its path and is labelled with a MUS disjoint from the path. A MUS found before is
+        reused if there is one, so find_kernel is only called once per MUS and once per
+        consistent node. Paths that contain the path of a consistent node are consistent as well
+        and are not expanded.
+
+        Args:
+            dataset (DataSet): The dataset to enumerate the MUSes of.
+
+        Returns:
+            list of frozenset: The MUSes, each as a set of elements.
+        """
+        muses = []
+        for component in dataset.get_atom_index().components(dataset.get_elements()):
+            part = dataset.restrict(component)
+            if not self.cn(part, CONTRADICTION):
+                continue
+            found = []
+            consistent_paths = []
+            queue = deque([frozenset()])
+            visited = {frozenset()}
+            while queue:
+                path = queue.popleft()
+                kernel = next((mus for mus in found if not mus & path), None)
+                if kernel is None:
+                    result = self.find_kernel(part.restrict([element for element in component if element not in path]), CONTRADICTION)
+                    if result is None:
+                        consistent_paths.append(path)
+                        continue
+                    kernel = frozenset(result.get_elements())
+                    found.append(kernel)
+                for element in kernel:
+                    child = path | {element}
+                    if child not in visited and not any(consistent <= child for consistent in consistent_paths):
+                        visited.add(child)
+                        queue.append(child)
+            logging.info(f"Found {len(found)} minimal inconsistent subsets in a component of {len(component)} elements")
+            muses.extend(found)
+        return muses
+
     def methodForAll(self) -> None:
-        print("method that is inherited by strategies")
\ No newline at end of file
+        print("method that is inherited by strategies")
@@ -1,8 +1,10 @@
 import logging
+import os
 import subprocess
-from .kernelstrategy import KernelStrategy
+from .kernelstrategy import KernelStrategy, is_contradiction
 from src.CNFconverter.parse import CNFConverter
 from src.structs.dataset import DataSet
+from src.structs.fingerprint import SubsetCache
 
 # Configure logging to file
 logging.basicConfig(filename='log/remainder_operations.log', # Log file name
@@ -11,10 +13,16 @@ logging.basicConfig(filename='log/remainder_operations.log', # Log file name
                     level=logging.CRITICAL)
 
 class ShrinkExpand(KernelStrategy):
-    def __init__(self, window_size=1, divide_and_conquer=False):  
+    def __init__(self, window_size=1, divide_and_conquer=False, binary_search=False, encoding="tseitin", compiled=None):  
         # Default to the basic expand-shrink method with window_size = 1 and without Divide_and_conquer
         self.window_size = window_size
         self.div_conq = divide_and_conquer  # Set to FALSE PER DEFAULT UNTIL STRATEGY IMPLEMENTED
+        self.binary_search = binary_search  # Locate the shrink cut by bisection instead of one element at a time
+        self.encoding = encoding  # CNF encoding used by cn, "tseitin" or "pg" (Plaisted-Greenbaum)
+        self.compiled = compiled  # CompiledKnowledgeBase of the dataset; cn then copies its clause fragments
+        self.consistent_subsets = []  # Subset caches of inconsistent(), used when alpha is a contradiction
+        self.inconsistent_subsets = []
+        self.entailment_cache = SubsetCache()  # Results of cn by dataset fingerprint and alpha
     
     def find_kernel(self, dataset, alpha):
         # Make a clone of the dataset to ensure the original is not altered
@@ -40,7 +48,10 @@ class ShrinkExpand(KernelStrategy):
             return None
 
     def find_remainder(self, dataset, alpha):
-        remainder_dataset = self.shrink(dataset, alpha)
+        if self.binary_search:
+            remainder_dataset = self.bisection_shrink(dataset, alpha)
+        else:
+            remainder_dataset = self.shrink(dataset, alpha)
         logging.info(f"After shrink: {remainder_dataset.get_elements()}")
         return remainder_dataset
 
@@ -63,6 +74,47 @@ class ShrinkExpand(KernelStrategy):
                 logging.debug(f"CONTINUE WITH EXPAND, B = {B_dataset.get_elements()}")
                 return self.expand(B_dataset, removed_elements, alpha)
 
+    def bisection_shrink(self, B_dataset, alpha):
+        """
+        Locate the shrink cut by bisection over the number of removed front elements.
+
+        Finds the smallest k such that elements[k:] no longer entails alpha, which is the point
+        where the linear shrink stops, using O(log n) calls to cn. find_kernel has already checked
+        that the whole dataset entails alpha. The empty dataset is only checked when the cut falls
+        behind the last element, exactly as the linear shrink would. The expand phase is then
+        restricted to the removed prefix elements[:k].
+
+        Args:
+            B_dataset (DataSet): The dataset to shrink, in traversal order.
+            alpha (str): The formula that should no longer be entailed.
+
+        Returns:
+            DataSet: The remainder, or None if even the empty dataset entails alpha.
+        """
+        elements = B_dataset.get_elements()
+        n = len(elements)
+
+        # Invariant: elements[low:] entails alpha, elements[high:] does not (high == n is checked last)
+        low, high = 0, n
+        while high - low > 1:
+            mid = (low + high) // 2
+            logging.debug(f"BISECTION: checking without the first {mid} elements, low = {low}, high = {high}")
+            if self.cn(DataSet(elements=elements[mid:]), alpha):
+                low = mid
+            else:
+                high = mid
+
+        if high == n and self.cn(DataSet(), alpha):
+            logging.info(f"FINISHED SHRINK, CN = TRUE for the empty dataset, no remainder for {alpha}")
+            return None
+
+        remainder = DataSet(elements=elements[high:])
+        removed_elements = DataSet(elements=elements[:high])
+        logging.info(f"FINISHED SHRINK, CN = FALSE, Remainder output with {len(remainder.get_elements())} elements: {remainder.get_elements()}, removed elements: {removed_elements.get_elements()}")
+        logging.debug(f"CONTINUE WITH EXPAND, B = {remainder.get_elements()}")
+        # elements[high - 1:] is known to entail alpha, so the cut element itself is never re-added
+        return self.expand(remainder, DataSet(elements=elements[:high - 1]), alpha)
+
     def expand(self, B_dataset, removed_elements, alpha):
         """ Expands the dataset to ensure maximality while alpha is not entailed. """
         for element in list(reversed(removed_elements.get_elements())):
@@ -81,7 +133,9 @@ class ShrinkExpand(KernelStrategy):
         
         Clones the given dataset, adds the negation of alpha, and transforms it into CNF.
         Then calls MiniSat to solve the CNF. Interprets the output to determine if alpha
-        is a consequence of the dataset.
+        is a consequence of the dataset. With a compiled knowledge base, the precompiled
+        clauses of the elements are copied instead of converting the formulas again. For a
+        contradiction alpha this is the consistency check of inconsistent().
 
         Args:
             B_dataset (DataSet): The dataset containing elements to check against.
@@ -90,17 +144,29 @@ class ShrinkExpand(KernelStrategy):
         Returns:
             bool: True if alpha is a consequence of the dataset, False otherwise.
         """
-        temp_file="tmp/temp_dimacs.cnf"
+        if is_contradiction(alpha):
+            return self.inconsistent(B_dataset)
+
+        found, entailed = self.entailment_cache.lookup(B_dataset, alpha)
+        if found:
+            logging.debug(f"Cached result: {alpha} is{'' if entailed else ' not'} in Cn({B_dataset.get_elements()})")
+            return entailed
 
-        # Clone B and add !alpha to check for entailment
-        B_copy = B_dataset.clone()
-        B_copy.add_element("!("+alpha+")")
-        #logging.debug(f"Checking with B_copy = {B_copy.get_elements()}")
+        temp_file=f"tmp/temp_dimacs_{os.getpid()}.cnf"  # One file per process, searches may run in parallel
+
+        if self.compiled is not None:
+            # Copy the precompiled clause fragments of B and encode only !alpha
+            self.compiled.write_dimacs(B_dataset.get_elements(), alpha, temp_file)
+        else:
+            # Clone B and add !alpha to check for entailment
+            B_copy = B_dataset.clone()
+            B_copy.add_element("!("+alpha+")")
+            #logging.debug(f"Checking with B_copy = {B_copy.get_elements()}")
 
-        # Call parse.py to transform B_copy into CNF
-        B_copy.to_file(temp_file)
-        converter = CNFConverter(verbose=False)
-        converter.convert_to_cnf(temp_file, temp_file)
+            # Call parse.py to transform B_copy into CNF
+            B_copy.to_file(temp_file)
+            converter = CNFConverter(verbose=False, encoding=self.encoding)
+            converter.convert_to_cnf(temp_file, temp_file)
 
         # Call miniSat and interpret the output
         result = subprocess.run(['minisat', temp_file], capture_output=True, text=True)
@@ -112,9 +178,11 @@ class ShrinkExpand(KernelStrategy):
         # Process the output
         if "UNSAT" in last_line:
             logging.debug(f"MiniSat result: UNSAT. Therefore, {alpha} is in Cn({B_dataset.get_elements()})")
+            self.entailment_cache.store(B_dataset, True, alpha)
             return True
         elif "SAT" in last_line:
             logging.debug(f"MiniSat result: SAT. Therefore, {alpha} is not in Cn({B_dataset.get_elements()})")
+            self.entailment_cache.store(B_dataset, False, alpha)
             return False
         else:
             logging.debug("MiniSat output was unexpected.")
@@ -1,5 +1,6 @@
 import sys
 from src.structs.dataset import DataSet
+from src.structs.fingerprint import SubsetCache
 from src.structs.hittingsettree import HSTreeNode, HittingSetTree
 from src.kernels.kernelstrategy import KernelStrategy
 from src.remainders.remainderstrategy import RemainderStrategy
@@ -13,7 +14,11 @@ class BFS(Strategy):
         self.alpha = alpha
     
     def find_kernels(self) -> None:
-        self.tree = HittingSetTree()
+        # Kernels and edges hold element ids
+        self.registry = self.dataset.get_registry()
+        self.tree = HittingSetTree(registry=self.registry)
+        # Branches that remove the same elements in a different order reach the same dataset
+        self.kernel_cache = SubsetCache()
         self.span_tree_with_kernels(self.dataset, self.alpha)
         
         ## print afterwards
@@ -21,9 +26,12 @@ class BFS(Strategy):
         self.tree.print_tree_to_file()    
             
     def span_tree_with_kernels(self, dataset, alpha, parent=None, removed=None):
-        result = self.kernelStrategy.find_kernel(dataset, alpha)
-        if result is not None:
-            found_kernel = result.get_elements()
+        found, found_kernel = self.kernel_cache.lookup(dataset)
+        if not found:
+            result = self.kernelStrategy.find_kernel(dataset, alpha)
+            found_kernel = None if result is None else self.registry.intern_all(result.get_elements())
+            self.kernel_cache.store(dataset, found_kernel)
+        if found_kernel is not None:
             if not found_kernel:
                 # If found_kernel is empty, we've hit a leaf node
                 child_node = HSTreeNode(kernel="LEAF")
@@ -45,13 +53,13 @@ class BFS(Strategy):
             self.tree.print_newline()
 
 
-            for element in found_kernel:
+            for element_id in found_kernel:
                 # Create a copy of dataset without the current element
                 reduced_dataset = dataset.clone()
-                reduced_dataset.remove_element(element)                
+                reduced_dataset.remove_element(self.registry.element(element_id))
 
                 # Recursively span the tree
-                self.span_tree_with_kernels(reduced_dataset, alpha, parent, element)
+                self.span_tree_with_kernels(reduced_dataset, alpha, parent, element_id)
         else:
             child_node = HSTreeNode(kernel="LEAF", edge=removed)
             self.tree.add_leaf_node(child_node)
@@ -0,0 +1,91 @@
+import logging
+from multiprocessing import Pool
+from src.kernels.kernelstrategy import KernelStrategy, CONTRADICTION, is_contradiction
+from src.structs.atomindex import extract_atoms
+from src.structs.dataset import DataSet
+from src.structs.hittingsettree import HittingSetForest
+from .bfs import BFS
+from .hybrid import HybridSearch
+from .strategy import Strategy
+
+# Configure logging
+logging.basicConfig(filename='log/decomposed_search.log', filemode='w', level=logging.CRITICAL, format='%(asctime)s %(levelname)s:%(message)s')
+
+def solve_part(kernelStrategy: KernelStrategy, dataset: DataSet, alpha, strategy_param, harvest=0):
+    """
+    Run the search for one part of the decomposition, in a worker process or in-process.
+
+    Returns:
+        HittingSetTree: The tree of the part, or None if the part does not entail alpha.
+    """
+    if not kernelStrategy.cn(dataset, alpha):
+        logging.info(f"Part with {dataset.size()} elements does not entail {alpha}, no kernels")
+        return None
+    if strategy_param == 0:
+        search = BFS(kernelStrategy, dataset, alpha)
+    else:
+        search = HybridSearch(kernelStrategy, dataset, alpha, strategy_param, harvest)
+    search.find_kernels()
+    # The per-node datasets are only needed during the search, drop them before the tree is sent back
+    stack = [search.tree.root]
+    while stack:
+        node = stack.pop()
+        node.dataset = None
+        stack.extend(node.children)
+    return search.tree
+
+class DecomposedSearch(Strategy):
+    """
+    Runs the hitting set search separately on the atom-disjoint parts of the dataset.
+
+    Every kernel is either consistent, and then only contains elements connected to the atoms of
+    alpha, or it is a minimal inconsistent subset, which lies within one atom-connected component.
+    The components touching alpha are therefore merged into one part that is searched for alpha,
+    every other component is searched for CONTRADICTION (its kernels are its minimal inconsistent
+    subsets), and consistent components are dropped by KernelStrategy.filter_relevant. The parts
+    share no elements, so the optimal hitting set is the union of the optimal hitting sets of the
+    parts and its cost is the sum of their costs.
+    """
+
+    def __init__(self, kernelStrategy: KernelStrategy, dataset: DataSet, alpha, strategy_param, jobs=None, harvest=0):
+        self.kernelStrategy = kernelStrategy
+        self.dataset = dataset
+        self.alpha = alpha
+        self.strategy_param = strategy_param
+        self.jobs = jobs  # Number of worker processes, None = number of CPUs
+        self.harvest = harvest  # Disjoint kernels harvested up front by each HybridSearch, 0 = off
+
+    def decompose(self):
+        """
+        Split the dataset into the parts that are searched independently.
+
+        Returns:
+            list of tuple: (DataSet, alpha) for every part, the largest part first.
+        """
+        dataset = self.kernelStrategy.filter_relevant(self.dataset, self.alpha)
+        index = dataset.get_atom_index()
+        alpha_atoms = set(extract_atoms(self.alpha)) if self.alpha and not is_contradiction(self.alpha) else set()
+        alpha_part, parts = [], []
+        for component in index.components(dataset.get_elements()):
+            if any(alpha_atoms.intersection(index.atoms_of(element)) for element in component):
+                alpha_part.extend(component)
+            else:
+                parts.append((dataset.restrict(component), CONTRADICTION))
+        if alpha_part:
+            parts.append((dataset.restrict(alpha_part), self.alpha))
+        parts.sort(key=lambda part: part[0].size(), reverse=True)
+        logging.info(f"Decomposed {self.dataset.size()} elements into {len(parts)} parts of sizes {[part.size() for part, _ in parts]}")
+        return parts
+
+    def find_kernels(self) -> None:
+        tasks = [(self.kernelStrategy, part, alpha, self.strategy_param, self.harvest) for part, alpha in self.decompose()]
+        if len(tasks) > 1 and self.jobs != 1:
+            pool = Pool(processes=self.jobs)
+            try:
+                trees = pool.starmap(solve_part, tasks, chunksize=1)
+            finally:
+                pool.terminate()
+        else:
+            trees = [solve_part(*task) for task in tasks]
+        self.tree = HittingSetForest(trees)
+        self.tree.print_tree()
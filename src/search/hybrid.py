@@ -1,7 +1,9 @@
 import heapq
 import logging
+import numpy as np
 from src.kernels.kernelstrategy import KernelStrategy
 from src.structs.dataset import DataSet
+from src.structs.fingerprint import SubsetCache
 from src.structs.hittingsettree import HSTreeNode, HittingSetTree
 from .strategy import Strategy
 
@@ -9,12 +11,22 @@ from .strategy import Strategy
 logging.basicConfig(filename='log/hybrid_search.log',filemode='w', level=logging.CRITICAL, format='%(asctime)s %(levelname)s:%(message)s')
 
 class HybridSearch(Strategy):
-    def __init__(self, kernelStrategy: KernelStrategy, dataset: DataSet, alpha, strategy_param):
+    def __init__(self, kernelStrategy: KernelStrategy, dataset: DataSet, alpha, strategy_param, harvest=0):
         self.kernelStrategy = kernelStrategy
         self.dataset = dataset
         self.alpha = alpha
         self.strategy_param = strategy_param
-        self.tree = HittingSetTree(dataset=dataset)
+        self.harvest = harvest  # Number of disjoint kernels harvested up front, 0 = off
+        self.known_kernels = []  # Kernels that nodes reuse instead of calling find_kernel (harvest mode)
+        self.disjoint_kernels = []  # The harvested kernels, which give the lower bound of should_prune
+        self.kernel_cache = SubsetCache()  # The kernel of every node dataset, as nodes on different paths can share it
+        # Kernels, edges and paths hold element ids (one per distinct line); the values are arrays indexed by id
+        self.registry = dataset.get_registry()
+        self.registry.intern_all(dataset.get_elements())
+        values = self.registry.value_array(dataset.element_values, 1)  # Default value to 1 if not found
+        self.costs = np.divide(1.0, values, out=np.zeros_like(values), where=values != 0)
+        self.priorities = self.registry.value_array(dataset.element_values, 0)
+        self.tree = HittingSetTree(dataset=dataset, registry=self.registry)
         self.tree.boundary = float('inf')
 
     def find_kernels(self) -> None:
@@ -24,8 +36,20 @@ class HybridSearch(Strategy):
         self.log_tree()
 
     def create_initial_node(self, dataset, alpha):
-        result = self.kernelStrategy.find_kernel(dataset, alpha)
-        initial_node = HSTreeNode(kernel=result.get_elements(), dataset=dataset, bbvalue=0, parent=None)
+        kernel = None
+        if self.harvest:
+            # Harvest a batch of disjoint kernels; the first one labels the root
+            self.disjoint_kernels = [self.registry.intern_all(kernel.get_elements()) for kernel in self.kernelStrategy.harvest_kernels(dataset, alpha, self.harvest)]
+            self.known_kernels = list(self.disjoint_kernels)
+            logging.info(f"Harvested {len(self.disjoint_kernels)} disjoint kernels: {[self.registry.lookup(kernel) for kernel in self.disjoint_kernels]}")
+            if self.disjoint_kernels:
+                kernel = self.disjoint_kernels[0]
+        if kernel is None:
+            # Without a harvested kernel, e.g. if the dataset does not entail alpha
+            result = self.kernelStrategy.find_kernel(dataset, alpha)
+            if result is not None:
+                kernel = self.registry.intern_all(result.get_elements())
+        initial_node = HSTreeNode(kernel=kernel, dataset=dataset, bbvalue=0, parent=None)
         self.tree.root = initial_node
         return initial_node
 
@@ -35,18 +59,18 @@ class HybridSearch(Strategy):
 
         while priority_queue:
             _, current_node = heapq.heappop(priority_queue)
-            logging.debug(f"Expanding node with bbvalue: {current_node.bbvalue}, edge: {current_node.edge}")
+            logging.debug(f"Expanding node with bbvalue: {current_node.bbvalue}, edge: {self.tree.edge_element(current_node.edge)}")
 
             if self.should_prune(current_node):
-                logging.debug(f"Pruning node with bbvalue: {current_node.bbvalue}, edge: {current_node.edge}")
+                logging.debug(f"Pruning node with bbvalue: {current_node.bbvalue}, edge: {self.tree.edge_element(current_node.edge)}")
                 current_node.kernel = "PRUNED"
                 current_node.set_pruned()
                 continue
 
             if current_node.get_kernel() is None:
-                result = self.kernelStrategy.find_kernel(current_node.get_dataset(), self.alpha)
+                result = self.find_node_kernel(current_node.get_dataset())
                 if result is not None:
-                    current_node.set_kernel(result.get_elements())
+                    current_node.set_kernel(result)
                     self.expand_children(current_node, priority_queue)
                 else:
                     current_node.set_kernel("LEAF")
@@ -57,17 +81,45 @@ class HybridSearch(Strategy):
 
             self.log_tree()
 
+    def find_node_kernel(self, dataset):
+        """
+        Return a kernel of a node's dataset, reusing a known kernel that lies within it in harvest mode.
+
+        A kernel of the whole dataset that is contained in the dataset of a node is also one of
+        its kernels, so find_kernel is only called when no known kernel fits. Paths that remove
+        the same elements in a different order lead to the same dataset, whose kernel is then
+        taken from the kernel cache.
+
+        Returns:
+            list: The ids of the kernel elements, or None if the dataset does not entail alpha.
+        """
+        if self.harvest:
+            element_ids = set(self.registry.intern_all(dataset.get_elements()))
+            for kernel in self.known_kernels:
+                if element_ids.issuperset(kernel):
+                    logging.debug(f"Reusing known kernel {self.registry.lookup(kernel)}")
+                    return kernel
+        found, kernel = self.kernel_cache.lookup(dataset)
+        if found:
+            return kernel
+        result = self.kernelStrategy.find_kernel(dataset, self.alpha)
+        kernel = None if result is None else self.registry.intern_all(result.get_elements())
+        self.kernel_cache.store(dataset, kernel)
+        if kernel is not None and self.harvest:
+            self.known_kernels.append(kernel)
+        return kernel
+
     def expand_children(self, current_node, priority_queue):
         children = []
-        for element in current_node.get_kernel():
+        for element_id in current_node.get_kernel():
             reduced_dataset = current_node.get_dataset().clone()
-            reduced_dataset.remove_element(element)
+            reduced_dataset.remove_element(self.registry.element(element_id))
 
-            bbvalue = self.calculate_bbvalue(current_node, element, reduced_dataset)
-            child_node = HSTreeNode(kernel=None, dataset=reduced_dataset, edge=element, level=current_node.level + 1, bbvalue=bbvalue, parent=current_node)
+            bbvalue = self.calculate_bbvalue(current_node, element_id)
+            child_node = HSTreeNode(kernel=None, dataset=reduced_dataset, edge=element_id, level=current_node.level + 1, bbvalue=bbvalue, parent=current_node)
             current_node.add_child(child_node)
 
-            priority = self.dataset.element_values.get(element, 0)
+            priority = self.priorities[element_id]
             children.append((priority, child_node))
 
         # Sort children by priority (highest first) and add them to the priority queue
@@ -76,33 +128,51 @@ class HybridSearch(Strategy):
             self.add_to_priority_queue(priority_queue, child_node, priority)
 
     def add_to_priority_queue(self, queue, node, priority):
-        logging.debug(f"Adding node to priority queue with priority: {-priority}, edge: {node.edge}")
+        logging.debug(f"Adding node to priority queue with priority: {-priority}, edge: {self.tree.edge_element(node.edge)}")
         heapq.heappush(queue, (-priority, node))
 
-    def calculate_bbvalue(self, current_node, element, dataset):
-        assigned_value = dataset.element_values.get(element, 1)  # Default value to 1 if not found
-        transformed_value = 1 / assigned_value if assigned_value != 0 else 0
+    def calculate_bbvalue(self, current_node, element_id):
+        transformed_value = self.costs[element_id]
         new_bbvalue = current_node.bbvalue + transformed_value
-        logging.debug(f"Calculating bbvalue: current_node bbvalue = {current_node.bbvalue}, element = {element}, assigned_value = {assigned_value}, transformed_value = {transformed_value}, new_bbvalue = {new_bbvalue}")
+        logging.debug(f"Calculating bbvalue: current_node bbvalue = {current_node.bbvalue}, element = {self.registry.element(element_id)}, transformed_value = {transformed_value}, new_bbvalue = {new_bbvalue}")
         return new_bbvalue
 
     def update_boundary_with_leaf(self, leaf_node):
-        leaf_path_measure = self.calculate_path_bbvalue_up_to_root(leaf_node, self.dataset)
+        leaf_path_measure = self.calculate_path_bbvalue_up_to_root(leaf_node)
         if leaf_path_measure < self.tree.boundary:  # Ensure boundary is updated correctly
             self.tree.boundary = leaf_path_measure
             logging.debug(f"Updated boundary: {self.tree.boundary}")
 
-    def calculate_path_bbvalue_up_to_root(self, node, dataset):
+    def calculate_path_bbvalue_up_to_root(self, node):
         cumulative_bbvalue = 0.0
         current_node = node
         while current_node is not None and current_node.edge is not None:
-            element_value = dataset.element_values.get(current_node.edge, 1)  # Default value to 1 if not found
-            cumulative_bbvalue += 1 / element_value if element_value != 0 else 0
+            cumulative_bbvalue += self.costs[current_node.edge]
+            current_node = current_node.parent
+        return float(cumulative_bbvalue)
+
+    def harvest_lower_bound(self, node):
+        """
+        Return a lower bound on the cost still needed below a node from the harvested disjoint kernels.
+
+        Every harvested kernel that is not hit by the path of the node must be hit by a different
+        element, so the cheapest element of each of them is a lower bound of the remaining cost.
+        """
+        path = set()
+        current_node = node
+        while current_node is not None and current_node.edge is not None:
+            path.add(current_node.edge)
             current_node = current_node.parent
-        return cumulative_bbvalue
+        lower_bound = 0.0
+        for kernel in self.disjoint_kernels:
+            if kernel and path.isdisjoint(kernel):
+                lower_bound += self.costs[kernel].min()
+        return float(lower_bound)
 
     def should_prune(self, node):
-        hitting_set_value = self.calculate_path_bbvalue_up_to_root(node, self.dataset)
+        hitting_set_value = self.calculate_path_bbvalue_up_to_root(node)
+        if self.disjoint_kernels:
+            hitting_set_value += self.harvest_lower_bound(node)
         logging.debug(f"Checking pruning: node bbvalue = {node.bbvalue}, hitting_set_value = {hitting_set_value}, boundary = {self.tree.boundary}")
         return hitting_set_value >= self.tree.boundary  # Prune if greater than or equal to boundary
 
@@ -0,0 +1,83 @@
+import logging
+from pysat.solvers import Minisat22
+from src.kernels.expandshrink import ExpandShrink
+from src.structs.dataset import DataSet
+from .strategy import Strategy
+
+# Configure logging
+logging.basicConfig(filename='log/marco.log', filemode='w', level=logging.CRITICAL, format='%(asctime)s %(levelname)s:%(message)s')
+
+class Marco(Strategy):
+    """
+    Enumerates all kernels and all remainders of a dataset for alpha in one run (MARCO).
+
+    A map solver over one selector variable per element keeps track of the subsets that are
+    not explored yet: every kernel K blocks its supersets with the clause "not all of K", every
+    remainder R blocks its subsets with the clause "some element outside R". Each round takes
+    a maximal unexplored subset (the seed) and checks it with cn. A seed that entails alpha is
+    shrunk to a new kernel by the kernel extractor. A seed that does not entail alpha is a new
+    remainder as it is: adding any element makes it a superset of a known kernel, since the
+    seed is maximal in the map. When the map has no model left, every kernel and remainder has
+    been found, at the cost of one check per seed plus the shrink steps.
+
+    Attributes:
+        kernels (list of list): The kernels found so far.
+        remainders (list of list): The remainders found so far.
+    """
+
+    def __init__(self, kernelStrategy: ExpandShrink, dataset: DataSet, alpha):
+        self.kernelStrategy = kernelStrategy
+        self.dataset = dataset
+        self.alpha = alpha
+        self.kernels = []
+        self.remainders = []
+
+    def find_kernels(self) -> None:
+        for _ in self.enumerate():
+            pass
+
+    def maximal_seed(self, map_solver, elements):
+        """
+        Return the selectors of a maximal unexplored subset, or None if everything has been explored.
+        """
+        if not map_solver.solve():
+            return None
+        seed = {lit for lit in map_solver.get_model() if lit > 0}
+        for selector in range(1, len(elements) + 1):
+            if selector not in seed and map_solver.solve(assumptions=sorted(seed) + [selector]):
+                seed = {lit for lit in map_solver.get_model() if lit > 0}
+        return seed
+
+    def enumerate(self):
+        """
+        Enumerate the kernels and remainders, yielding each one as soon as it is found.
+
+        Yields:
+            tuple: ("kernel", elements) or ("remainder", elements), the elements in dataset order.
+        """
+        elements = list(dict.fromkeys(self.dataset.get_elements()))
+        selectors = {element: i + 1 for i, element in enumerate(elements)}
+        with Minisat22() as map_solver:
+            map_solver.set_phases(list(selectors.values()))
+            while True:
+                seed = self.maximal_seed(map_solver, elements)
+                if seed is None:
+                    break
+                subset = self.dataset.restrict([element for element in elements if selectors[element] in seed])
+                if self.kernelStrategy.cn(subset, self.alpha):
+                    kernel_set = set(self.kernelStrategy.extract_kernel(subset, self.alpha).get_elements())
+                    kernel = [element for element in elements if element in kernel_set]
+                    logging.info(f"Kernel {len(self.kernels) + 1} with {len(kernel)} elements: {kernel}")
+                    self.kernels.append(kernel)
+                    yield "kernel", kernel
+                    blocking_clause = [-selectors[element] for element in kernel]
+                else:
+                    remainder = subset.get_elements()
+                    logging.info(f"Remainder {len(self.remainders) + 1} with {len(remainder)} elements: {remainder}")
+                    self.remainders.append(remainder)
+                    yield "remainder", remainder
+                    blocking_clause = [selectors[element] for element in elements if selectors[element] not in seed]
+                if not blocking_clause:
+                    # The empty kernel or the whole dataset as remainder, nothing else is left
+                    break
+                map_solver.add_clause(blocking_clause)
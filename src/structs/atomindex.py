@@ -0,0 +1,241 @@
+"""
+This module defines the AtomIndex class, a sparse formula x atom occurrence index over the
+elements of a dataset. The index is stored as a pair of CSR matrices (formula -> atoms and
+atom -> formulas) and is built once per dataset, so that relevance queries such as
+"which formulas share an atom with X" never have to re-parse the formulas.
+"""
+
+import re
+import numpy as np
+from scipy.sparse import bmat, csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+# Atom names follow the CNAME rule of the formula grammar in src/CNFconverter/core.py
+ATOM_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def extract_atoms(formula):
+    """
+    Extract the distinct atom names of a formula string in order of first occurrence.
+
+    Args:
+        formula (str): A propositional formula, e.g. "(arg_a4<=>!arg_a2&&!arg_a20)".
+
+    Returns:
+        list: The atom names occurring in the formula.
+    """
+    return list(dict.fromkeys(ATOM_PATTERN.findall(formula)))
+
+
+def gather(indptr, indices, rows):
+    """
+    Concatenate the CSR rows with the given ids into one index array.
+
+    Args:
+        indptr (numpy.ndarray): The CSR row pointer array.
+        indices (numpy.ndarray): The CSR column index array.
+        rows (numpy.ndarray): The ids of the rows to gather.
+
+    Returns:
+        numpy.ndarray: The column indices of all given rows (with repetitions).
+    """
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=indices.dtype)
+    offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return indices[np.arange(total) + offsets]
+
+
+class AtomIndex:
+    """
+    A sparse formula x atom occurrence index.
+
+    Attributes:
+        formulas (list): The distinct formulas of the index; their position is the row id.
+        formula_ids (dict): Maps each formula to its row id.
+        atoms (list): The distinct atoms of the index; their position is the column id.
+        atom_ids (dict): Maps each atom name to its column id.
+        occurrences (csr_matrix): Formula x atom matrix, 1 where the atom occurs in the formula.
+        occurrences_by_atom (csr_matrix): The transposed atom x formula matrix.
+    """
+
+    def __init__(self, formulas, formula_atoms=None):
+        """
+        Build the index for the given formulas.
+
+        Args:
+            formulas (list of str): The formulas to index; duplicates share one row.
+            formula_atoms (dict, optional): The atoms of each formula, for elements that are not
+                formula strings (e.g. clause groups); by default they are extracted from the text.
+        """
+        self.formulas = list(dict.fromkeys(formulas))
+        self.formula_ids = {formula: i for i, formula in enumerate(self.formulas)}
+        self.atom_ids = {}
+        indptr = [0]
+        indices = []
+        for formula in self.formulas:
+            for atom in (formula_atoms[formula] if formula_atoms is not None else extract_atoms(formula)):
+                indices.append(self.atom_ids.setdefault(atom, len(self.atom_ids)))
+            indptr.append(len(indices))
+        self.atoms = list(self.atom_ids)
+
+        shape = (len(self.formulas), len(self.atoms))
+        indices = np.asarray(indices, dtype=np.int32)
+        self.occurrences = csr_matrix((np.ones(len(indices), dtype=np.int8), indices, np.asarray(indptr, dtype=np.int32)), shape=shape)
+        self.occurrences_by_atom = self.occurrences.T.tocsr()
+
+    @classmethod
+    def from_arrays(cls, formulas, atoms, indptr, indices, by_atom_indptr, by_atom_indices):
+        """
+        Create an index from previously built CSR arrays without copying them, e.g. views of a compiled knowledge base.
+
+        Args:
+            formulas (list of str): The distinct formulas, in row order.
+            atoms (list of str): The distinct atoms, in column order.
+            indptr (numpy.ndarray): The int32 row pointers of the formula x atom matrix.
+            indices (numpy.ndarray): The int32 atom ids of the formula x atom matrix.
+            by_atom_indptr (numpy.ndarray): The int32 row pointers of the atom x formula matrix.
+            by_atom_indices (numpy.ndarray): The int32 formula ids of the atom x formula matrix.
+
+        Returns:
+            AtomIndex: The index.
+        """
+        index = cls.__new__(cls)
+        index.formulas = formulas
+        index.formula_ids = {formula: i for i, formula in enumerate(formulas)}
+        index.atoms = atoms
+        index.atom_ids = {atom: i for i, atom in enumerate(atoms)}
+        shape = (len(formulas), len(atoms))
+        index.occurrences = csr_matrix((np.ones(len(indices), dtype=np.int8), indices, indptr), shape=shape, copy=False)
+        index.occurrences_by_atom = csr_matrix((np.ones(len(by_atom_indices), dtype=np.int8), by_atom_indices, by_atom_indptr), shape=shape[::-1], copy=False)
+        return index
+
+    def atoms_of(self, formula):
+        """
+        Return the atoms of a formula, using the index if the formula is indexed.
+
+        Args:
+            formula (str): The formula, e.g. an element of the dataset or alpha.
+
+        Returns:
+            list: The atom names occurring in the formula.
+        """
+        row = self.formula_ids.get(formula)
+        if row is None:
+            return extract_atoms(formula)
+        start, end = self.occurrences.indptr[row], self.occurrences.indptr[row + 1]
+        return [self.atoms[atom] for atom in self.occurrences.indices[start:end]]
+
+    def atom_rows(self, atoms):
+        """
+        Return the column ids of the given atoms, skipping atoms that are not indexed.
+
+        Args:
+            atoms (iterable of str): The atom names.
+
+        Returns:
+            numpy.ndarray: The column ids of the indexed atoms.
+        """
+        return np.asarray([self.atom_ids[atom] for atom in atoms if atom in self.atom_ids], dtype=np.int32)
+
+    def formulas_with_atoms(self, atoms):
+        """
+        Return the indexed formulas that contain at least one of the given atoms.
+
+        Args:
+            atoms (iterable of str): The atom names.
+
+        Returns:
+            list: The formulas in index order.
+        """
+        rows = np.unique(gather(self.occurrences_by_atom.indptr, self.occurrences_by_atom.indices, self.atom_rows(atoms)))
+        return [self.formulas[row] for row in rows]
+
+    def formulas_sharing_atoms(self, formula):
+        """
+        Return the indexed formulas that share at least one atom with the given formula.
+
+        Args:
+            formula (str): The formula, indexed or not (e.g. alpha).
+
+        Returns:
+            list: The formulas in index order, excluding the formula itself.
+        """
+        return [other for other in self.formulas_with_atoms(self.atoms_of(formula)) if other != formula]
+
+    def relevance_order(self, elements, alpha=None):
+        """
+        Order elements by their relevance distance from alpha and from the elements already chosen.
+
+        The traversal is a breadth-first search over the bipartite formula/atom graph: first all
+        elements sharing an atom with alpha, then all elements sharing an atom with those, and so
+        on. When no unvisited element is connected to the chosen ones anymore, the search restarts
+        from the first unvisited element in the original order, so every connected group of
+        elements ends up contiguous. Within one distance layer the original order is kept.
+
+        Args:
+            elements (list of str): The elements to order; all of them must be indexed.
+            alpha (str, optional): The formula whose atoms seed the traversal.
+
+        Returns:
+            list: The elements in relevance order, including duplicates.
+        """
+        positions = {}
+        for element in elements:
+            positions.setdefault(self.formula_ids[element], []).append(element)
+        rows = np.fromiter(positions, dtype=np.int32, count=len(positions))
+        # Rank of each row in the original order, -1 for rows not part of the elements
+        rank = np.full(len(self.formulas), -1, dtype=np.int64)
+        rank[rows] = np.arange(len(rows))
+
+        visited_rows = rank < 0
+        visited_atoms = np.zeros(len(self.atoms), dtype=bool)
+        by_formula = self.occurrences
+        by_atom = self.occurrences_by_atom
+
+        order = []
+        frontier_atoms = self.atom_rows(extract_atoms(alpha)) if alpha else np.empty(0, dtype=np.int32)
+        next_seed = 0
+        while len(order) < len(rows):
+            if len(frontier_atoms) == 0:
+                # Restart from the first unvisited element in the original order
+                while visited_rows[rows[next_seed]]:
+                    next_seed += 1
+                layer = rows[next_seed:next_seed + 1]
+            else:
+                visited_atoms[frontier_atoms] = True
+                layer = np.unique(gather(by_atom.indptr, by_atom.indices, frontier_atoms))
+                layer = layer[~visited_rows[layer]]
+                layer = layer[np.argsort(rank[layer], kind="stable")]
+            visited_rows[layer] = True
+            order.extend(layer.tolist())
+            frontier_atoms = np.unique(gather(by_formula.indptr, by_formula.indices, layer))
+            frontier_atoms = frontier_atoms[~visited_atoms[frontier_atoms]]
+
+        return [element for row in order for element in positions[row]]
+
+    def components(self, elements):
+        """
+        Split elements into groups that are connected through shared atoms.
+
+        Two elements are in the same component if they are linked by a chain of elements in
+        which every two neighbours share an atom. Different components are atom-disjoint.
+
+        Args:
+            elements (list of str): The elements to split; all of them must be indexed.
+
+        Returns:
+            list of list: The components in order of their first element, each keeping the original order.
+        """
+        rows = np.fromiter(dict.fromkeys(self.formula_ids[element] for element in elements), dtype=np.int32)
+        occurrences = self.occurrences[rows]
+        graph = bmat([[None, occurrences], [occurrences.T, None]], format="csr")
+        _, labels = connected_components(graph, directed=False)
+        row_labels = dict(zip(rows.tolist(), labels[:len(rows)].tolist()))
+
+        components = {}
+        for element in elements:
+            components.setdefault(row_labels[self.formula_ids[element]], []).append(element)
+        return list(components.values())
@@ -0,0 +1,324 @@
+"""
+This module defines the CompiledKnowledgeBase class, a precompiled binary form of a knowledge
+base file. Compiling parses and encodes every formula once, offline, and stores the element
+registry, the hard clauses with the clause fragment each formula depends on, the atom
+occurrence index and the element values as flat arrays in one file. Runs open the file with
+mmap and use zero-copy NumPy views of the arrays, so start-up does not parse anything and
+parallel workers share the same pages. The entailment checks select the clause fragments of
+a subset instead of converting the formula strings of every subset again.
+
+Group CNF files (gcnf) are compiled the same way: every clause group {i} with i > 0 becomes an
+element named "{i}", selected by asserting its group literal, and group {0} holds the hard
+clauses shared by all subsets. Such files can also be compiled in memory with from_file.
+
+The file can be created from the command line:
+
+    python -m src.structs.compiledkb data/ARG/file.pl data/ARG/file.kbc [--encoding pg] [--db]
+    python -m src.structs.compiledkb benchmark.gcnf benchmark.kbc --format gcnf
+"""
+
+import argparse
+import itertools
+import json
+import mmap
+import struct
+import numpy as np
+from src.CNFconverter.core import KnowledgeBase, encode_formula
+from src.CNFconverter.clausestore import ClauseStore, dimacs_lines
+from src.structs.atomindex import AtomIndex, gather
+
+MAGIC = b"KBC1"
+ALIGNMENT = 64
+
+# Name and dtype of every array stored in a compiled knowledge base
+ARRAYS = [
+    ("element_text", np.uint8),           # The elements in file order, joined by newlines
+    ("variable_text", np.uint8),          # The names of the encoded atoms, joined by newlines
+    ("variables", np.int32),              # The variable of each encoded atom
+    ("clause_literals", np.int32),        # The literals of all hard clauses
+    ("clause_offsets", np.int64),         # Start of every hard clause plus the total length
+    ("fragment_clauses", np.int32),       # The clause ids each element depends on, concatenated
+    ("fragment_offsets", np.int64),       # Start of the fragment of every element plus the total length
+    ("soft_lits", np.int32),              # The literal of each element
+    ("index_atom_text", np.uint8),        # The atoms of the occurrence index, joined by newlines
+    ("index_indptr", np.int32),           # Formula x atom occurrence index (CSR)
+    ("index_indices", np.int32),
+    ("index_by_atom_indptr", np.int32),   # Atom x formula occurrence index (CSR)
+    ("index_by_atom_indices", np.int32),
+    ("random_values", np.float64),        # The random value of each element, NaN if unknown
+    ("inconsistency_values", np.float64), # The inconsistency value of each element, NaN if unknown
+]
+
+
+def join_lines(strings):
+    return np.frombuffer("\n".join(strings).encode(), dtype=np.uint8)
+
+
+def split_lines(text):
+    return text.tobytes().decode().split("\n") if len(text) else []
+
+
+def align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class CompiledKnowledgeBase:
+    """
+    A knowledge base compiled to clause fragments, opened from a memory-mapped file or compiled in memory.
+
+    Attributes:
+        path (str): The path of the compiled file, None if it was compiled in memory.
+        source (str): The path of the knowledge base file it was compiled from.
+        file_format (str): The format of the source file, "pl" or "gcnf".
+        encoding (str): The CNF encoding of the clauses, "tseitin" or "pg".
+        num_vars (int): The number of variables used by the hard clauses.
+        num_base_clauses (int): The number of leading hard clauses needed by every subset.
+        elements (list): The element registry, in file order.
+        element_ids (dict): Maps each element to its position in the registry.
+        atom_vars (dict): Maps each encoded atom to its variable.
+        atom_index (AtomIndex): The occurrence index over the elements, backed by the file.
+        arrays (dict): Zero-copy views of all stored arrays, by name.
+    """
+
+    def __init__(self, path=None, header=None, arrays=None):
+        """
+        Open a compiled knowledge base file, or wrap the header and arrays returned by build.
+
+        Args:
+            path (str, optional): The path of the file written by CompiledKnowledgeBase.compile.
+            header (dict, optional): The header of an in-memory compiled knowledge base.
+            arrays (dict, optional): The arrays of an in-memory compiled knowledge base.
+        """
+        self.path = path
+        if path is not None:
+            with open(path, 'rb') as file:
+                self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self.buffer[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a compiled knowledge base")
+            header_length, = struct.unpack_from("<Q", self.buffer, len(MAGIC))
+            header_start = len(MAGIC) + 8
+            header = json.loads(self.buffer[header_start:header_start + header_length].decode())
+            data_start = align(header_start + header_length)
+            arrays = {}
+            for name, dtype in ARRAYS:
+                offset, count = header["arrays"][name]
+                arrays[name] = np.frombuffer(self.buffer, dtype=dtype, count=count, offset=data_start + offset)
+
+        self.header = header
+        self.source = header["source"]
+        self.file_format = header["format"]
+        self.encoding = header["encoding"]
+        self.num_vars = header["num_vars"]
+        self.num_base_clauses = header["num_base_clauses"]
+        self.arrays = arrays
+
+        self.elements = split_lines(self.arrays["element_text"])
+        self.element_ids = {element: i for i, element in enumerate(self.elements)}
+        self.atom_vars = dict(zip(split_lines(self.arrays["variable_text"]), self.arrays["variables"].tolist()))
+        self.atom_index = AtomIndex.from_arrays(
+            list(dict.fromkeys(self.elements)), split_lines(self.arrays["index_atom_text"]),
+            self.arrays["index_indptr"], self.arrays["index_indices"],
+            self.arrays["index_by_atom_indptr"], self.arrays["index_by_atom_indices"])
+
+    def __reduce__(self):
+        # Worker processes open the file again instead of copying the arrays
+        if self.path is not None:
+            return (CompiledKnowledgeBase, (self.path,))
+        return (CompiledKnowledgeBase, (None, self.header, self.arrays))
+
+    @classmethod
+    def from_file(cls, input_file_path, encoding="tseitin", file_format="pl"):
+        """
+        Compile a knowledge base file in memory, without writing the binary format.
+
+        Args:
+            input_file_path (str): The knowledge base file.
+            encoding (str, optional): The CNF encoding of pl formulas, "tseitin" or "pg".
+            file_format (str, optional): The format of the file, "pl" or "gcnf".
+
+        Returns:
+            CompiledKnowledgeBase: The compiled knowledge base.
+        """
+        header, arrays = cls.build(input_file_path, encoding, file_format=file_format)
+        return cls(header=header, arrays=arrays)
+
+    @classmethod
+    def from_elements(cls, elements, encoding="tseitin"):
+        """
+        Compile a list of formulas in memory, e.g. the elements of a dataset loaded from the database.
+
+        Args:
+            elements (list of str): The formulas.
+            encoding (str, optional): The CNF encoding, "tseitin" or "pg".
+
+        Returns:
+            CompiledKnowledgeBase: The compiled knowledge base.
+        """
+        header, arrays = cls.build(None, encoding, elements=elements)
+        return cls(header=header, arrays=arrays)
+
+    @staticmethod
+    def build(input_file_path, encoding="tseitin", values=None, file_format="pl", elements=None):
+        """
+        Encode a knowledge base file and return the header and arrays of its compiled form.
+
+        Args:
+            input_file_path (str): The knowledge base file, one formula per line or a group CNF.
+            encoding (str, optional): The CNF encoding of pl formulas, "tseitin" or "pg".
+            values (dict, optional): Maps elements to (random value, inconsistency value) pairs.
+            file_format (str, optional): The format of the file, "pl" or "gcnf".
+            elements (list of str, optional): The formulas to encode instead of reading a pl file.
+
+        Returns:
+            tuple: The header (dict) and the arrays (dict of numpy.ndarray, see ARRAYS).
+        """
+        if elements is None:
+            with open(input_file_path, 'r') as file:
+                if file_format == "gcnf":
+                    kb = KnowledgeBase(file.read().split("\n"), file_format="gcnf")
+                    elements = ["{" + str(index) + "}" for index in kb.group_indices]
+                    index = AtomIndex(elements, {element: [str(atom) for atom in sorted(formula.atoms)] for element, formula in zip(elements, kb.formulas)})
+                else:
+                    elements = [line.strip() for line in file if line.strip()]
+        if file_format == "pl":
+            kb = KnowledgeBase(elements)
+            index = AtomIndex(elements)
+
+        clauses, soft_lits = kb.to_group_cnf(encoding=encoding)
+        num_vars = next(kb.var_counter) - 1
+        fragments = ClauseStore(kb.clause_fragments())
+        values = values or {}
+        nan = float("nan")
+
+        arrays = {
+            "element_text": join_lines(elements),
+            "variable_text": join_lines(map(str, kb.atom_vars)),
+            "variables": np.fromiter(kb.atom_vars.values(), dtype=np.int32, count=len(kb.atom_vars)),
+            "clause_literals": clauses.literal_array(),
+            "clause_offsets": clauses.offset_array(),
+            "fragment_clauses": fragments.literal_array(),
+            "fragment_offsets": fragments.offset_array(),
+            "soft_lits": np.asarray(soft_lits, dtype=np.int32),
+            "index_atom_text": join_lines(index.atoms),
+            "index_indptr": index.occurrences.indptr,
+            "index_indices": index.occurrences.indices,
+            "index_by_atom_indptr": index.occurrences_by_atom.indptr,
+            "index_by_atom_indices": index.occurrences_by_atom.indices,
+            "random_values": np.asarray([values.get(element, (nan, nan))[0] for element in elements], dtype=np.float64),
+            "inconsistency_values": np.asarray([values.get(element, (nan, nan))[1] for element in elements], dtype=np.float64),
+        }
+
+        layout = {}
+        offset = 0
+        for name, dtype in ARRAYS:
+            arrays[name] = np.ascontiguousarray(arrays[name], dtype=dtype)
+            layout[name] = [offset, len(arrays[name])]
+            offset = align(offset + arrays[name].nbytes)
+        header = {
+            "source": input_file_path,
+            "format": file_format,
+            "encoding": encoding,
+            "num_vars": num_vars,
+            "num_base_clauses": kb.num_base_clauses,
+            "arrays": layout,
+        }
+        return header, arrays
+
+    @staticmethod
+    def compile(input_file_path, output_file_path, encoding="tseitin", values=None, file_format="pl"):
+        """
+        Compile a knowledge base file into the binary format.
+
+        Args:
+            input_file_path (str): The knowledge base file, one formula per line or a group CNF.
+            output_file_path (str): The path of the compiled file to write.
+            encoding (str, optional): The CNF encoding of pl formulas, "tseitin" or "pg".
+            values (dict, optional): Maps elements to (random value, inconsistency value) pairs.
+            file_format (str, optional): The format of the file, "pl" or "gcnf".
+        """
+        header, arrays = CompiledKnowledgeBase.build(input_file_path, encoding, values, file_format)
+        layout = header["arrays"]
+        header = json.dumps(header).encode()
+
+        with open(output_file_path, 'wb') as file:
+            file.write(MAGIC + struct.pack("<Q", len(header)) + header)
+            data_start = align(file.tell())
+            for name, _ in ARRAYS:
+                file.write(b"\0" * (data_start + layout[name][0] - file.tell()))
+                file.write(arrays[name].tobytes())
+
+    def element_values(self, strategy_param):
+        """
+        Return the stored values of the elements for a value assignment strategy.
+
+        Args:
+            strategy_param (int): 2 for the random values, 3 for the inconsistency values.
+
+        Returns:
+            dict: Maps each element to its value, None where the value is unknown.
+        """
+        name = "random_values" if strategy_param == 2 else "inconsistency_values"
+        return {element: None if np.isnan(value) else int(value) for element, value in zip(self.elements, self.arrays[name].tolist())}
+
+    def write_dimacs(self, elements, alpha, output_file_path):
+        """
+        Write the DIMACS CNF of elements and the negation of alpha, ready for a SAT solver.
+
+        Only the clause fragments of the given elements are copied from the compiled clauses;
+        alpha and elements that are not part of the compiled knowledge base are encoded on the fly.
+
+        Args:
+            elements (list of str): The elements to assert.
+            alpha (str): The formula whose negation is asserted, None to check the elements alone.
+            output_file_path (str): The path of the DIMACS file to write.
+
+        Returns:
+            dict: Maps every atom of the written CNF to its variable, including atoms encoded on the fly.
+        """
+        rows = np.fromiter((self.element_ids.get(element, -1) for element in elements), dtype=np.int64, count=len(elements))
+        known = rows[rows >= 0]
+        arrays = self.arrays
+        clause_ids = np.concatenate([np.arange(self.num_base_clauses), np.unique(gather(arrays["fragment_offsets"], arrays["fragment_clauses"], known))])
+        literals = gather(arrays["clause_offsets"], arrays["clause_literals"], clause_ids)
+        ends = np.cumsum(arrays["clause_offsets"][clause_ids + 1] - arrays["clause_offsets"][clause_ids])
+
+        query = ClauseStore()
+        atom_vars = dict(self.atom_vars)  # Atoms unknown to the compiled knowledge base are added by encode_formula
+        var_counter = itertools.count(self.num_vars + 1)
+        polarity = self.encoding == "pg"
+        units = arrays["soft_lits"][known].tolist()
+        for element, row in zip(elements, rows.tolist()):
+            if row < 0:
+                units.append(encode_formula(element, atom_vars, var_counter, query, polarity))
+        if alpha is not None:
+            units.append(encode_formula("!(" + alpha + ")", atom_vars, var_counter, query, polarity))
+        num_vars = next(var_counter) - 1
+
+        with open(output_file_path, 'wb') as file:
+            file.write(f"p cnf {num_vars} {len(clause_ids) + len(query) + len(units)}\n".encode())
+            file.write(dimacs_lines(literals, ends))
+            file.write(query.to_dimacs(units=units))
+        return atom_vars
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compile a knowledge base file into the memory-mapped binary format.')
+    parser.add_argument('input_file', type=str, help='The knowledge base file, one formula per line')
+    parser.add_argument('output_file', type=str, help='The compiled file to write, e.g. file.kbc')
+    parser.add_argument('--encoding', choices=['tseitin', 'pg'], default='pg', help='CNF encoding of the clauses (default: pg)')
+    parser.add_argument('--format', choices=['pl', 'gcnf'], default='pl', help='Format of the input file: propositional formulas or group CNF (default: pl)')
+    parser.add_argument('--db', action='store_true', help='Store the random and inconsistency values of the elements from the database')
+    args = parser.parse_args()
+
+    values = None
+    if args.db:
+        from src.database.database import create_ssh_tunnel_and_connect
+        conn = create_ssh_tunnel_and_connect()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute("SELECT randomvalue, inconsistencyvalue, line FROM DATA_ENTRY WHERE filename = %s", (args.input_file,))
+            values = {row['line']: (row['randomvalue'], row['inconsistencyvalue']) for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+            conn.close()
+    CompiledKnowledgeBase.compile(args.input_file, args.output_file, args.encoding, values, args.format)
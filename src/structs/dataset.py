@@ -8,6 +8,11 @@ clone itself, and write its contents to a file.
 import logging
 import sys
 from mysql.connector import Error
+from src.structs.atomindex import AtomIndex
+from src.structs.compiledkb import CompiledKnowledgeBase
+from src.structs.elementregistry import ElementRegistry
+from src.structs.fingerprint import add_key, fingerprint, remove_key
+from src.values.inconsistency import leave_one_out_inconsistency, mi_shapley_values, shapley_inconsistency_values
 
 # Configure logging and clear the log file before logging
 logging.basicConfig(filename='log/dataset.log', filemode='w', level=logging.CRITICAL, format='%(asctime)s %(levelname)s:%(message)s')
@@ -20,9 +25,13 @@ class DataSet:
 
     Attributes:
         elements (list): A list of elements representing the dataset.
+        atom_index (AtomIndex): The formula x atom occurrence index, built on first use and shared by clones.
+        compiled (CompiledKnowledgeBase): The compiled knowledge base the elements were loaded from, if any.
+        registry (ElementRegistry): The integer ids of the elements, built on first use and shared by clones.
+        fingerprint (tuple): The Zobrist fingerprint of the elements, computed on first use and then kept up to date.
     """
     
-    def __init__(self, conn=None, input_file_path=None, strategy_param=None, elements=None, strategy=None):
+    def __init__(self, conn=None, input_file_path=None, strategy_param=None, elements=None, strategy=None, atom_index=None, file_format="pl", store=None, registry=None, value_jobs=1):
         """
         Initialize a new DataSet instance, optionally loading elements from a file and applying a value assignment strategy.
 
@@ -31,12 +40,28 @@ class DataSet:
             elements (list, optional): An initial list of elements to populate the dataset.
             strategy (str, optional): The strategy identifier (e.g., "A1").
             strategy_param (int, optional): The parameter that defines how values are assigned to the elements.
+            atom_index (AtomIndex, optional): An occurrence index covering at least the given elements.
+            file_format (str, optional): "gcnf" to load the clause groups of a group CNF file as elements.
+            store (DatasetStore, optional): A local store to load the dataset from instead of the database.
+            registry (ElementRegistry, optional): A registry covering at least the given elements.
+            value_jobs (int, optional): Number of worker processes for the Shapley values of strategy 4 (default: 1, in process).
         """
         self.conn = conn
         self.elements = elements if elements is not None else []
         self.element_values = {}  # Initialize the mapping of elements to values
         self.strategy_param = strategy_param
-        if input_file_path:
+        self.atom_index = atom_index
+        self.registry = registry
+        self.fingerprint = None
+        self.compiled = None
+        self.value_jobs = value_jobs
+        if input_file_path and file_format == "gcnf":
+            self.load_elements_from_gcnf(input_file_path)
+        elif input_file_path and input_file_path.endswith(".kbc"):
+            self.load_elements_from_compiled(input_file_path)
+        elif input_file_path and store is not None:
+            self.load_elements_from_store(store, input_file_path)
+        elif input_file_path:
             self.load_elements_from_db(input_file_path)
         if strategy_param:
             self.apply_value_assignment_strategy(strategy_param)
@@ -56,8 +81,8 @@ class DataSet:
         if self.conn is not None:
             cursor = self.conn.cursor(dictionary=True)
             try:
-                query = f"SELECT randomvalue, inconsistencyvalue, filename, line FROM DATA_ENTRY where filename='{file_path}'"
-                cursor.execute(query)
+                query = "SELECT randomvalue, inconsistencyvalue, filename, line FROM DATA_ENTRY WHERE filename = %s"
+                cursor.execute(query, (file_path,))
                 rows = cursor.fetchall()
 
                 # Process the rows as needed, skipping empty lines
@@ -81,6 +106,58 @@ class DataSet:
         else:
             logging.error("Connection to MySQL database failed")
 
+    def load_elements_from_store(self, store, file_path):
+        """
+        Load the elements and their values from a local dataset store, streaming the lines of the file.
+
+        Args:
+            store (DatasetStore): The store, synced from the database.
+            file_path (str): The filename of the dataset, as in the database.
+        """
+        for random_value, inconsistency_value, line in store.rows(file_path):
+            if line == "":
+                continue
+            self.elements.append(line)
+            element_value = None
+            if self.strategy_param == 2:
+                element_value = random_value
+            elif self.strategy_param == 3:
+                element_value = inconsistency_value
+            self.element_values[line] = element_value
+
+    def load_elements_from_compiled(self, file_path):
+        """
+        Load the elements, their values and the atom index from a compiled knowledge base file.
+
+        Args:
+            file_path (str): The path of a file written by CompiledKnowledgeBase.compile.
+        """
+        try:
+            self.compiled = CompiledKnowledgeBase(file_path)
+        except FileNotFoundError:
+            sys.exit(f"File {file_path} not found.\nPlease check file path: {file_path}.")
+        self.elements = list(self.compiled.elements)
+        self.atom_index = self.compiled.atom_index
+        if self.strategy_param in (2, 3):
+            self.element_values = self.compiled.element_values(self.strategy_param)
+
+    def load_elements_from_gcnf(self, file_path):
+        """
+        Load the clause groups of a group CNF file as elements, named "{1}", "{2}", ...
+
+        The file is compiled in memory, so the entailment checks select the groups by their
+        group literals without any formula conversion; group {0} is part of every check.
+
+        Args:
+            file_path (str): The path of the gcnf file.
+        """
+        try:
+            self.compiled = CompiledKnowledgeBase.from_file(file_path, file_format="gcnf")
+        except FileNotFoundError:
+            sys.exit(f"File {file_path} not found.\nPlease check file path: {file_path}.")
+        self.elements = list(self.compiled.elements)
+        self.atom_index = self.compiled.atom_index
+
     def get_elements(self):
         """
         Retrieve the elements of the dataset.
@@ -117,6 +194,8 @@ class DataSet:
         """
         if element not in self.elements:
             self.elements.append(element)
+            if self.fingerprint is not None:
+                self.fingerprint = add_key(self.fingerprint, element)
     
     def add_element_at_start(self, element):
         """
@@ -127,6 +206,8 @@ class DataSet:
         """
         if element not in self.elements:
             self.elements.insert(0, element)  # Inserts element at the start of the list
+            if self.fingerprint is not None:
+                self.fingerprint = add_key(self.fingerprint, element)
 
     def remove_element(self, element):
         """
@@ -137,6 +218,8 @@ class DataSet:
         """
         try:
             self.elements.remove(element)
+            if self.fingerprint is not None:
+                self.fingerprint = remove_key(self.fingerprint, element)
         except ValueError:
             logging.warning(f"Element {element} not found in the dataset.")
 
@@ -147,8 +230,25 @@ class DataSet:
         Returns:
             DataSet: A new DataSet instance containing the same elements.
         """
-        return DataSet(elements=list(self.elements))
+        clone = DataSet(elements=list(self.elements), atom_index=self.atom_index, registry=self.registry)
+        clone.fingerprint = self.fingerprint
+        return clone
     
+    def restrict(self, elements):
+        """
+        Create a DataSet containing only the given elements, keeping their values and the atom index.
+
+        Args:
+            elements (list): The elements to keep, a subset of the elements of this dataset.
+
+        Returns:
+            DataSet: A new DataSet with the given elements and their assigned values.
+        """
+        restricted = DataSet(elements=list(elements), atom_index=self.atom_index, registry=self.registry)
+        restricted.strategy_param = self.strategy_param
+        restricted.element_values = {element: self.element_values[element] for element in elements if element in self.element_values}
+        return restricted
+
     def split(self):
         """
         Splits the dataset into two halves.
@@ -157,8 +257,8 @@ class DataSet:
             tuple of DataSet: Two DataSet instances representing the split dataset.
         """
         mid_index = len(self.elements) // 2
-        first_half = DataSet(elements=self.elements[:mid_index])
-        second_half = DataSet(elements=self.elements[mid_index:])
+        first_half = DataSet(elements=self.elements[:mid_index], atom_index=self.atom_index, registry=self.registry)
+        second_half = DataSet(elements=self.elements[mid_index:], atom_index=self.atom_index, registry=self.registry)
         return first_half, second_half
     
     def combine(self, other):
@@ -174,7 +274,9 @@ class DataSet:
         # Use a set to ensure uniqueness
         combined_elements_set = set(self.get_elements()) | set(other.get_elements())
         # Return a new DataSet with the combined unique elements
-        return DataSet(elements=list(combined_elements_set))
+        atom_index = self.atom_index if self.atom_index is other.atom_index else None
+        registry = self.registry if self.registry is other.registry else None
+        return DataSet(elements=list(combined_elements_set), atom_index=atom_index, registry=registry)
 
     def size(self):
         """
@@ -185,6 +287,54 @@ class DataSet:
         """
         return len(self.elements)
 
+    def get_atom_index(self):
+        """
+        Return the atom occurrence index of the dataset, building it on first use.
+
+        Returns:
+            AtomIndex: The index over the elements of the dataset.
+        """
+        if self.atom_index is None:
+            self.atom_index = AtomIndex(self.elements)
+        return self.atom_index
+
+    def get_fingerprint(self):
+        """
+        Return the Zobrist fingerprint of the elements, see src/structs/fingerprint.py.
+
+        It is computed once and then updated in O(1) by add_element, add_element_at_start and
+        remove_element, and copied by clone, so it can key caches of subsets in O(1).
+
+        Returns:
+            tuple: The two sums of the 64-bit keys of the elements.
+        """
+        if self.fingerprint is None:
+            self.fingerprint = fingerprint(self.elements)
+        return self.fingerprint
+
+    def get_registry(self):
+        """
+        Return the element registry of the dataset, building it on first use.
+
+        Returns:
+            ElementRegistry: The registry, in which every element of the dataset has an id.
+        """
+        if self.registry is None:
+            self.registry = ElementRegistry(self.elements)
+        return self.registry
+
+    def order_by_relevance(self, alpha):
+        """
+        Reorder the elements by relevance distance from alpha, see AtomIndex.relevance_order.
+
+        Kernel strategies traverse the elements in list order, so elements sharing atoms with
+        alpha and with each other are reached in much shorter prefixes.
+
+        Args:
+            alpha (str): The formula whose atoms seed the ordering.
+        """
+        self.elements = self.get_atom_index().relevance_order(self.elements, alpha)
+
     def to_file(self, output_file_path):
         """
         Write the elements of the dataset to a file, one element per line.
@@ -206,8 +356,42 @@ class DataSet:
         if strategy_param == 1:
             for element in self.elements:
                 self.element_values[element] = 1
+        elif strategy_param == 3 and self.missing_values() and not self.is_group_cnf():
+            # Values not stored in the database are computed in process, for all elements at once
+            for element, value in zip(self.elements, leave_one_out_inconsistency(self.elements)):
+                if self.element_values.get(element) is None:
+                    self.element_values[element] = value
+                    if value is None:
+                        logging.warning(f"Element {element} has no three-valued model, it gets no inconsistency value")
+        elif strategy_param == 4 and not self.is_group_cnf():
+            # Estimated Shapley values of the elements for the contension measure
+            for element, value in zip(self.elements, shapley_inconsistency_values(self.elements, jobs=self.value_jobs)):
+                self.element_values[element] = value
+                if value is None:
+                    logging.warning(f"Element {element} has no three-valued model, it gets no Shapley inconsistency value")
+        elif strategy_param == 5:
+            # Exact Shapley values of the elements for the MI measure, from their minimal inconsistent subsets;
+            # imported here since the kernel strategies depend on this module
+            from src.kernels.expandshrink import ExpandShrink
+            compiled = self.compiled or CompiledKnowledgeBase.from_elements(self.elements, "pg")
+            muses = ExpandShrink(binary_search=True, encoding="pg", compiled=compiled).minimal_inconsistent_subsets(self)
+            self.element_values = mi_shapley_values(self.elements, muses)
         elif strategy_param == 2 or strategy_param == 3:
             # Values already assigned during load_elements_from_db
             for element in self.elements:
                 if element not in self.element_values:
                     self.element_values[element] = None
+
+    def missing_values(self):
+        """
+        Returns:
+            bool: True if some element has no value assigned.
+        """
+        return any(self.element_values.get(element) is None for element in self.elements)
+
+    def is_group_cnf(self):
+        """
+        Returns:
+            bool: True if the elements are the clause groups of a group CNF file rather than formulas.
+        """
+        return self.compiled is not None and self.compiled.file_format == "gcnf"
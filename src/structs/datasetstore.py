@@ -0,0 +1,125 @@
+"""
+This module defines the DatasetStore class, a local SQLite copy of the datasets in the MySQL
+database. The tables are those of db/init.sql (the same as the SQLite stand-in of load.py,
+so a database written by load.py --sqlite is a store as well) plus an index on the filename,
+so loading a dataset is one indexed read that streams its lines in file order. Runs that load
+their dataset from the store need neither the network nor the SSH tunnel.
+
+The store is synced from the MySQL database once, from the command line:
+
+    python -m src.structs.datasetstore db/datasets.sqlite [filename ...]
+"""
+
+import argparse
+import sqlite3
+
+# The tables of db/init.sql and the index the store reads by
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS DATA_SETS (filename TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS DATA_ENTRY (id INTEGER PRIMARY KEY AUTOINCREMENT, randomValue INTEGER, inconsistencyValue INTEGER, filename TEXT, line TEXT);
+CREATE INDEX IF NOT EXISTS DATA_ENTRY_filename ON DATA_ENTRY (filename, id);
+"""
+# Number of rows fetched from MySQL and inserted per executemany call while syncing
+BATCH_SIZE = 1000
+
+
+class DatasetStore:
+    """
+    A local SQLite store of the datasets and the values of their lines.
+
+    Attributes:
+        path (str): The path of the SQLite file.
+        conn (sqlite3.Connection): The open connection to it.
+    """
+
+    def __init__(self, path):
+        """
+        Open the store, creating the file and its tables if they do not exist yet.
+
+        Args:
+            path (str): The path of the SQLite file, e.g. db/datasets.sqlite.
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def __contains__(self, filename):
+        return self.conn.execute("SELECT 1 FROM DATA_SETS WHERE filename = ?", (filename,)).fetchone() is not None
+
+    def filenames(self):
+        """Return the filenames of the stored datasets."""
+        return {row[0] for row in self.conn.execute("SELECT filename FROM DATA_SETS")}
+
+    def rows(self, filename):
+        """
+        Stream the entries of a dataset in file order with one indexed query.
+
+        Args:
+            filename (str): The filename of the dataset, as in the database.
+
+        Yields:
+            tuple: (random value, inconsistency value, line) per entry.
+        """
+        yield from self.conn.execute("SELECT randomValue, inconsistencyValue, line FROM DATA_ENTRY WHERE filename = ? ORDER BY id", (filename,))
+
+    def sync(self, conn, filenames=None, batch_size=BATCH_SIZE):
+        """
+        Copy the datasets that are not stored yet from the MySQL database.
+
+        Every dataset is fetched in batches and written in one transaction, so an interrupted
+        sync leaves no partial dataset behind.
+
+        Args:
+            conn: An open connection to the MySQL database.
+            filenames (iterable of str, optional): The datasets to copy, all of DATA_SETS if None.
+            batch_size (int, optional): The number of rows per fetch and insert.
+
+        Returns:
+            int: The number of datasets copied.
+        """
+        cursor = conn.cursor()
+        try:
+            if filenames is None:
+                cursor.execute("SELECT filename FROM DATA_SETS")
+                filenames = [row[0] for row in cursor.fetchall()]
+            stored = self.filenames()
+            copied = 0
+            for filename in filenames:
+                if filename in stored:
+                    continue
+                cursor.execute("SELECT randomValue, inconsistencyValue, line FROM DATA_ENTRY WHERE filename = %s ORDER BY id", (filename,))
+                with self.conn:
+                    self.conn.execute("INSERT INTO DATA_SETS (filename) VALUES (?)", (filename,))
+                    count = 0
+                    while True:
+                        batch = cursor.fetchmany(batch_size)
+                        if not batch:
+                            break
+                        self.conn.executemany("INSERT INTO DATA_ENTRY (randomValue, inconsistencyValue, filename, line) VALUES (?, ?, ?, ?)",
+                                              [(random_value, inconsistency_value, filename, line) for random_value, inconsistency_value, line in batch])
+                        count += len(batch)
+                print(f"Synced {filename} with {count} entries")
+                copied += 1
+            return copied
+        finally:
+            cursor.close()
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Copy the datasets of the MySQL database into a local SQLite store.')
+    parser.add_argument('store', type=str, help='The SQLite file of the store, e.g. db/datasets.sqlite')
+    parser.add_argument('filenames', nargs='*', help='The datasets to copy (default: all datasets that are not stored yet)')
+    args = parser.parse_args()
+
+    from src.database.database import create_ssh_tunnel_and_connect
+    conn = create_ssh_tunnel_and_connect()
+    store = DatasetStore(args.store)
+    try:
+        copied = store.sync(conn, args.filenames or None)
+        print(f"Synced {copied} datasets into {args.store}")
+    finally:
+        store.close()
+        conn.close()
@@ -0,0 +1,78 @@
+"""
+This module defines the ElementRegistry class, which assigns dense integer ids to the elements
+of a run. The hitting set searches (HybridSearch, BFS and HittingSetTree) label kernels, edges
+and paths with these ids and look up the element values by indexing NumPy arrays; the element
+strings only appear again when a tree is printed or a hitting set is returned.
+
+The ids stop at the search layer: DataSet, the element values and the kernel strategies are
+still keyed by the line, so an id stands for a distinct line and duplicate lines of a dataset
+share one id.
+"""
+
+import numpy as np
+
+class ElementRegistry:
+    """
+    Assigns the ids 0, 1, 2, ... to the distinct elements in the order they are registered.
+
+    Attributes:
+        elements (list): The element of each id.
+        ids (dict): Maps each element to its id.
+    """
+
+    def __init__(self, elements=()):
+        """
+        Initialize the registry, registering the given elements in order.
+
+        Args:
+            elements (iterable, optional): The elements to register first, e.g. those of the dataset.
+        """
+        self.elements = []
+        self.ids = {}
+        self.intern_all(elements)
+
+    def __len__(self):
+        return len(self.elements)
+
+    def intern(self, element):
+        """
+        Return the id of an element, registering it if it has none yet.
+        """
+        element_id = self.ids.get(element)
+        if element_id is None:
+            element_id = self.ids[element] = len(self.elements)
+            self.elements.append(element)
+        return element_id
+
+    def intern_all(self, elements):
+        """
+        Return the ids of the elements, in the same order, registering the new ones.
+        """
+        return [self.intern(element) for element in elements]
+
+    def element(self, element_id):
+        return self.elements[element_id]
+
+    def lookup(self, element_ids):
+        """
+        Return the elements of the ids, in the same order.
+        """
+        return [self.elements[element_id] for element_id in element_ids]
+
+    def value_array(self, element_values, default):
+        """
+        Return the values of all registered elements as an array indexed by id.
+
+        Args:
+            element_values (dict): Maps elements to their values, as DataSet.element_values.
+            default (float): The value of elements without a value (missing or None).
+
+        Returns:
+            numpy.ndarray: The float value of every id.
+        """
+        values = np.full(len(self.elements), default, dtype=float)
+        for element_id, element in enumerate(self.elements):
+            value = element_values.get(element)
+            if value is not None:
+                values[element_id] = value
+        return values
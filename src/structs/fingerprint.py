@@ -0,0 +1,112 @@
+"""
+This module provides Zobrist fingerprints of datasets and a cache keyed by them. Every element
+gets two fixed, independent 64-bit keys derived from its text, and the fingerprint of a dataset
+is the pair of sums of these keys over its elements, modulo 2^64. Adding or removing an element
+adds or subtracts its keys, so DataSet keeps its fingerprint up to date in O(1) and a cache
+lookup costs one dict access however large the dataset is. The keys are summed rather than
+XORed so that duplicate lines do not cancel out.
+
+The cache is indexed by the first sum and checks the second sum and the size of the dataset on
+a hit, so a wrong hit needs both 64-bit sums of two different datasets of the same size to
+collide.
+"""
+
+import hashlib
+
+# Number of entries a SubsetCache keeps by default before dropping the oldest ones
+SUBSET_CACHE_SIZE = 4096
+# The keys and sums are 64-bit
+MASK = (1 << 64) - 1
+
+# The Zobrist keys of every element seen in this process
+zobrist_keys = {}
+
+
+def zobrist_key(element):
+    """
+    Return the two 64-bit Zobrist keys of an element.
+
+    The keys only depend on the text of the element, so they are the same in every process and run.
+
+    Args:
+        element (str): The element.
+
+    Returns:
+        tuple: (key, check), both in [0, 2^64).
+    """
+    keys = zobrist_keys.get(element)
+    if keys is None:
+        digest = hashlib.blake2b(element.encode(), digest_size=16).digest()
+        keys = zobrist_keys[element] = (int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little"))
+    return keys
+
+
+def fingerprint(elements):
+    """
+    Return the Zobrist fingerprint of a collection of elements, the sums of their keys.
+    """
+    value = (0, 0)
+    for element in elements:
+        value = add_key(value, element)
+    return value
+
+
+def add_key(value, element):
+    """
+    Return the fingerprint with one more occurrence of the element.
+    """
+    key, check = zobrist_key(element)
+    return (value[0] + key) & MASK, (value[1] + check) & MASK
+
+
+def remove_key(value, element):
+    """
+    Return the fingerprint with one occurrence of the element less.
+    """
+    key, check = zobrist_key(element)
+    return (value[0] - key) & MASK, (value[1] - check) & MASK
+
+
+class SubsetCache:
+    """
+    Maps datasets, as collections of elements, to values in O(1) by their fingerprints.
+
+    An entry is indexed by the first sum of the fingerprint and a tag (e.g. alpha), and stores
+    the second sum and the size of the dataset next to the value; they are compared on a hit.
+    When the cache is full, the oldest entries are dropped.
+
+    Attributes:
+        max_size (int): The maximal number of entries.
+        hits (int): The number of lookups answered from the cache.
+        misses (int): The number of lookups that were not.
+    """
+
+    def __init__(self, max_size=SUBSET_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, dataset, tag=None):
+        """
+        Return (True, value) if the cache holds a value for the elements of the dataset and the tag, (False, None) otherwise.
+        """
+        key, check = dataset.get_fingerprint()
+        entry = self.entries.get((key, tag))
+        if entry is not None and entry[0] == check and entry[1] == dataset.size():
+            self.hits += 1
+            return True, entry[2]
+        self.misses += 1
+        return False, None
+
+    def store(self, dataset, value, tag=None):
+        """
+        Store a value for the elements of the dataset and the tag.
+        """
+        key, check = dataset.get_fingerprint()
+        if (key, tag) not in self.entries and len(self.entries) >= self.max_size:
+            del self.entries[next(iter(self.entries))]
+        self.entries[(key, tag)] = (check, dataset.size(), value)
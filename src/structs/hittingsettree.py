@@ -6,6 +6,7 @@ record combinations of elements (such as in computational logic or optimization
 Classes:
     HSTreeNode: Represents a single node in a hitting set tree.
     HittingSetTree: Represents the entire hitting set tree structure.
+    HittingSetForest: Combines the hitting set trees of atom-disjoint parts of a dataset.
 """
 
 class HSTreeNode:
@@ -80,18 +81,21 @@ class HittingSetTree:
 
     Attributes:
         root (HSTreeNode): The root node of the tree.
+        registry (ElementRegistry): The registry of the element ids that label kernels and edges, None if they are the elements themselves.
     """
     
-    def __init__(self, dataset=None, initial_kernel=None, output_file="tmp/tree_output.txt"):
+    def __init__(self, dataset=None, initial_kernel=None, output_file="tmp/tree_output.txt", registry=None):
         """
         Initialize the hitting set tree with an optional initial kernel at the root.
 
         Args:
             initial_kernel (list, optional): An initial kernel to store at the root of the tree.
+            registry (ElementRegistry, optional): The registry of the element ids used by the search.
         """
         self.root = HSTreeNode(kernel=initial_kernel)
         self.boundary = float('inf')  # Initialize the upper bound.
         self.dataset = dataset
+        self.registry = registry
         self.leaf_nodes= []
         self.output_file = output_file
         
@@ -123,12 +127,28 @@ class HittingSetTree:
     
     def add_leaf_node(self, leaf_node):
         self.leaf_nodes.append(leaf_node)
+
+    def edge_element(self, edge):
+        """
+        Return the element of an edge, translating the id if the tree is labelled with ids.
+        """
+        if self.registry is None or edge is None:
+            return edge
+        return self.registry.element(edge)
+
+    def kernel_elements(self, kernel):
+        """
+        Return the elements of a kernel, translating the ids if the tree is labelled with ids; "LEAF" and "PRUNED" stay as they are.
+        """
+        if self.registry is None or not isinstance(kernel, list):
+            return kernel
+        return self.registry.lookup(kernel)
     
     def calculate_path_bbvalue_up_to_root(self, node, dataset):
         cumulative_bbvalue = 0.0
         current_node = node
         while current_node is not None and current_node.parent is not None:  # Assuming each node has a 'parent' reference.
-            inconsistency_value = dataset.element_values.get(current_node.edge, 0)
+            inconsistency_value = dataset.element_values.get(self.edge_element(current_node.edge), 0)
             cumulative_bbvalue += 1 / inconsistency_value if inconsistency_value != 0 else 0
             current_node = current_node.parent
         return cumulative_bbvalue
@@ -147,7 +167,7 @@ class HittingSetTree:
         current_node = leaf_node
         while current_node is not None and current_node.parent is not None:  # Ensure not at root
             if current_node.edge is not None:  # Assuming edge attribute is used
-                hitting_set.append(current_node.edge)
+                hitting_set.append(self.edge_element(current_node.edge))
             current_node = current_node.parent
         return hitting_set
 
@@ -213,7 +233,7 @@ class HittingSetTree:
         if node is None:
             node = self.root
         indent = "  " * level
-        print(f"{indent}Kernel: {node.kernel}")
+        print(f"{indent}Kernel: {self.kernel_elements(node.kernel)}")
         for child in node.children:
             self.print_tree(child, level + 1)
             
@@ -225,7 +245,7 @@ class HittingSetTree:
         # Calculate the hitting set value for the current node
         hitting_set_value = self.calculate_path_bbvalue_up_to_root(node, dataset=dataset)
 
-        output_text = f"{level}{indent}Kernel: {node.kernel}, Edge: {node.edge}, Level: {node.level}, Bound: {self.boundary}, Hitting Set Value: {hitting_set_value}\n"
+        output_text = f"{level}{indent}Kernel: {self.kernel_elements(node.kernel)}, Edge: {self.edge_element(node.edge)}, Level: {node.level}, Bound: {self.boundary}, Hitting Set Value: {hitting_set_value}\n"
 
         with open(output_file, 'a') as file:
             file.write(output_text)
@@ -235,4 +255,48 @@ class HittingSetTree:
         
     def print_newline(self, output_file="tmp/tree_output.txt"):    
         with open(output_file, "a") as file:
-            file.write("\n\n")
\ No newline at end of file
+            file.write("\n\n")
+
+class HittingSetForest:
+    """
+    Combines the hitting set trees computed for atom-disjoint parts of a dataset.
+
+    The parts share no elements, so a hitting set of all kernels is the union of one hitting
+    set per part and its cost is the sum of their costs. Parts without any kernel contribute
+    no tree. Offers the same summary methods as HittingSetTree.
+
+    Attributes:
+        trees (list of HittingSetTree): The trees of the parts that have kernels.
+        boundary (float): The summed boundary (cost of the optimal hitting set) of all trees.
+    """
+
+    def __init__(self, trees):
+        self.trees = [tree for tree in trees if tree is not None]
+        self.boundary = sum(tree.boundary for tree in self.trees)
+
+    def count_kernels_and_branches(self):
+        counts = [tree.count_kernels_and_branches() for tree in self.trees]
+        return (sum(kernels for kernels, _ in counts), sum(branches for _, branches in counts))
+
+    def count_pruned_nodes(self):
+        return sum(tree.count_pruned_nodes() for tree in self.trees)
+
+    def tree_depth(self):
+        return max((tree.tree_depth() for tree in self.trees), default=0)
+
+    def get_hitting_set_for_optimal_solution(self):
+        """
+        Returns the union of the optimal hitting sets of all parts, or None if a part has none.
+        """
+        hitting_set = []
+        for tree in self.trees:
+            part = tree.get_hitting_set_for_optimal_solution()
+            if part is None:
+                return None
+            hitting_set.extend(part)
+        return hitting_set
+
+    def print_tree(self):
+        for i, tree in enumerate(self.trees):
+            print(f"Part {i + 1}:")
+            tree.print_tree()
@@ -2,8 +2,13 @@ import subprocess
 import os
 import sys
 import tempfile
-import math
 from itertools import chain, combinations
+from multiprocessing import Pool
+from statistics import NormalDist
+import numpy as np
+from pysat.card import ITotalizer
+from pysat.solvers import Minisat22
+from src.CNFconverter.core import FormulaTable, parse_formula, top, bot
 
 def call_sat_solver(script_path, temp_filepath, option='c'):
     """Call the SAT solver script and return the output using a subset."""
@@ -56,6 +61,467 @@ def calculate_inconsistency(filepath, script_path='sat4im/src/sat4im.py'):
     print(f"\nList of inconsistency measures: {inconsistency_differences}")
     return inconsistency_differences
 
+def three_valued_clauses(label, truth, arity):
+    """
+    Return the clauses under which a gate is at least true (truth=True) or at least false (truth=False)
+    in Priest's three-valued logic, as lists of (child index, truth) pairs.
+
+    A formula is at least true if its value is true or both, and at least false if it is false or both;
+    "=>", "<=>" and "^^" are the material connectives built from "!", "&&" and "||".
+    """
+    if label == "&&" and truth or label == "||" and not truth:
+        return [[(i, truth)] for i in range(arity)]
+    if label == "&&" or label == "||":
+        return [[(i, truth) for i in range(arity)]]
+    if label == "=>":
+        return [[(0, False), (1, True)]] if truth else [[(0, True)], [(1, False)]]
+    if (label == "<=>") == truth:
+        # (!a || b) && (a || !b)
+        return [[(0, False), (1, True)], [(0, True), (1, False)]]
+    # (a && !b) || (!a && b), distributed into clauses
+    return [[(0, True), (1, True)], [(0, True), (0, False)], [(1, False), (1, True)], [(1, False), (0, False)]]
+
+
+class ContensionMeasure:
+    """
+    Computes the contension inconsistency measure (the measure "c" of sat4im) of a list of formulas,
+    of every list obtained by leaving one formula out and of arbitrary subsets, in a single
+    incremental SAT solver session.
+
+    The formulas are encoded once in Priest's three-valued logic: every atom gets one variable for
+    "at least true" and one for "at least false", and the measure is the least number of atoms that
+    have to take the value both. Every formula is guarded by a selector variable, so leaving it out
+    is a matter of not assuming its selector, and the number of atoms with value both is bounded by
+    an incremental totalizer. Each leave-one-out measure lies between 0 and the full measure; the
+    unsatisfiable cores found along the way raise the lower bounds of all formulas they do not
+    contain, so most formulas are settled without a solver call of their own.
+
+    Attributes:
+        formulas (list of str): The formulas, e.g. the lines of a dataset.
+        parsed (list of Formula): The parsed formulas.
+        selectors (list of int): The selector variable of each formula.
+        atom_vars (dict): Maps each atom to its ("at least true", "at least false") variables.
+        both_vars (list of int): One variable per atom that is implied by the atom having the value both.
+        subset_measures (dict): Cache of the measures of subsets, keyed by their packed membership mask.
+    """
+
+    def __init__(self, formulas):
+        """
+        Encode the formulas.
+
+        Args:
+            formulas (list of str): The formulas to measure.
+        """
+        self.formulas = list(formulas)
+        self.num_vars = 0
+        self.clauses = []
+        self.atom_vars = {}
+        self.gate_vars = {}
+        self.encoded = set()
+        self.true_var = self.new_var()
+        self.clauses.append([self.true_var])
+
+        table = FormulaTable()
+        self.parsed = [parse_formula(formula, table) for formula in self.formulas]
+        self.selectors = []
+        for formula in self.parsed:
+            selector = self.new_var()
+            self.clauses.append([-selector, self.encode(formula)])
+            self.selectors.append(selector)
+
+        self.both_vars = []
+        for true_var, false_var in self.atom_vars.values():
+            self.both_vars.append(self.new_var())
+            self.clauses.append([-true_var, -false_var, self.both_vars[-1]])
+
+        self.solver = Minisat22(bootstrap_with=self.clauses)
+        self.solver.set_phases([-var for var in self.both_vars])
+        self.totalizer = None
+        self.optimum = None
+        self.optimum_core = None
+        self.model = None
+        self.subset_measures = {}
+
+    def new_var(self):
+        self.num_vars += 1
+        return self.num_vars
+
+    def lit(self, node, truth):
+        """
+        Return the literal that implies that a parsed (sub)formula is at least true or at least false.
+        Literals of gates are created on first use and still have to be defined by encode().
+        """
+        if node.negation:
+            truth = not truth
+        if node.label == top or node.label == bot:
+            return self.true_var if truth == (node.label == top) else -self.true_var
+        if node.is_atom:
+            if node.label not in self.atom_vars:
+                self.atom_vars[node.label] = (self.new_var(), self.new_var())
+                self.clauses.append(list(self.atom_vars[node.label]))
+            return self.atom_vars[node.label][0 if truth else 1]
+        key = (node.label, node.children, truth)
+        if key not in self.gate_vars:
+            self.gate_vars[key] = self.new_var()
+        return self.gate_vars[key]
+
+    def encode(self, formula):
+        """
+        Append the clauses of a parsed formula and return the literal that implies it is at least true.
+
+        Only this direction is encoded (Plaisted-Greenbaum); gates shared with earlier formulas
+        are encoded once.
+        """
+        root_lit = self.lit(formula, True)
+        stack = [(formula, True)]
+        while stack:
+            node, truth = stack.pop()
+            if node.is_atom:
+                continue
+            if node.negation:
+                truth = not truth
+            key = (node.label, node.children, truth)
+            if key in self.encoded:
+                continue
+            self.encoded.add(key)
+            gate = self.gate_vars[key]
+            for clause in three_valued_clauses(node.label, truth, len(node.children)):
+                self.clauses.append([-gate] + [self.lit(node.children[i], child_truth) for i, child_truth in clause])
+                stack.extend((node.children[i], child_truth) for i, child_truth in clause)
+        return root_lit
+
+    def both_count(self, model):
+        """Return the number of atoms that have the value both in a model of the solver."""
+        return sum(1 for true_var, false_var in self.atom_vars.values() if model[true_var - 1] > 0 and model[false_var - 1] > 0)
+
+    def solve(self, assumptions, bound=None):
+        """
+        Look for a three-valued model of the assumed formulas with at most bound atoms with value both.
+
+        Returns:
+            tuple: (True, number of atoms with value both) or (False, unsatisfiable core).
+        """
+        if bound is not None:
+            assumptions = assumptions + [-self.totalizer.rhs[bound]]
+        if self.solver.solve(assumptions=assumptions):
+            self.model = self.solver.get_model()
+            return True, self.both_count(self.model)
+        return False, set(self.solver.get_core() or ())
+
+    def measure(self):
+        """
+        Return the contension measure of all formulas.
+
+        The first model bounds the measure from above; the totalizer is built up to that bound
+        and the bound is lowered with every model found until the solver proves it optimal.
+
+        Raises:
+            ValueError: If a formula is false in every three-valued interpretation (e.g. "-").
+        """
+        if self.optimum is None:
+            satisfiable, upper = self.solve(self.selectors)
+            if not satisfiable:
+                raise ValueError("The formulas have no three-valued model, their contension measure is infinite.")
+            if upper > 0:
+                self.totalizer = ITotalizer(lits=self.both_vars, ubound=upper, top_id=self.num_vars)
+                self.solver.append_formula(self.totalizer.cnf.clauses)
+            while upper > 0:
+                satisfiable, result = self.solve(self.selectors, upper - 1)
+                if not satisfiable:
+                    self.optimum_core = (upper - 1, result)
+                    break
+                upper = result
+            self.optimum = upper
+        return self.optimum
+
+    def without_model(self):
+        """
+        Return the indices of the formulas that are false in every three-valued interpretation (e.g. "-").
+
+        The truth values only grow when an atom takes the value both, so a formula has a
+        three-valued model if and only if it is at least true when every atom is both; all
+        other formulas together have that model as well.
+
+        Returns:
+            list of int: The indices of the formulas without a three-valued model.
+        """
+        all_both = list(range(1, self.num_vars + 1))
+        return [i for i, formula in enumerate(self.parsed) if not self.truth_values(formula, all_both)[0]]
+
+    def leave_one_out(self):
+        """
+        Return the contension measure of the formulas without each formula in turn.
+
+        Returns:
+            list of int: The measure without the i-th formula, for every i.
+        """
+        optimum = self.measure()
+        lower = [0] * len(self.formulas)
+        upper = [optimum] * len(self.formulas)
+        cores = [self.optimum_core] if self.optimum_core is not None else []
+        for i in range(len(self.formulas)):
+            assumptions = self.selectors[:i] + self.selectors[i + 1:]
+            while True:
+                # Every core at bound k that does not need a formula shows that leaving it out keeps the measure above k
+                for bound, core in cores:
+                    for j, selector in enumerate(self.selectors):
+                        if selector not in core and lower[j] <= bound:
+                            lower[j] = bound + 1
+                cores = []
+                if lower[i] >= upper[i]:
+                    break
+                satisfiable, result = self.solve(assumptions, upper[i] - 1)
+                if satisfiable:
+                    upper[i] = result
+                else:
+                    cores.append((upper[i] - 1, result))
+        return upper
+
+    def truth_values(self, node, model):
+        """
+        Evaluate a parsed (sub)formula in the three-valued interpretation of a model of the solver.
+
+        The formula is walked with an explicit stack, like core.evaluate, so deep formulas do
+        not hit the recursion limit.
+
+        Returns:
+            tuple: (at least true, at least false) as booleans.
+        """
+        results = {}
+        stack = [node]
+        while stack:
+            current = stack[-1]
+            if id(current) in results:
+                stack.pop()
+                continue
+            if current.label == top or current.label == bot:
+                values = (current.label == top, current.label == bot)
+            elif current.is_atom:
+                true_var, false_var = self.atom_vars[current.label]
+                values = (model[true_var - 1] > 0, model[false_var - 1] > 0)
+            else:
+                pending = [child for child in current.children if id(child) not in results]
+                if pending:
+                    stack.extend(pending)
+                    continue
+                children = [results[id(child)] for child in current.children]
+                if current.label == "&&":
+                    values = (all(t for t, _ in children), any(f for _, f in children))
+                elif current.label == "||":
+                    values = (any(t for t, _ in children), all(f for _, f in children))
+                elif current.label == "=>":
+                    (lt, lf), (rt, rf) = children
+                    values = (lf or rt, lt and rf)
+                else:
+                    (lt, lf), (rt, rf) = children
+                    equivalent = ((lf or rt) and (rf or lt), (lt and rf) or (rt and lf))
+                    values = equivalent if current.label == "<=>" else equivalent[::-1]
+            results[id(current)] = values[::-1] if current.negation else values
+            stack.pop()
+        return results[id(node)]
+
+    def subset_measure(self, mask, lower=0, added=None):
+        """
+        Return the contension measure of the formulas selected by a boolean mask.
+
+        The bound is raised from a known lower bound until the solver finds a model, so a
+        subset obtained by adding one formula to a measured subset usually takes one call.
+        If the last model already satisfies the added formula, no call is needed at all.
+
+        Args:
+            mask (numpy.ndarray): True for the formulas of the subset.
+            lower (int, optional): A lower bound, e.g. the measure of a subset of the subset.
+            added (int, optional): The index of a formula added to the subset of the last call.
+
+        Returns:
+            int: The measure of the subset.
+        """
+        key = np.packbits(mask).tobytes()
+        value = self.subset_measures.get(key)
+        if value is not None:
+            # The last model is not known to satisfy this subset
+            self.model = None
+            return value
+        optimum = self.measure()
+        value = lower
+        if lower < optimum and not (added is not None and self.model is not None and self.both_count(self.model) <= lower
+                                    and self.truth_values(self.parsed[added], self.model)[0]):
+            self.model = None
+            assumptions = [self.selectors[i] for i in np.flatnonzero(mask)]
+            while value < optimum:
+                satisfiable, result = self.solve(assumptions, value)
+                if satisfiable:
+                    break
+                value += 1
+        self.subset_measures[key] = value
+        return value
+
+    def marginal_contributions(self, permutations):
+        """
+        Return the marginal contribution of every formula to the measure of its predecessors in permutations.
+
+        The measure never decreases along a permutation and never exceeds the measure of all
+        formulas, so once a prefix reaches it the remaining formulas contribute nothing.
+
+        Args:
+            permutations (numpy.ndarray): One permutation of the formula indices per row.
+
+        Returns:
+            numpy.ndarray: The contribution of formula j in permutation r at [r, j].
+        """
+        optimum = self.measure()
+        contributions = np.zeros(permutations.shape, dtype=np.int64)
+        for row, permutation in enumerate(permutations):
+            mask = np.zeros(len(self.formulas), dtype=bool)
+            previous = 0
+            self.model = None
+            for i in permutation:
+                if previous == optimum:
+                    break
+                mask[i] = True
+                value = self.subset_measure(mask, previous, i)
+                contributions[row, i] = value - previous
+                previous = value
+        return contributions
+
+    def delete(self):
+        """Free the SAT solver."""
+        self.solver.delete()
+
+
+def formulas_without_model(formulas):
+    """
+    Return the indices of the formulas without a three-valued model, see ContensionMeasure.without_model.
+    """
+    measure = ContensionMeasure(formulas)
+    try:
+        return measure.without_model()
+    finally:
+        measure.delete()
+
+def leave_one_out_inconsistency(formulas):
+    """
+    Calculate the inconsistency value of every formula like calculate_inconsistency, in process:
+    the contension measure of all formulas minus the measure without the formula.
+
+    A formula without a three-valued model (e.g. "-") would make the measure infinite; it gets
+    no value and the other formulas are measured without it.
+
+    Args:
+        formulas (list of str): The formulas, e.g. the elements of a dataset.
+
+    Returns:
+        list: The inconsistency value (int) of each formula, None for formulas without a three-valued model.
+    """
+    measure = ContensionMeasure(formulas)
+    try:
+        without_model = set(measure.without_model())
+        if not without_model:
+            optimum = measure.measure()
+            return [optimum - value for value in measure.leave_one_out()]
+    finally:
+        measure.delete()
+    values = iter(leave_one_out_inconsistency([formula for i, formula in enumerate(formulas) if i not in without_model]))
+    return [None if i in without_model else next(values) for i in range(len(formulas))]
+
+# The measure of the worker process, encoded once by init_shapley_worker
+shapley_measure = None
+
+def init_shapley_worker(formulas):
+    global shapley_measure
+    shapley_measure = ContensionMeasure(formulas)
+
+def sample_marginal_contributions(seed, count):
+    """
+    Pool worker: draw count random permutations and return their marginal contributions.
+    """
+    rng = np.random.default_rng(seed)
+    permutations = rng.permuted(np.tile(np.arange(len(shapley_measure.formulas)), (count, 1)), axis=1)
+    return shapley_measure.marginal_contributions(permutations)
+
+def shapley_inconsistency_values(formulas, tolerance=0.05, confidence=0.95, batch_size=32, min_permutations=64, max_permutations=10000, jobs=1, seed=None):
+    """
+    Estimate the Shapley value of every formula for the contension measure by permutation sampling.
+
+    The Shapley value of a formula is its marginal contribution to the measure of the formulas
+    before it, averaged over all orders of the formulas. Batches of random permutations are
+    evaluated (in parallel with jobs != 1) until the confidence interval of every estimate is
+    at most tolerance wide on each side, or max_permutations have been drawn. Formulas without a
+    three-valued model (e.g. "-") get no value, the others are measured without them.
+
+    Args:
+        formulas (list of str): The formulas, e.g. the elements of a dataset.
+        tolerance (float, optional): The half-width of the confidence intervals to reach.
+        confidence (float, optional): The confidence level of the intervals.
+        batch_size (int, optional): The number of permutations per batch and worker.
+        min_permutations (int, optional): The number of permutations drawn before stopping is considered.
+        max_permutations (int, optional): The number of permutations after which sampling stops.
+        jobs (int, optional): Number of worker processes, 1 = in process (default), None = number of CPUs.
+        seed (int, optional): Seed of the permutations.
+
+    Returns:
+        list: The estimated Shapley value (float) of each formula, None for formulas without a
+        three-valued model; they sum up to the measure of all other formulas.
+    """
+    if not formulas:
+        return []
+    without_model = set(formulas_without_model(formulas))
+    if without_model:
+        values = iter(shapley_inconsistency_values([formula for i, formula in enumerate(formulas) if i not in without_model],
+                                                   tolerance, confidence, batch_size, min_permutations, max_permutations, jobs, seed))
+        return [None if i in without_model else next(values) for i in range(len(formulas))]
+    rng = np.random.default_rng(seed)
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    totals = np.zeros(len(formulas))
+    squares = np.zeros(len(formulas))
+    count = 0
+    workers = jobs or os.cpu_count()
+    pool = Pool(workers, init_shapley_worker, (formulas,)) if workers > 1 else None
+    if pool is None:
+        init_shapley_worker(formulas)
+    try:
+        while count < max_permutations:
+            sizes = [min(batch_size, max_permutations - count - i * batch_size) for i in range(workers)]
+            tasks = [(int(task_seed), size) for task_seed, size in zip(rng.integers(2 ** 63, size=workers), sizes) if size > 0]
+            batches = pool.starmap(sample_marginal_contributions, tasks) if pool is not None else [sample_marginal_contributions(*task) for task in tasks]
+            for contributions in batches:
+                totals += contributions.sum(axis=0)
+                squares += np.square(contributions).sum(axis=0)
+                count += len(contributions)
+            means = totals / count
+            variances = np.maximum(squares / count - np.square(means), 0) * count / max(count - 1, 1)
+            half_widths = z * np.sqrt(variances / count)
+            if count >= min_permutations and half_widths.max() <= tolerance:
+                break
+    finally:
+        if pool is not None:
+            pool.terminate()
+        else:
+            shapley_measure.delete()
+    return (totals / count).tolist()
+
+def mi_shapley_values(formulas, muses):
+    """
+    Return the exact Shapley value of every formula for the MI inconsistency measure (the number of MUSes).
+
+    Every MUS M is an inconsistent subset only if all of its formulas are present, so in a random
+    order of the formulas it is completed by each of its |M| formulas with equal probability, and
+    the Shapley value of a formula is the sum of 1/|M| over the MUSes M containing it. This takes
+    time linear in the total size of the MUSes instead of evaluating all 2^n subsets.
+
+    Args:
+        formulas (list of str): The formulas, e.g. the elements of a dataset.
+        muses (list of frozenset): All minimal inconsistent subsets of the formulas.
+
+    Returns:
+        dict: Maps each formula to its Shapley value; the values sum up to the number of MUSes.
+    """
+    values = dict.fromkeys(formulas, 0.0)
+    for mus in muses:
+        for formula in mus:
+            values[formula] += 1 / len(mus)
+    return values
+
 def powerset(s):
     "Generate all combinations of the elements in set s."
     s = list(s)
@@ -69,35 +535,3 @@ def powerset_to_file(iterable, filename):
     with open(filename, 'w') as file:
         for subset in subsets:
             file.write(subset + '\n')
-
-def calculate_all_inconsistency_values(dataset, sat_solver_script='sat4im/src/sat4im.py'):
-    inconsistency_values = {}
-    all_subsets = list(powerset(dataset))  # Convert generator to list
-    powerset_length = 2 ** len(dataset)  # Calculate the total number of subsets
-    print(f"Total number of subsets (Powerset length): {powerset_length}")
-    print(f"Powersets: {all_subsets}")  # Print all subsets once
-    for subset in all_subsets:
-        #print(f"Subset: {subset}")
-        inconsistency_values[subset] = call_sat_solver(sat_solver_script, subset)
-    return inconsistency_values
-
-def compute_shapley_values(dataset, inconsistency_values):
-    shapley_values = {formula: 0 for formula in dataset}
-    total_elements = len(dataset)
-    
-    for formula in dataset:
-        for subset in powerset(dataset):
-            if formula in subset:
-                subset_without_formula = tuple(x for x in subset if x != formula)
-                marginal_contribution = (
-                    inconsistency_values[subset] -
-                    inconsistency_values.get(subset_without_formula, 0)
-                )
-                weight = (math.factorial(len(subset_without_formula)) * 
-                          math.factorial(total_elements - len(subset_without_formula) - 1) /
-                          math.factorial(total_elements))
-                shapley_values[formula] += weight * marginal_contribution
-    
-    for formula in dataset:
-        shapley_values[formula] /= total_elements
-    return shapley_values
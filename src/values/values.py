@@ -1,5 +1,5 @@
 import random
-from src.values.inconsistency import calculate_inconsistency
+from src.values.inconsistency import leave_one_out_inconsistency
 
 def assign_fixed_value(dataset, value):
     """
@@ -32,12 +32,16 @@ def assign_unique_random_values(dataset):
     print(f"Random values: {dataset.get_values()}")
 
 def assign_inconsistency_value(dataset):
-    output_file_path = "tmp/dataset.txt"
-    dataset.to_file(output_file_path)
-    values = calculate_inconsistency(output_file_path)
+    """
+    Assign each element the difference between the inconsistency measure of the dataset
+    and the measure of the dataset without the element.
+
+    Args:
+        dataset (DataSet): The dataset to modify.
+    """
+    values = leave_one_out_inconsistency(dataset.elements)
 
     for i, element in enumerate(dataset.elements):
         dataset.element_values[element] = values[i]
 
-    with open(output_file_path, "a") as file:
-        file.write(f"\nInconsistensy Measures: {dataset.get_values()}")
\ No newline at end of file
+    print(f"Inconsistency values: {dataset.get_values()}")
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The modules log to log/ when they are imported and write the solver input to tmp/, relative to the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.makedirs("log", exist_ok=True)
+os.makedirs("tmp", exist_ok=True)
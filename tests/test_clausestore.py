@@ -0,0 +1,18 @@
+from src.CNFconverter.clausestore import ClauseStore
+
+
+def test_to_dimacs():
+    store = ClauseStore([[1, -2], [-10, 3, 123], []])
+    assert store.to_dimacs() == b"1 -2 0\n-10 3 123 0\n0\n"
+    assert store.to_dimacs(units=[4, -5]) == b"1 -2 0\n-10 3 123 0\n0\n4 0\n-5 0\n"
+    assert ClauseStore().to_dimacs(units=[-7]) == b"-7 0\n"
+    assert ClauseStore().to_dimacs() == b""
+
+
+def test_behaves_like_a_list_of_clauses():
+    store = ClauseStore([[1, 2]])
+    store.append([-3])
+    store.extend(ClauseStore([[4], [5, -6]]))
+    assert list(store) == [[1, 2], [-3], [4], [5, -6]]
+    assert len(store) == 4 and store[-1] == [5, -6] and store.num_literals() == 6
+    assert store.offset_array().tolist() == [0, 2, 3, 4, 6]
@@ -0,0 +1,48 @@
+import pickle
+import numpy as np
+import pytest
+from pysat.formula import CNF
+from pysat.solvers import Minisat22
+from src.structs.compiledkb import ARRAYS, CompiledKnowledgeBase
+
+ELEMENTS = ["a", "a=>b", "!b||c", "!c", "d<=>!a"]
+
+
+def satisfiable(compiled, elements, alpha, path):
+    compiled.write_dimacs(elements, alpha, path)
+    with Minisat22(bootstrap_with=CNF(from_file=path).clauses) as solver:
+        return solver.solve()
+
+
+@pytest.mark.parametrize("encoding", ["tseitin", "pg"])
+def test_round_trip(tmp_path, encoding):
+    source = tmp_path / "kb.pl"
+    source.write_text("\n".join(ELEMENTS) + "\n")
+    CompiledKnowledgeBase.compile(str(source), str(tmp_path / "kb.kbc"), encoding, values={"a": (7, 2), "!c": (3, 0)})
+    compiled = CompiledKnowledgeBase(str(tmp_path / "kb.kbc"))
+    in_memory = CompiledKnowledgeBase.from_file(str(source), encoding)
+
+    assert compiled.elements == ELEMENTS
+    assert compiled.encoding == encoding and compiled.file_format == "pl"
+    assert compiled.atom_vars == in_memory.atom_vars
+    for name, _ in ARRAYS:
+        if name not in ("random_values", "inconsistency_values"):
+            assert np.array_equal(compiled.arrays[name], in_memory.arrays[name]), name
+    assert compiled.element_values(2) == {"a": 7, "a=>b": None, "!b||c": None, "!c": 3, "d<=>!a": None}
+    assert compiled.element_values(3)["!c"] == 0
+    assert sorted(compiled.atom_index.atoms_of("d<=>!a")) == ["a", "d"]
+
+    reopened = pickle.loads(pickle.dumps(compiled))
+    assert reopened.path == compiled.path and reopened.elements == ELEMENTS
+
+
+@pytest.mark.parametrize("encoding", ["tseitin", "pg"])
+def test_write_dimacs_selects_the_elements(tmp_path, encoding):
+    compiled = CompiledKnowledgeBase.from_elements(ELEMENTS, encoding)
+    path = str(tmp_path / "query.cnf")
+    assert not satisfiable(compiled, ["a", "a=>b", "!b||c", "!c"], None, path)
+    assert satisfiable(compiled, ["a", "a=>b", "!c"], None, path)
+    assert not satisfiable(compiled, ["a", "a=>b"], "b", path)
+    # Formulas that were not compiled are encoded on the fly
+    assert not satisfiable(compiled, ["a", "d<=>!a", "d||e"], "e", path)
+    assert satisfiable(compiled, ["a", "d<=>!a"], "e", path)
@@ -0,0 +1,42 @@
+import itertools
+import random
+import pytest
+from pysat.solvers import Minisat22
+from src.CNFconverter.clausestore import ClauseStore
+from src.CNFconverter.core import encode_formula, evaluate, parse_formula
+
+ATOMS = ["a", "b", "c"]
+
+
+def random_formula(rng, depth):
+    if depth == 0 or rng.random() < 0.3:
+        return ("!" if rng.random() < 0.4 else "") + rng.choice(ATOMS + ["+", "-"])
+    connective = rng.choice(["&&", "||", "=>", "<=>", "^^"])
+    formula = "(" + random_formula(rng, depth - 1) + connective + random_formula(rng, depth - 1) + ")"
+    return ("!" if rng.random() < 0.3 else "") + formula
+
+
+def satisfiable(formula, assignment, polarity):
+    atom_vars = {atom: i + 1 for i, atom in enumerate(ATOMS)}
+    clauses = ClauseStore()
+    lit = encode_formula(formula, atom_vars, itertools.count(len(ATOMS) + 1), clauses, polarity)
+    assumptions = [lit] + [atom_vars[atom] if value else -atom_vars[atom] for atom, value in assignment.items()]
+    with Minisat22(bootstrap_with=list(clauses)) as solver:
+        return solver.solve(assumptions=assumptions)
+
+
+@pytest.mark.parametrize("polarity", [False, True])
+def test_encodings_agree_with_evaluation(polarity):
+    # Under every assignment of the atoms the encoding is satisfiable iff the formula is true
+    rng = random.Random(33)
+    for _ in range(200):
+        formula = random_formula(rng, 4)
+        parsed = parse_formula(formula)
+        for values in itertools.product([False, True], repeat=len(ATOMS)):
+            assignment = dict(zip(ATOMS, values))
+            assert satisfiable(formula, assignment, polarity) == evaluate(parsed, assignment), formula
+
+
+@pytest.mark.parametrize("formula, expected", [("a&&!a", False), ("a<=>!a", False), ("(a=>b)&&a&&!b", False), ("a^^b", True), ("-||+", True)])
+def test_encodings_are_equisatisfiable(formula, expected):
+    assert satisfiable(formula, {}, False) == satisfiable(formula, {}, True) == expected
@@ -0,0 +1,47 @@
+import random
+from src.structs.dataset import DataSet
+from src.structs.fingerprint import SubsetCache, add_key, fingerprint, remove_key
+
+
+def test_fingerprint_of_multisets():
+    assert fingerprint([]) == (0, 0)
+    assert fingerprint(["a", "b", "c"]) == fingerprint(["c", "a", "b"])
+    # Keys are added, so a duplicate line does not cancel out
+    assert fingerprint(["a", "a"]) != fingerprint([])
+    assert fingerprint(["a", "a", "b"]) != fingerprint(["b"])
+    assert remove_key(add_key(fingerprint(["a"]), "b"), "a") == fingerprint(["b"])
+
+
+def test_dataset_keeps_its_fingerprint_up_to_date():
+    rng = random.Random(49)
+    dataset = DataSet(elements=["x0"])
+    dataset.get_fingerprint()
+    for _ in range(500):
+        element = "x" + str(rng.randrange(8))
+        operation = rng.randrange(4)
+        if operation == 0:
+            dataset.add_element(element)
+        elif operation == 1:
+            dataset.add_element_at_start(element)
+        elif operation == 2 and element in dataset.get_elements():
+            dataset.remove_element(element)
+        else:
+            dataset = dataset.clone()
+        assert dataset.get_fingerprint() == fingerprint(dataset.get_elements())
+
+
+def test_subset_cache():
+    cache = SubsetCache(max_size=2)
+    cache.store(DataSet(elements=["a", "b"]), True, "c")
+    assert cache.lookup(DataSet(elements=["b", "a"]), "c") == (True, True)
+    assert cache.lookup(DataSet(elements=["a", "b"]), "d") == (False, None)
+    assert cache.lookup(DataSet(elements=["a"]), "c") == (False, None)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    cache.store(DataSet(elements=["a"]), False, "c")
+    cache.store(DataSet(elements=["a"]), True, "c")
+    assert len(cache) == 2 and cache.lookup(DataSet(elements=["a", "b"]), "c") == (True, True)
+    # The oldest entry is dropped when a new key does not fit
+    cache.store(DataSet(elements=["b"]), False, "c")
+    assert len(cache) == 2 and cache.lookup(DataSet(elements=["a", "b"]), "c") == (False, None)
+    assert cache.lookup(DataSet(elements=["a"]), "c") == (True, True)
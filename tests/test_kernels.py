@@ -0,0 +1,71 @@
+import shutil
+from collections import Counter
+import pytest
+from src.kernels.expandshrink import ExpandShrink
+from src.kernels.shrinkexpand import ShrinkExpand
+from src.structs.compiledkb import CompiledKnowledgeBase
+from src.structs.dataset import DataSet
+
+pytestmark = pytest.mark.skipif(shutil.which("minisat") is None, reason="minisat is not on the PATH")
+
+# c follows from the chain a, a=>b, b=>c; d, e and f are unrelated
+CHAIN = ["d", "a", "e", "a=>b", "f", "b=>c"]
+CHAIN_KERNEL = {"a", "a=>b", "b=>c"}
+
+
+@pytest.mark.parametrize("binary_search", [False, True])
+def test_expand_shrink_finds_the_chain_kernel(binary_search):
+    kernel = ExpandShrink(binary_search=binary_search).find_kernel(DataSet(elements=list(CHAIN)), "c")
+    assert set(kernel.get_elements()) == CHAIN_KERNEL
+
+
+def test_galloping_expand_stops_at_the_shortest_entailing_prefix():
+    # The shortest prefix that entails c ends with b=>c, the galloping overshoot must not be kept
+    elements = ["a", "a=>b", "b=>c", "d", "e", "f", "g", "h", "c"]
+    kernel = ExpandShrink(binary_search=True).find_kernel(DataSet(elements=elements), "c")
+    assert set(kernel.get_elements()) == CHAIN_KERNEL
+
+
+def test_galloping_expand_without_kernel():
+    strategy = ExpandShrink(binary_search=True)
+    assert strategy.find_kernel(DataSet(elements=["a", "b=>c"]), "c") is None
+    assert strategy.galloping_expand(DataSet(elements=["a", "b=>c"]), "c", checked=False) is None
+
+
+@pytest.mark.parametrize("binary_search", [False, True])
+def test_shrink_expand_finds_the_same_remainder(binary_search):
+    # Removing d and then a stops the entailment, expand puts d back
+    remainder = ShrinkExpand(binary_search=binary_search).find_remainder(DataSet(elements=list(CHAIN)), "c")
+    assert remainder.get_elements() == ["d", "e", "a=>b", "f", "b=>c"]
+
+
+def test_bisection_shrink_cut_behind_the_last_element():
+    strategy = ShrinkExpand(binary_search=True)
+    assert set(strategy.find_kernel(DataSet(elements=["d", "c"]), "c").get_elements()) == {"c"}
+    assert strategy.bisection_shrink(DataSet(elements=["d"]), "a||!a") is None
+
+
+def test_model_rotation_proves_the_whole_chain_necessary():
+    strategy = ExpandShrink(model_rotation=True)
+    elements = ["a", "a=>b", "b=>c"]
+    formulas, negated_alpha, occurrences = strategy.parse_for_rotation(elements, "c")
+    # The counter model of the chain without a
+    model = {"a": False, "b": False, "c": False}
+    necessary = strategy.rotate_model(model, formulas, negated_alpha, occurrences, Counter(elements), "a")
+    assert necessary == set(elements)
+    # A line that is in the dataset twice is not necessary
+    remaining = Counter(elements + ["a=>b"])
+    assert strategy.rotate_model(dict(model), formulas, negated_alpha, occurrences, remaining, "a") == {"a"}
+
+
+@pytest.mark.parametrize("elements, alpha, expected", [
+    (CHAIN, "c", CHAIN_KERNEL),
+    (["a", "a", "a=>b", "b=>c", "c=>d"], "d", {"a", "a=>b", "b=>c", "c=>d"}),
+    (["a", "!b", "a=>b", "c"], "-", {"a", "!b", "a=>b"}),
+])
+def test_model_rotation_keeps_the_kernel(elements, alpha, expected):
+    compiled = CompiledKnowledgeBase.from_elements(list(elements))
+    for strategy in (ExpandShrink(model_rotation=True), ExpandShrink(model_rotation=True, compiled=compiled)):
+        kernel = strategy.find_kernel(DataSet(elements=list(elements)), alpha)
+        assert set(kernel.get_elements()) == expected
+        assert len(kernel.get_elements()) == len(expected)
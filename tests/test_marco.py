@@ -0,0 +1,37 @@
+import shutil
+import pytest
+from src.kernels.expandshrink import ExpandShrink
+from src.search.marco import Marco
+from src.structs.dataset import DataSet
+
+pytestmark = pytest.mark.skipif(shutil.which("minisat") is None, reason="minisat is not on the PATH")
+
+
+def enumerate_all(elements, alpha):
+    marco = Marco(ExpandShrink(), DataSet(elements=elements), alpha)
+    found = list(marco.enumerate())
+    kernels = {frozenset(subset) for kind, subset in found if kind == "kernel"}
+    remainders = {frozenset(subset) for kind, subset in found if kind == "remainder"}
+    # Every subset is reported exactly once
+    assert len(kernels) + len(remainders) == len(found)
+    return kernels, remainders
+
+
+def test_all_kernels_and_remainders():
+    kernels, remainders = enumerate_all(["a", "b", "a=>c", "b=>c", "d"], "c")
+    assert kernels == {frozenset({"a", "a=>c"}), frozenset({"b", "b=>c"})}
+    assert remainders == {
+        frozenset({"a=>c", "b=>c", "d"}), frozenset({"a=>c", "b", "d"}),
+        frozenset({"a", "b=>c", "d"}), frozenset({"a", "b", "d"}),
+    }
+
+
+def test_minimal_inconsistent_and_maximal_consistent_subsets():
+    kernels, remainders = enumerate_all(["a", "!a", "a||b", "!b"], "-")
+    assert kernels == {frozenset({"a", "!a"}), frozenset({"!a", "a||b", "!b"})}
+    assert remainders == {frozenset({"a", "a||b", "!b"}), frozenset({"!a", "a||b"}), frozenset({"!a", "!b"})}
+
+
+def test_dataset_without_kernel():
+    kernels, remainders = enumerate_all(["a", "b"], "c")
+    assert kernels == set() and remainders == {frozenset({"a", "b"})}